@@ -0,0 +1,298 @@
+"""End-to-end benchmarks of the hot paths of wimsapi, run against a local wimsapi.fake server.
+
+Each benchmark is run a number of times, and reported as operations per second, HTTP requests
+per second, p50 / p99 latency of an operation and peak memory allocated during an operation
+(measured by tracemalloc, in a separate run):
+
+    post             post() building and encoding the payload of an adduser request
+    parse_json       parse_response() on the JSON sent by getsheetscores
+    parse_text       parse_response() on a response in the WIMS format
+    class_get        Class.get()
+    user_list        User.list()
+    sheet_scores     Sheet.scores()
+    exam_scores      Exam.scores()
+
+The class of the fake server contains --users users (defaults to 1000), each having scores on a
+sheet of 10 exercises and on an exam.
+
+Reports can be written as JSON with --output, and compared to a previous report with --compare:
+benchmarks whose p50 got slower by more than --threshold percent are reported as regressions,
+and the script then exits with the status 1:
+
+    python benchmarks/bench_client.py --output baseline.json
+    # ... change the code ...
+    python benchmarks/bench_client.py --compare baseline.json
+
+Usage: python benchmarks/bench_client.py [--users N] [--repeat N] [--only NAME [NAME ...]]
+                                         [--in-process] [--latency MS] [--output PATH]
+                                         [--compare PATH] [--threshold PERCENT]"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import requests
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import wimsapi  # noqa: E402
+import wimsapi.api  # noqa: E402
+from wimsapi import Class, Exam, Sheet, User, WimsAPI  # noqa: E402
+from wimsapi.api import BufferedResponse, parse_response  # noqa: E402
+from wimsapi.fake import FakeWims, FakeWimsServer  # noqa: E402
+from wimsapi.transport import post  # noqa: E402
+
+
+IDENT = "myself"
+PASSWD = "toto"
+QCLASS = "9001"
+RCLASS = "myclass"
+EXERCISES = 10
+
+
+
+class NullSession:
+    """Session preparing the requests given to post() without sending them."""
+    
+    
+    def post(self, url, **kwargs):
+        return requests.Request("POST", url, data=kwargs["data"],
+                                headers=kwargs["headers"]).prepare()
+
+
+
+def populate(fake, users):
+    """Create the class benchmarked in fake, and return an instance of WimsAPI sending its
+    requests to fake."""
+    fake.add_class(RCLASS, {'description': "Benchmark", 'institution': "WimsAPI",
+                            'email': "bench@wimsapi.org", 'password': "password"},
+                   {'lastname': "Doe", 'firstname': "John", 'password': "password"},
+                   qclass=QCLASS)
+    api = WimsAPI("http://fake/wims.cgi", IDENT, PASSWD, transport=fake)
+    qsheet = fake.add_sheet(QCLASS, {'status': '1'})
+    for _ in range(EXERCISES):
+        api.putexo(QCLASS, RCLASS, qsheet, "H3/analysis/oeflinf.fr", {'points': 10, 'weight': 1})
+    qexam = fake.add_exam(QCLASS, {'status': '1'})
+    
+    for i in range(users):
+        quser = fake.add_user(QCLASS, "user%d" % i, {
+            'lastname': "Last%d" % i, 'firstname': "First%d" % i, 'password': "password",
+            'email': "user%d@wimsapi.org" % i, 'regnum': str(i),
+        })
+        fake.set_sheet_score(QCLASS, qsheet, quser, user_quality=i % 10, user_percent=i % 100,
+                             user_best=i % 100, user_level=i % 10,
+                             got_detail=[(i + j) % 10 for j in range(EXERCISES)],
+                             mean_detail=[(i * j) % 10 for j in range(EXERCISES)],
+                             best_detail=[(i - j) % 100 for j in range(EXERCISES)],
+                             level_detail=[j % 10 for j in range(EXERCISES)],
+                             last_detail=[i % 10 for j in range(EXERCISES)],
+                             try_detail=[j for j in range(EXERCISES)])
+        fake.set_exam_score(QCLASS, qexam, quser, (i % 100) / 10, 1 + i % 3)
+    return api, qsheet, qexam
+
+
+
+def benchmarks(fake, url, kwargs, users):
+    """Return an OrderedDict mapping the name of each benchmark to a function executing one
+    operation."""
+    api, qsheet, qexam = populate(fake, users)
+    
+    user_payload = User("jdoe", "Doe", "John", "password", "jdoe@wimsapi.org")._to_payload()
+    session = NullSession()
+    
+    def post_payload():
+        params = dict(api.params, job="adduser", code="BENCHMARK0", qclass=QCLASS,
+                      rclass=RCLASS, quser="jdoe",
+                      data1='\n'.join(str(k) + "=" + str(v) for k, v in user_payload.items()))
+        return post(url, session=session, data=params)
+    
+    status, headers, json_body = fake.respond(dict(api.params, job="getsheetscores",
+                                                   code="BENCHMARK0", qclass=QCLASS,
+                                                   rclass=RCLASS, qsheet=qsheet))
+    text_body = ("OK BENCHMARK0\n" + "\n".join(
+        "user%d:%d:%d" % (i, i % 10, i % 7) for i in range(users * 10)
+    ) + "\n").encode()
+    
+    wclass = Class.get(url, IDENT, PASSWD, QCLASS, RCLASS, **kwargs)
+    sheet = Sheet.get(wclass, qsheet)
+    exam = Exam.get(wclass, qexam)
+    
+    return OrderedDict([
+        ('post',         post_payload),
+        ('parse_json',   lambda: parse_response(BufferedResponse(status, headers, json_body))),
+        ('parse_text',   lambda: parse_response(BufferedResponse(200, {}, text_body))),
+        ('class_get',    lambda: Class.get(url, IDENT, PASSWD, QCLASS, RCLASS, **kwargs)),
+        ('user_list',    lambda: User.list(wclass)),
+        ('sheet_scores', lambda: sheet.scores()),
+        ('exam_scores',  lambda: exam.scores()),
+    ])
+
+
+
+def percentile(values, p):
+    """Return the p-th percentile (nearest rank) of values."""
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100 * len(values))) - 1)]
+
+
+
+def measure(fake, operation, repeat, min_time):
+    """Run operation at least repeat times and for at least min_time seconds, then once more
+    under tracemalloc. Return a dictionary of metrics."""
+    operation()  # Warm up
+    
+    latencies = []
+    sent = sum(fake.jobs.values())
+    start = time.perf_counter()
+    while len(latencies) < repeat or time.perf_counter() - start < min_time:
+        t = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    sent = sum(fake.jobs.values()) - sent
+    
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        operation()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    
+    return OrderedDict([
+        ('ops',              len(latencies)),
+        ('ops_per_s',        round(len(latencies) / elapsed, 2)),
+        ('requests_per_op',  round(sent / len(latencies), 2)),
+        ('requests_per_s',   round(sent / elapsed, 2)),
+        ('p50_ms',           round(percentile(latencies, 50) * 1000, 4)),
+        ('p99_ms',           round(percentile(latencies, 99) * 1000, 4)),
+        ('mean_ms',          round(sum(latencies) / len(latencies) * 1000, 4)),
+        ('peak_kib',         round(peak / 1024, 1)),
+    ])
+
+
+
+def metadata():
+    """Return the environment the benchmarks were run in."""
+    try:
+        revision = subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    json_loads = wimsapi.api.json_loads
+    return OrderedDict([
+        ('wimsapi',   wimsapi.__version__),
+        ('revision',  revision),
+        ('python',    platform.python_version()),
+        ('platform',  platform.platform()),
+        ('json',      "%s.%s" % (json_loads.__module__, json_loads.__name__)),
+        ('date',      time.strftime("%Y-%m-%dT%H:%M:%S")),
+    ])
+
+
+
+def compare(report, baseline, threshold):
+    """Print the difference between report and baseline, returns the names of the benchmarks
+    whose p50 is more than threshold percent slower than in baseline."""
+    if report['params'] != baseline['params']:
+        print("\nWarning: parameters differ from the baseline (%s)" % baseline['params'])
+    print("\nCompared to %s (%s):" % (baseline['meta'].get('revision'),
+                                      baseline['meta'].get('wimsapi')))
+    print("%-14s %12s %12s %9s %12s %12s" % ("benchmark", "p50 before", "p50 after", "delta",
+                                             "kib before", "kib after"))
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        delta = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        flag = ""
+        if delta > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-14s %12.3f %12.3f %+8.1f%% %12.1f %12.1f%s" % (
+            name, before['p50_ms'], result['p50_ms'], delta, before['peak_kib'],
+            result['peak_kib'], flag
+        ))
+    return regressions
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000, help="users in the benchmarked class")
+    parser.add_argument("--repeat", type=int, default=5, help="minimum operations per benchmark")
+    parser.add_argument("--min-time", type=float, default=1, help="minimum seconds per benchmark")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run")
+    parser.add_argument("--in-process", action="store_true",
+                        help="use the fake server as a transport instead of serving it over HTTP")
+    parser.add_argument("--latency", type=float, default=0, help="latency of the fake server (ms)")
+    parser.add_argument("--output", help="path of the JSON report to write")
+    parser.add_argument("--compare", help="path of a JSON report to compare to")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="p50 slowdown (in percent) reported as a regression")
+    args = parser.parse_args()
+    
+    fake = FakeWims(IDENT, PASSWD, latency=args.latency / 1000, seed=0)
+    server = None
+    if args.in_process:
+        url, kwargs = "http://fake/wims.cgi", {'transport': fake}
+    else:
+        server = FakeWimsServer(fake).start()
+        url, kwargs = server.url, {}
+    
+    try:
+        operations = benchmarks(fake, url, kwargs, args.users)
+        unknown = set(args.only or []) - set(operations)
+        if unknown:
+            parser.error("unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+        
+        report = OrderedDict([
+            ('meta',    metadata()),
+            ('params',  OrderedDict([('users', args.users), ('in_process', args.in_process),
+                                     ('latency_ms', args.latency)])),
+            ('results', OrderedDict()),
+        ])
+        print("wimsapi %s (%s), python %s, %s" % (
+            report['meta']['wimsapi'], report['meta']['revision'], report['meta']['python'],
+            report['meta']['json']
+        ))
+        print("%-14s %8s %10s %10s %10s %10s %10s" % ("benchmark", "ops", "ops/s", "req/s",
+                                                     "p50 (ms)", "p99 (ms)", "peak (kib)"))
+        for name, operation in operations.items():
+            if args.only and name not in args.only:
+                continue
+            result = measure(fake, operation, args.repeat, args.min_time)
+            report['results'][name] = result
+            print("%-14s %8d %10.1f %10.1f %10.3f %10.3f %10.1f" % (
+                name, result['ops'], result['ops_per_s'], result['requests_per_s'],
+                result['p50_ms'], result['p99_ms'], result['peak_kib']
+            ))
+    finally:
+        if server is not None:
+            server.stop()
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f, object_pairs_hook=OrderedDict)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Micro-benchmarks of wimsapi.api.parse_response().
+
+Compare the current parser to the one of wimsapi 0.5 (trying request.json() first, then falling
+back to the WIMS format) on large getsheetscores / getlog payloads, in both output formats.
+
+Usage: python benchmarks/bench_parse.py [--number N]"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import requests
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import wimsapi.api  # noqa: E402
+from wimsapi.api import parse_response  # noqa: E402
+
+
+
+def legacy_parse_response(request, verbose=False, return_request=False):
+    """parse_response() of wimsapi 0.5."""
+    try:
+        response = request.json()
+    except json.JSONDecodeError:
+        status, message = request.text.split('\n', maxsplit=1)
+        code = "N/A"
+        if ' ' in status:
+            status, code = status.split(' ', maxsplit=1)
+        response = {
+            'status':  status,
+            'message': message if '\n' not in message else message[:-1],
+            'code':    code,
+        }
+    if response['status'] not in ["ERROR", "OK"]:
+        return request
+    return response
+
+
+
+def response(content):
+    """Build a requests.Response sent by WIMS containing content."""
+    request = requests.Response()
+    request.status_code = 200
+    request._content = content
+    request.headers["Content-Type"] = "text/plain"
+    request.encoding = requests.utils.get_encoding_from_headers(request.headers)
+    return request
+
+
+
+def getsheetscores(users=2000, exercises=20):
+    return json.dumps({
+        "status":      "OK",
+        "code":        "BENCHMARK0",
+        "job":         "getsheetscores",
+        "query_class": "9001",
+        "query_sheet": "1",
+        "data_scores": [
+            {
+                "id":           "user%d" % i,
+                "got_detail":   [(i * j) % 11 for j in range(exercises)],
+                "mean_detail":  [((i + j) % 10) + 0.5 for j in range(exercises)],
+                "level_detail": [(i - j) % 10 for j in range(exercises)],
+                "user_percent": (i % 100) / 1.0,
+                "user_quality": (i % 10) / 1.0,
+            } for i in range(users)
+        ],
+    }).encode()
+
+
+
+def getlog(lines=20000):
+    return json.dumps({
+        "status":      "OK",
+        "code":        "BENCHMARK0",
+        "job":         "getlog",
+        "query_class": "9001",
+        "query_user":  "jdoe",
+        "data_log":    [
+            "20190101.12:%02d:%02d %d score 1 10 ip 127.0.0.1" % (i // 60 % 60, i % 60, i)
+            for i in range(lines)
+        ],
+    }).encode()
+
+
+
+def wims_format(lines=20000):
+    body = "\n".join("jdoe%d:%d:%d" % (i, i % 10, i % 7) for i in range(lines))
+    return ("OK BENCHMARK0\n" + body + "\n").encode()
+
+
+
+def getclasstgz(size=2000000):
+    return b"\x1f\x8b\x08\x00\n" + bytes(range(256)) * (size // 256)
+
+
+
+PAYLOADS = {
+    "getsheetscores (json)": getsheetscores,
+    "getlog (json)":         getlog,
+    "wims format":           wims_format,
+    "getclasstgz (file)":    getclasstgz,
+}
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=20, help="iterations per measure")
+    parser.add_argument("--stdlib", action="store_true", help="use the json module of the "
+                                                             "standard library")
+    args = parser.parse_args()
+    if args.stdlib:
+        wimsapi.api.json_loads = json.loads
+    
+    json_loads = wimsapi.api.json_loads
+    print("JSON backend: %s.%s" % (json_loads.__module__, json_loads.__name__))
+    print("%-24s %10s %12s %12s %8s" % ("payload", "size (kB)", "legacy (ms)", "current (ms)",
+                                        "speedup"))
+    for name, build in PAYLOADS.items():
+        content = build()
+        expected = legacy_parse_response(response(content), return_request=True)
+        result = parse_response(response(content), return_request=True)
+        assert expected == result or not isinstance(result, dict)
+        legacy = min(timeit.repeat(
+            lambda: legacy_parse_response(response(content), return_request=True),
+            repeat=3, number=args.number
+        )) / args.number
+        current = min(timeit.repeat(
+            lambda: parse_response(response(content), return_request=True),
+            repeat=3, number=args.number
+        )) / args.number
+        print("%-24s %10d %12.2f %12.2f %7.1fx" % (name, len(content) / 1000, legacy * 1000,
+                                                  current * 1000, legacy / current))
+
+
+
+if __name__ == "__main__":
+    main()
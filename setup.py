@@ -41,5 +41,6 @@ setup(
     url='https://github.com/qcoumes/wimsapi',
     packages=['wimsapi'],
     install_requires=['requests'],
+    extras_require={'aio': ['aiohttp'], 'fast': ['orjson']},
     classifiers=CLASSIFIERS
 )
@@ -0,0 +1,29 @@
+import unittest
+
+from wimsapi.api import WimsAPI
+from wimsapi.fake import FakeWims
+from wimsapi.wclass import Class
+
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class FakeWimsFixture(unittest.TestCase):
+    """Base class of the test cases running against a FakeWims.
+    
+    The fake server holds the class 9001 of the 'myclass' structure, supervised by John Doe.
+    'self.fake' is the FakeWims and 'self.api' a WimsAPI using it as its transport."""
+    
+    
+    def setUp(self):
+        self.fake = FakeWims("myself", "toto", seed=0)
+        self.api = WimsAPI(URL, "myself", "toto", transport=self.fake)
+        self.fake.add_class("myclass", {'description': "A class", 'password': "pass"},
+                            {'lastname': "Doe", 'firstname': "John", 'password': "pass"},
+                            qclass=9001)
+    
+    
+    def get_class(self):
+        """Return the class 9001 of the fake server."""
+        return Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import os
+import unittest
+from unittest import mock
+
+from wimsapi.api import WimsAPI
+from wimsapi.exceptions import InvalidResponseError
+from wimsapi.fake import FakeWims, FakeWimsServer
+from wimsapi.stream import AsyncCsvRows, AsyncFileStream, FormBody
+
+
+try:
+    from wimsapi.aio import AsyncWimsAPI, aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+WIMS_URL = os.getenv("WIMS_URL") or "http://localhost:7777/wims/wims.cgi/"
+
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncWimsAPITestCase(unittest.TestCase):
+
+    def test_init_and_properties(self):
+        api = AsyncWimsAPI(WIMS_URL, "myself", "toto")
+        self.assertEqual(api.url, WIMS_URL)
+        self.assertEqual(api.ident, "myself")
+        self.assertEqual(api.passwd, "toto")
+        
+        with self.assertRaises(TypeError):
+            with api:
+                pass  # pragma: no cover
+    
+    
+    def test_same_response(self):
+        async def get():
+            async with AsyncWimsAPI(WIMS_URL, "myself", "toto") as api:
+                return await api.getuser(9001, "myclass", "supervisor")
+        
+        status, response = WimsAPI(WIMS_URL, "myself", "toto").getuser(9001, "myclass",
+                                                                         "supervisor")
+        async_status, async_response = run(get())
+        del response["code"], async_response["code"]
+        self.assertEqual(status, async_status)
+        self.assertEqual(response, async_response)
+    
+    
+    def test_concurrent(self):
+        async def check():
+            async with AsyncWimsAPI(WIMS_URL, "myself", "toto") as api:
+                return await asyncio.gather(*[api.checkident() for _ in range(20)])
+        
+        for status, response in run(check()):
+            self.assertTrue(status)
+            self.assertEqual(response['message'], "Connection accepted")
+    
+    
+    def test_file(self):
+        async def get():
+            async with AsyncWimsAPI(WIMS_URL, "myself", "toto") as api:
+                return await api.getexofile(9001, "myclass", 1)
+        
+        status, response = run(get())
+        self.assertTrue(status)
+        self.assertEqual(response, WimsAPI(WIMS_URL, "myself", "toto").getexofile(
+            9001, "myclass", 1)[1])
+
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class FakeAsyncWimsAPITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeWims("myself", "toto", seed=0)
+        self.fake.add_class("myclass", qclass=9001)
+        self.server = FakeWimsServer(self.fake).start()
+        self.addCleanup(self.server.stop)
+    
+    
+    def test_stream(self):
+        async def get():
+            async with AsyncWimsAPI(self.server.url, "myself", "toto") as api:
+                status, stream = await api.getclasstgz_stream(9001, "myclass", chunk_size=64,
+                                                              checksum="sha256")
+                self.assertTrue(status)
+                self.assertIsInstance(stream, AsyncFileStream)
+                content = io.BytesIO()
+                await stream.save(content)
+                
+                self.fake.fail_next("html", job="getclasstgz")
+                with self.assertRaises(InvalidResponseError):
+                    await api.getclasstgz_stream(9001, "myclass")
+                
+                status, response = await api.getclasstgz_stream(9999, "myclass")
+                return stream, content.getvalue(), status, response
+        
+        stream, content, status, response = run(get())
+        self.assertTrue(stream.closed)
+        self.assertEqual(stream.size, len(content))
+        self.assertEqual(content, WimsAPI(self.server.url, "myself", "toto").getclasstgz(
+            9001, "myclass")[1])
+        self.assertFalse(status)
+        self.assertEqual(response['status'], "ERROR")
+    
+    
+    def test_putcsv(self):
+        async def put():
+            async with AsyncWimsAPI(self.server.url, "myself", "toto") as api:
+                return await api.putcsv(9001, "myclass", [
+                    ["login", "lastname", "firstname", "password"],
+                    ["Login", "Last name", "First name", "Password"],
+                    ["jdoe", "Doe", "Jane", "pass"],
+                ])
+        
+        with mock.patch.object(FormBody, "close", autospec=True,
+                               side_effect=FormBody.close) as close:
+            status, response = run(put())
+        self.assertTrue(status)
+        close.assert_called_once()
+        self.assertTrue(close.call_args[0][0].file.closed)
+        self.assertEqual(self.fake.jobs['putcsv'], 1)
+        self.assertEqual(WimsAPI(self.server.url, "myself", "toto").getuser(
+            9001, "myclass", "jdoe")[1]['firstname'], "Jane")
+    
+    
+    def test_getcsv_rows(self):
+        self.fake.add_user(9001, "jdoe", {'lastname': "Doe", 'firstname': "Jane"})
+        self.fake.add_user(9001, "jsmith", {'lastname': "Smith", 'firstname': "John"})
+        
+        async def get():
+            async with AsyncWimsAPI(self.server.url, "myself", "toto") as api:
+                status, rows = await api.getcsv_rows(9001, "myclass", ["login", "lastname"],
+                                                     chunk_size=8)
+                self.assertTrue(status)
+                self.assertIsInstance(rows, AsyncCsvRows)
+                result = []
+                async for row in rows:
+                    result.append(row)
+                return result, await api.getcsv_rows(9999, "myclass", ["login"])
+        
+        rows, (status, response) = run(get())
+        self.assertEqual(rows, list(WimsAPI(self.server.url, "myself", "toto").getcsv_rows(
+            9001, "myclass", ["login", "lastname"])[1]))
+        self.assertEqual([row['login'] for row in rows], ["jdoe", "jsmith"])
+        self.assertFalse(status)
+        self.assertEqual(response['status'], "ERROR")
+        with self.assertRaises(ValueError):
+            run(AsyncWimsAPI(self.server.url, "myself", "toto").getcsv_rows(
+                9001, "myclass", ["login"], frmt="xls"))
+    
+    
+    def test_stream_slot(self):
+        async def get():
+            async with AsyncWimsAPI(self.server.url, "myself", "toto",
+                                    rate_limits={'download': {'concurrency': 1}}) as api:
+                limit = api.rate_limiter.limits['download']
+                _, stream = await api.getclasstgz_stream(9001, "myclass")
+                in_flight = limit.in_flight
+                async with stream:
+                    pass
+                return in_flight, limit.in_flight
+        
+        self.assertEqual(run(get()), (1, 0))
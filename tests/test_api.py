@@ -1,3 +1,4 @@
+import hashlib
 import os
 import unittest
 from io import BytesIO
@@ -33,6 +34,45 @@ class WimsAPITestCase(unittest.TestCase):
         self.assertEqual(api.passwd, "toto")
     
     
+    def test_session(self):
+        with WimsAPI(WIMS_URL, "myself", "toto", pool_maxsize=2) as api:
+            session = api.session
+            self.assertTrue(api.checkident()[0])
+            self.assertTrue(api.checkident()[0])
+            self.assertIs(session, api.session)
+        self.assertIsNone(api.transport._session)
+        
+        api = WimsAPI(WIMS_URL, "myself", "toto", session_lifetime=0)
+        session = api.session
+        self.assertTrue(api.checkident()[0])
+        self.assertIsNot(session, api.session)
+        api.close()
+    
+    
+    def test_batch(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        results = api.batch([
+            ("checkident", {}),
+            ("getuser", {"qclass": 9001, "rclass": "myclass", "quser": "supervisor"}),
+            ("getuser", {"qclass": 9001}),
+        ])
+        self.assertTrue(results[0][0])
+        self.assertEqual(results[1][1]['firstname'], 'Sophie')
+        self.assertIsInstance(results[2], TypeError)
+        
+        self.assertEqual(api.batch([]), [])
+        with self.assertRaises(ValueError):
+            api.batch([("unknown", {})])
+    
+    
+    def test_map(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        results = api.map("checkident", [{}] * 20, max_workers=4)
+        self.assertEqual(len(results), 20)
+        for status, response in results:
+            self.assertTrue(status)
+    
+    
     def test_0_addclass_id(self):
         api = WimsAPI(WIMS_URL, "myself", "toto")
         status, response = api.addclass(
@@ -316,6 +356,33 @@ class WimsAPITestCase(unittest.TestCase):
             self.fail("Response was not a valid tgz :\n" + str(e))
     
     
+    def test_getclasstgz_stream(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        progress = []
+        status, stream = api.getclasstgz_stream(999999, "myclass", chunk_size=1024,
+                                                progress=lambda s, t: progress.append(s),
+                                                checksum="md5")
+        self.assertTrue(status)
+        content = BytesIO()
+        stream.save(content)
+        self.assertTrue(stream.closed)
+        self.assertEqual(stream.size, len(content.getvalue()))
+        self.assertEqual(progress[-1], stream.size)
+        self.assertEqual(stream.hexdigest(), hashlib.md5(content.getvalue()).hexdigest())
+        
+        try:
+            TarFile.open(fileobj=BytesIO(content.getvalue()), mode="r:gz")
+        except TarError as e:
+            self.fail("Response was not a valid tgz :\n" + str(e))
+    
+    
+    def test_getclassfile_stream_error(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        status, response = api.getclassfile_stream(999999, "myclass", 'unknown')
+        self.assertFalse(status)
+        self.assertIn('message', response)
+    
+    
     def test_getcsv(self):
         api = WimsAPI(WIMS_URL, "myself", "toto")
         status, response = api.getcsv(9001, "myclass", ["login", "password", "name", "email"])
@@ -323,6 +390,28 @@ class WimsAPITestCase(unittest.TestCase):
         self.assertEqual(type(response), bytes)
     
     
+    def test_getcsv_stream(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        status, stream = api.getcsv_stream(9001, "myclass", ["login", "password", "name", "email"])
+        self.assertTrue(status)
+        self.assertEqual(b"".join(stream),
+                         api.getcsv(9001, "myclass", ["login", "password", "name", "email"])[1])
+    
+    
+    def test_getcsv_rows(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        status, rows = api.getcsv_rows(9001, "myclass", ["login", "name", "average0"])
+        self.assertTrue(status)
+        with rows:
+            rows = list(rows)
+        self.assertTrue(rows)
+        self.assertEqual(set(rows[0]), {"login", "name", "average0"})
+        self.assertTrue(rows[0]["average0"] is None or isinstance(rows[0]["average0"], float))
+        
+        with self.assertRaises(ValueError):
+            api.getcsv_rows(9001, "myclass", ["login"], frmt="xls")
+    
+    
     def test_getexam(self):
         api = WimsAPI(WIMS_URL, "myself", "toto")
         status, response = api.getexam(999999, "myclass", 1)
@@ -370,6 +459,15 @@ class WimsAPITestCase(unittest.TestCase):
                          b'tre (en m)}{\\per}{type=numeric}\n')
     
     
+    def test_getexofile_stream(self):
+        api = WimsAPI(WIMS_URL, "myself", "toto")
+        status, stream = api.getexofile_stream(9001, "myclass", 1)
+        self.assertTrue(status)
+        with stream:
+            self.assertTrue(next(iter(stream)).startswith(b'\\title{Un pr\xe9}'))
+        self.assertTrue(stream.closed)
+    
+    
     def test_getinfoserver(self):
         api = WimsAPI(WIMS_URL, "myself", "toto")
         status, response = api.getinfoserver()
@@ -0,0 +1,242 @@
+import io
+import tarfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from wimsapi.api import WimsAPI
+from wimsapi.exam import Exam
+from wimsapi.exceptions import InvalidResponseError
+from wimsapi.fake import FakeWims, FakeWimsServer
+from wimsapi.retry import RetryPolicy
+from wimsapi.sheet import Sheet
+from wimsapi.stream import FormBody
+from wimsapi.user import User
+
+from tests.fixtures import FakeWimsFixture
+
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class FakeWimsTestCase(FakeWimsFixture):
+    
+    
+    def test_identification(self):
+        self.assertEqual(self.api.checkident()[1]['message'], "Connection accepted")
+        status, response = WimsAPI(URL, "myself", "wrong", transport=self.fake).checkident()
+        self.assertFalse(status)
+        self.assertEqual(response['message'], "bad identification")
+    
+    
+    def test_class(self):
+        status, response = self.api.addclass("myclass", {'description': "B"}, {}, 999999)
+        self.assertEqual(response['message'], "class 999999 correctly added")
+        self.assertEqual(response['class_id'], "999999")
+        self.assertFalse(self.api.addclass("myclass", {}, {}, 999999)[0])
+        
+        self.assertEqual(self.api.checkclass(999999, "myclass")[1]['message'], "Class exists")
+        self.assertEqual(self.api.checkclass(999999, "other")[1]['message'],
+                         "connection refused by requested class (999999)")
+        self.assertEqual(self.api.checkclass(1, "myclass")[1]['message'],
+                         "class 1 not existing")
+        
+        self.api.modclass(999999, "myclass", {'institution': "Inst"})
+        response = self.api.getclass(999999, "myclass")[1]
+        self.assertEqual(response['institution'], "Inst")
+        self.assertEqual(response['rclass'], "myclass")
+        response = self.api.getclass(999999, "myclass", ["password", "unknown"])[1]
+        self.assertEqual(set(response), {'status', 'code', 'job', 'query_class', 'password'})
+        
+        self.assertEqual(self.api.listclasses("myclass")[1]['classes_list'],
+                         [{'qclass': '9001'}, {'qclass': '999999'}])
+        self.assertEqual(self.api.delclass(999999, "myclass")[1]['message'],
+                         "class 999999 correctly deleted")
+        self.assertEqual(self.api.listclasses("other")[1]['message'],
+                         "there is no class allowed for this server")
+    
+    
+    def test_objects(self):
+        c = self.get_class()
+        self.assertEqual(self.fake.jobs, {'getclass': 1, 'getuser': 1})
+        self.assertEqual(c.name, "A class")
+        self.assertEqual(c.password, "pass")
+        self.assertEqual(c.supervisor.fullname, "John Doe")
+        self.assertEqual(c.supervisor.password, "pass")
+        
+        u = User("jdoe", "Doe", "Jane", "pass")
+        c.additem(u)
+        self.assertIn(u, c)
+        self.assertEqual(User.list(c), [u])
+        self.assertEqual(User.get(c, "jdoe").firstname, "Jane")
+        u.delete()
+        self.assertEqual(User.list(c), [])
+        
+        s = Sheet("Sheet", "A sheet", sheetmode=1)
+        c.additem(s)
+        self.assertEqual(s.qsheet, "1")
+        s.title = "Title"
+        s.save()
+        self.assertEqual(Sheet.get(c, 1).title, "Title")
+        self.assertEqual(Sheet.get(c, 1).sheetmode, "1")
+        
+        e = Exam("Exam")
+        c.additem(e)
+        self.assertEqual(Exam.list(c), [e])
+        c.delitem(e)
+        self.assertFalse(Exam.check(c, e))
+    
+    
+    def test_scores(self):
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass"))
+        c.additem(User("jsmith", "Smith", "John", "pass"))
+        s = Sheet("Sheet", formula=4, indicator=0)
+        c.additem(s)
+        self.api.putexo(9001, "myclass", 1, "H3/analysis/oeflinf.fr", {'points': 10, 'weight': 2})
+        self.fake.set_sheet_score(9001, 1, "jdoe", user_percent=50, user_quality=10,
+                                  got_detail=[5])
+        
+        self.fake.jobs.clear()
+        scores = s.scores()
+        self.assertEqual([score.user.quser for score in scores], ["jdoe", "jsmith"])
+        self.assertEqual(scores[0].score, 5)
+        self.assertEqual(scores[0].exercises[0].cumul, 5)
+        self.assertEqual(scores[0].exercises[0].weight, 2)
+        self.assertEqual(scores[1].score, 0)
+        self.assertEqual(self.fake.jobs, {'getsheetscores': 1})
+        self.assertEqual(scores[0].user.fullname, "Jane Doe")
+        self.assertIs(scores[0].user, User.get(c, "jdoe"))
+        self.assertEqual(self.fake.jobs, {'getsheetscores': 1, 'getuser': 1})
+        jdoe = scores[0].user
+        self.assertIs(s.scores(jdoe).user, jdoe)
+        with self.assertRaises(ValueError):
+            s.scores("unknown")
+        
+        e = Exam("Exam")
+        c.additem(e)
+        self.assertEqual(self.api.getexamscores(9001, "myclass", 1)[1]['message'],
+                         "Exam #1 must be active")
+        e.exammode = 1
+        e.save()
+        self.fake.set_exam_score(9001, 1, "jsmith", 7.5, 2)
+        self.assertEqual(e.scores("jsmith").score, 7.5)
+        self.assertEqual(e.scores("jdoe").attempts, 0)
+        self.fake.jobs.clear()
+        self.assertEqual([score.user.quser for score in e.scores()], ["jdoe", "jsmith"])
+        self.assertEqual(self.fake.jobs, {'getexamscores': 1})
+        with self.assertRaises(ValueError):
+            e.scores("unknown")
+        
+        status, rows = self.api.getcsv_rows(9001, "myclass", ["login", "sheets", "exams"])
+        self.assertEqual(list(rows), [
+            {'login': "jdoe", 'sheet1': 5.0, 'exam1': None},
+            {'login': "jsmith", 'sheet1': None, 'exam1': 7.5},
+        ])
+    
+    
+    def test_csv(self):
+        with mock.patch.object(FormBody, "close", autospec=True,
+                               side_effect=FormBody.close) as close:
+            status, response = self.api.putcsv(9001, "myclass", [
+                ["login", "lastname", "firstname", "password"],
+                ["Login", "Last name", "First name", "Password"],
+                ["jdoe", "Doe", "Jane", "pass"],
+                ["jsmith", "Smith", "John", "pass"],
+            ])
+        self.assertTrue(status)
+        self.assertEqual(response['message'], "2 users added and 0 users modified in class 9001")
+        close.assert_called_once()
+        self.assertTrue(close.call_args[0][0].file.closed)
+        self.assertEqual(self.api.getuser(9001, "myclass", "jsmith")[1]['firstname'], "John")
+        response = self.api.putcsv(9001, "myclass", [["login", "email"], ["Login", "Email"],
+                                                     ["jdoe", "jdoe@wimsapi.org"]])[1]
+        self.assertEqual(response['message'], "0 users added and 1 users modified in class 9001")
+        status, content = self.api.getcsv(9001, "myclass", ["login", "name"], "tsv")
+        self.assertEqual(content, b"login\tname\nLogin\tName\n\njdoe\tDoe Jane\n"
+                                  b"jsmith\tSmith John\n")
+        
+        status, content = self.api.getclasstgz(9001, "myclass")
+        with tarfile.open(fileobj=io.BytesIO(content), mode="r:gz") as tar:
+            self.assertIn("9001/.users/jdoe", tar.getnames())
+    
+    
+    def test_logs(self):
+        self.fake.add_user(9001, "jdoe", {'lastname': "Doe"})
+        self.fake.add_log(9001, "jdoe", "20190101.12:00:00 login")
+        self.assertEqual(self.api.getlog(9001, "myclass", "jdoe")[1]['user_log'],
+                         ["20190101.12:00:00 login"])
+        self.assertEqual(self.api.getexamlog(9001, "myclass", "jdoe", 1)[1]['message'],
+                         "the user jdoe hasn't any exam log in this class.")
+    
+    
+    def test_unsupported_job(self):
+        status, response = self.api.buildexos(9001, "myclass")
+        self.assertFalse(status)
+        self.assertEqual(response['message'], "job 'buildexos' is not supported by FakeWims")
+    
+    
+    def test_failures(self):
+        self.fake.fail_next("html")
+        with self.assertRaises(InvalidResponseError):
+            self.api.checkident()
+        
+        self.fake.fail_next("disconnect", job="gettime")
+        self.assertTrue(self.api.checkident()[0])
+        with self.assertRaises(requests.ConnectionError):
+            self.api.gettime()
+        
+        self.fake.fail_next("timeout", count=2)
+        api = WimsAPI(URL, "myself", "toto", transport=self.fake,
+                      retry=RetryPolicy(retries=2, backoff=0))
+        self.assertTrue(api.checkident()[0])
+        self.assertEqual(self.fake.jobs['checkident'], 5)
+        
+        with self.assertRaises(ValueError):
+            self.fake.fail_next("unknown")
+    
+    
+    def test_error_rate(self):
+        fake = FakeWims(error_rate=0.5, failures=("html",), seed=1)
+        api = WimsAPI(URL, "myself", "toto", transport=fake)
+        results = api.map("checkident", [{}] * 100)
+        failures = sum(isinstance(r, InvalidResponseError) for r in results)
+        self.assertTrue(20 < failures < 80)
+    
+    
+    def test_latency(self):
+        self.fake.latency = 0.05
+        start = time.monotonic()
+        self.api.checkident()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        
+        self.fake.latency = lambda: 1
+        with self.assertRaises(requests.Timeout):
+            self.api.checkident(timeout=0.01)
+
+
+
+class FakeWimsServerTestCase(unittest.TestCase):
+
+    def test_server(self):
+        fake = FakeWims(timeout_delay=0)
+        fake.add_class("myclass", qclass=9001)
+        with FakeWimsServer(fake) as server, WimsAPI(server.url, "myself", "toto") as api:
+            self.assertTrue(api.checkclass(9001, "myclass")[0])
+            self.assertTrue(api.putcsv(9001, "myclass", "login,lastname\nLogin,Name\nélodie,É\n",
+                                       False)[0])
+            self.assertEqual(api.getuser(9001, "myclass", "lodie")[1]['lastname'], "É")
+            
+            status, stream = api.getclasstgz_stream(9001, "myclass")
+            self.assertTrue(stream.save(io.BytesIO()).size)
+            
+            fake.fail_next("disconnect")
+            with self.assertRaises(requests.ConnectionError):
+                api.checkident()
+            fake.fail_next("html")
+            with self.assertRaises(InvalidResponseError):
+                api.checkident()
+            self.assertTrue(api.checkident()[0])
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from wimsapi.api import WimsAPI
+from wimsapi.fake import FakeWims
+from wimsapi.hooks import Hook, MetricsCollector, RequestEvent
+from wimsapi.retry import RetryPolicy
+from wimsapi.wclass import Class
+
+
+try:
+    from wimsapi.aio import AsyncWimsAPI, aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class RecordingHook(Hook):
+
+    def __init__(self):
+        self.calls = []
+    
+    
+    def before_request(self, event):
+        self.calls.append(("before", event.job, event.attempt))
+    
+    
+    def after_response(self, event):
+        self.calls.append(("after", event))
+    
+    
+    def on_error(self, event):
+        self.calls.append(("error", event))
+
+
+
+class HooksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeWims("myself", "toto")
+        self.fake.add_class("myclass", qclass=9001)
+        self.hook = RecordingHook()
+        self.api = WimsAPI(URL, "myself", "toto", transport=self.fake, hooks=[self.hook])
+    
+    
+    def test_event(self):
+        self.api.getclass(9001, "myclass")
+        self.api.getuser(9001, "myclass", "unknown")
+        
+        self.assertEqual(self.hook.calls[0], ("before", "getclass", 0))
+        event = self.hook.calls[1][1]
+        self.assertEqual(self.hook.calls[1][0], "after")
+        self.assertEqual((event.job, event.qclass, event.status, event.format),
+                         ("getclass", "9001", "OK", "json"))
+        self.assertEqual(event.http_status, 200)
+        self.assertGreater(event.request_size, 0)
+        self.assertGreater(event.response_size, 0)
+        self.assertGreaterEqual(event.elapsed, 0)
+        self.assertIsNone(event.error)
+        self.assertEqual(self.hook.calls[3][1].status, "ERROR")
+    
+    
+    def test_file(self):
+        self.api.getclasstgz(9001, "myclass")
+        self.api.getclasstgz_stream(9001, "myclass")[1].save(io.BytesIO())
+        self.api.getclasstgz_stream(1, "myclass")
+        events = [call[1] for call in self.hook.calls if call[0] == "after"]
+        self.assertEqual([e.format for e in events], ["other", "other", "json"])
+        self.assertEqual([e.status for e in events], ["OK", "OK", "ERROR"])
+        self.assertGreater(events[0].response_size, 0)
+    
+    
+    def test_error(self):
+        self.fake.fail_next("timeout", count=2)
+        api = WimsAPI(URL, "myself", "toto", transport=self.fake, hooks=[self.hook],
+                      retry=RetryPolicy(retries=2, backoff=0))
+        api.checkident()
+        
+        self.assertEqual([c[0] for c in self.hook.calls],
+                         ["before", "error", "before", "error", "before", "after"])
+        self.assertEqual([c[1].attempt for c in self.hook.calls if c[0] != "before"], [0, 1, 2])
+        self.assertIsInstance(self.hook.calls[1][1].error, requests.Timeout)
+    
+    
+    def test_high_level(self):
+        Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake, hooks=[self.hook])
+        self.assertEqual({c[1] for c in self.hook.calls if c[0] == "before"},
+                         {"getclass", "getuser"})
+    
+    
+    def test_request_size(self):
+        event = RequestEvent("adduser", {'job': "adduser", 'data1': "a=é b", 'qclass': None})
+        self.assertEqual(event.request_size, len("job=adduser&data1=a%3D%E9+b"))
+        self.assertIsNone(event.qclass)
+    
+    
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async(self):
+        async def main():
+            api = AsyncWimsAPI(URL, "myself", "toto", transport=self.fake, hooks=[self.hook])
+            await api.getclass(9001, "myclass")
+        
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+        self.assertEqual(self.hook.calls[1][1].job, "getclass")
+        self.assertEqual(self.hook.calls[1][1].status, "OK")
+
+
+
+class MetricsCollectorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeWims("myself", "toto")
+        self.fake.add_class("myclass", qclass=9001)
+        self.metrics = MetricsCollector(buckets=(0.01, 0.1))
+        self.api = WimsAPI(URL, "myself", "toto", transport=self.fake, hooks=[self.metrics])
+    
+    
+    def test_stats(self):
+        self.fake.latency = 0.02
+        self.api.getclass(9001, "myclass")
+        self.api.getclass(9001, "myclass")
+        self.fake.latency = 0
+        self.api.checkident()
+        self.fake.fail_next("disconnect")
+        with self.assertRaises(requests.ConnectionError):
+            self.api.checkident()
+        
+        stats = self.metrics.stats()
+        self.assertEqual(list(stats), ["getclass", "checkident"])
+        self.assertEqual(stats['getclass']['requests'], 2)
+        self.assertGreaterEqual(stats['getclass']['mean'], 0.02)
+        self.assertEqual(stats['checkident']['requests'], 2)
+        self.assertEqual(stats['checkident']['errors'], 1)
+        
+        self.metrics.reset()
+        self.assertEqual(self.metrics.stats(), {})
+    
+    
+    def test_prometheus(self):
+        self.api.getclass(9001, "myclass")
+        self.api.getclass(1, "myclass")
+        self.fake.fail_next("html")
+        with self.assertRaises(Exception):
+            self.api.checkident()
+        
+        text = self.metrics.prometheus()
+        self.assertIn("# TYPE wimsapi_request_duration_seconds histogram\n", text)
+        self.assertIn('wimsapi_requests_total{job="getclass"} 2\n', text)
+        self.assertIn('wimsapi_responses_total{job="getclass",status="OK",format="json"} 1\n',
+                      text)
+        self.assertIn('wimsapi_responses_total{job="getclass",status="ERROR",format="json"} 1\n',
+                      text)
+        self.assertIn('wimsapi_errors_total{job="checkident",error="InvalidResponseError"} 1\n',
+                      text)
+        self.assertIn('wimsapi_request_duration_seconds_bucket{job="getclass",le="0.1"} 2\n',
+                      text)
+        self.assertIn('wimsapi_request_duration_seconds_bucket{job="getclass",le="+Inf"} 2\n',
+                      text)
+        self.assertIn('wimsapi_request_duration_seconds_count{job="getclass"} 2\n', text)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "wimsapi.prom")
+            self.metrics.write_prometheus(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), text)
+            self.assertEqual(os.listdir(directory), ["wimsapi.prom"])
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+            
+            threads = [threading.Thread(target=self.metrics.write_prometheus, args=(path,))
+                       for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), text)
+            self.assertEqual(os.listdir(directory), ["wimsapi.prom"])
+            
+            with mock.patch.object(self.metrics, "prometheus", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    self.metrics.write_prometheus(path)
+            self.assertEqual(os.listdir(directory), ["wimsapi.prom"])
@@ -0,0 +1,42 @@
+import unittest
+
+from wimsapi.api import BufferedResponse, parse_response
+from wimsapi.exceptions import InvalidResponseError
+
+
+
+def response(content, content_type="text/plain"):
+    return BufferedResponse(200, {"Content-Type": content_type}, content)
+
+
+
+class ParseResponseTestCase(unittest.TestCase):
+
+    def test_json(self):
+        self.assertEqual(
+            parse_response(response(b'\n {"status": "OK", "code": "A", "name": "\xe9"}')),
+            {"status": "OK", "code": "A", "name": "\xe9"}
+        )
+        self.assertEqual(
+            parse_response(response('{"status": "ERROR", "name": "é"}'.encode(),
+                                    "text/plain; charset=utf-8")),
+            {"status": "ERROR", "name": "é"}
+        )
+    
+    
+    def test_wims(self):
+        self.assertEqual(parse_response(response(b'OK 123\nline 1\nline 2\n')),
+                         {"status": "OK", "code": "123", "message": "line 1\nline 2"})
+        self.assertEqual(parse_response(response(b'ERROR\nclass not found')),
+                         {"status": "ERROR", "code": "N/A", "message": "class not found"})
+        self.assertEqual(parse_response(response(b'OK')),
+                         {"status": "OK", "code": "N/A", "message": ""})
+    
+    
+    def test_not_admraw(self):
+        for content in [b'\x1f\x8b\x08\x00', b'<html>Error</html>\n', b'{"status": "?"}',
+                        b'{"status": "OK"', b'']:
+            request = response(content)
+            self.assertIs(parse_response(request, return_request=True), request)
+            with self.assertRaises(InvalidResponseError):
+                parse_response(request)
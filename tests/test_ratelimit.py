@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from wimsapi.api import WimsAPI
+from wimsapi.fake import FakeWims
+from wimsapi.ratelimit import FamilyLimit, RateLimiter, TokenBucket, job_family
+
+
+
+class RateLimitTestCase(unittest.TestCase):
+
+    def test_job_family(self):
+        self.assertEqual(job_family("getuser"), "read")
+        self.assertEqual(job_family("checkclass"), "read")
+        self.assertEqual(job_family("listsheets"), "read")
+        self.assertEqual(job_family("adduser"), "write")
+        self.assertEqual(job_family("putcsv"), "write")
+        self.assertEqual(job_family("getclasstgz"), "download")
+    
+    
+    def test_token_bucket(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+        
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+    
+    
+    def test_concurrency(self):
+        limit = FamilyLimit(concurrency=2)
+        maximum = []
+        
+        def work():
+            limit.enter()
+            maximum.append(limit.in_flight)
+            time.sleep(0.01)
+            limit.exit()
+        
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(max(maximum), 2)
+        self.assertEqual(limit.in_flight, 0)
+    
+    
+    def test_concurrency_async(self):
+        limit = FamilyLimit(concurrency=1)
+        order = []
+        sleep = asyncio.sleep
+        
+        def thread_work(name):
+            limit.enter()
+            order.append(name)
+            time.sleep(0.02)
+            limit.exit()
+        
+        async def work(name):
+            await limit.enter_async()
+            order.append(name)
+            await sleep(0.02)
+            limit.exit()
+        
+        async def main():
+            tasks = [asyncio.ensure_future(work("coroutine%d" % i)) for i in range(2)]
+            await sleep(0.01)
+            thread = threading.Thread(target=thread_work, args=("thread",), daemon=True)
+            thread.start()
+            await sleep(0.01)
+            cancelled = asyncio.ensure_future(work("cancelled"))
+            await sleep(0.01)
+            cancelled.cancel()
+            await sleep(0.01)
+            waiting = len(limit._waiters)
+            limit.exit()
+            await asyncio.gather(*tasks)
+            await loop.run_in_executor(None, thread.join, 1)
+            return waiting
+        
+        limit.enter()  # Taken by the main thread
+        loop = asyncio.new_event_loop()
+        try:
+            with mock.patch("asyncio.sleep", side_effect=sleep) as polling:
+                waiting = loop.run_until_complete(asyncio.wait_for(main(), 5))
+        finally:
+            loop.close()
+        
+        # Waiters are woken up in the order they started waiting, without polling
+        self.assertEqual(waiting, 3)
+        self.assertEqual(order, ["coroutine0", "coroutine1", "thread"])
+        self.assertEqual(limit.in_flight, 0)
+        polling.assert_not_called()
+    
+    
+    def test_for_url(self):
+        self.assertIs(RateLimiter.for_url("http://wims.test/wims.cgi"),
+                      RateLimiter.for_url("http://wims.test/wims.cgi/"))
+        self.assertIsNot(RateLimiter.for_url("http://wims.test/wims.cgi"),
+                         RateLimiter.for_url("http://other.test/wims.cgi"))
+    
+    
+    def test_configure(self):
+        limiter = RateLimiter()
+        limiter.configure("read", rate=100, concurrency=1)
+        self.assertIsNotNone(limiter.limits["read"].bucket)
+        self.assertEqual(limiter.limits["read"].concurrency, 1)
+        self.assertIsNone(limiter.limits["write"].bucket)
+        
+        with limiter.limit("getuser"):
+            self.assertEqual(limiter.limits["read"].in_flight, 1)
+        self.assertEqual(limiter.limits["read"].in_flight, 0)
+        
+        limit = limiter.limits["read"]
+        with limiter.limit("getuser"):
+            limiter.configure("read", rate=50, burst=5, concurrency=2)
+            self.assertIs(limiter.limits["read"], limit)
+            self.assertEqual(limit.in_flight, 1)
+            self.assertEqual((limit.bucket.rate, limit.bucket.burst), (50, 5))
+        self.assertEqual(limit.in_flight, 0)
+        limiter.configure("read", concurrency=2)
+        self.assertIsNone(limit.bucket)
+        
+        with self.assertRaises(ValueError):
+            limiter.configure("unknown", rate=1)
+        with self.assertRaises(ValueError):
+            limiter.configure("read", concurrency=0)
+    
+    
+    def test_shared(self):
+        fake = FakeWims("myself", "toto", latency=0.1)
+        url = "http://shared.test/wims/wims.cgi"
+        apis = [WimsAPI(url, "myself", "toto", transport=fake,
+                        rate_limits={'read': {'concurrency': 1}})
+                for _ in range(2)]
+        threads = [threading.Thread(target=api.checkident) for api in apis]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+        self.assertEqual(RateLimiter.for_url(url).limits["read"].in_flight, 0)
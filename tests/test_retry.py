@@ -0,0 +1,107 @@
+import time
+import unittest
+
+import requests
+
+from wimsapi.api import WimsAPI
+from wimsapi.exceptions import AdmRawError, CircuitOpenError, InvalidResponseError
+from wimsapi.fake import FakeWims
+from wimsapi.retry import CircuitBreaker, RetryPolicy, is_idempotent
+
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def test_is_idempotent(self):
+        for job in ["getuser", "checkclass", "listsheets", "getclasstgz"]:
+            self.assertTrue(is_idempotent(job))
+        for job in ["adduser", "moduser", "deluser", "authuser", "putcsv"]:
+            self.assertFalse(is_idempotent(job))
+    
+    
+    def test_should_retry(self):
+        policy = RetryPolicy(retries=2)
+        error = requests.ConnectionError()
+        self.assertTrue(policy.should_retry("getuser", 0, error))
+        self.assertTrue(policy.should_retry("getuser", 1, error))
+        self.assertFalse(policy.should_retry("getuser", 2, error))
+        self.assertTrue(policy.should_retry("getuser", 0, requests.Timeout()))
+        self.assertTrue(policy.should_retry("getuser", 0, InvalidResponseError("", "")))
+        self.assertFalse(policy.should_retry("getuser", 0, AdmRawError("")))
+        self.assertFalse(policy.should_retry("getuser", 0, CircuitOpenError()))
+        self.assertFalse(policy.should_retry("adduser", 0, error))
+        self.assertTrue(RetryPolicy(idempotent_only=False).should_retry("adduser", 0, error))
+    
+    
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([policy.delay(i) for i in range(5)], [1, 2, 4, 5, 5])
+        
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for i in range(5):
+            self.assertTrue(0 <= policy.delay(i) <= min(5, 2 ** i))
+    
+    
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        breaker.before_call()
+        breaker.record_failure(requests.ConnectionError())
+        breaker.record_failure(AdmRawError(""))  # Not a transient error
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure(requests.Timeout())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        time.sleep(0.1)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure(requests.ConnectionError())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        # A trial request failing with a non-transient error reopens the circuit as well
+        time.sleep(0.1)
+        breaker.before_call()
+        failures = breaker.failures
+        breaker.record_failure(AdmRawError(""))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.failures, failures)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        time.sleep(0.1)
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+    
+    
+    def test_file_jobs(self):
+        fake = FakeWims("myself", "toto")
+        fake.add_class("myclass", qclass=9001)
+        breaker = CircuitBreaker(failure_threshold=10)
+        api = WimsAPI(URL, "myself", "toto", transport=fake, circuit_breaker=breaker)
+        fake.fail_next("html", count=2)
+        with self.assertRaises(InvalidResponseError):
+            api.getcsv(9001, "myclass", ["login"])
+        with self.assertRaises(InvalidResponseError):
+            api.getclasstgz_stream(9001, "myclass")
+        self.assertEqual(breaker.failures, 2)
+        
+        api = WimsAPI(URL, "myself", "toto", transport=fake,
+                      retry=RetryPolicy(retries=1, backoff=0))
+        fake.fail_next("html", job="getcsv")
+        fake.fail_next("html", job="getclasstgz")
+        status, content = api.getcsv(9001, "myclass", ["login"])
+        self.assertTrue(status)
+        self.assertNotIn(b"<html>", content)
+        status, stream = api.getclasstgz_stream(9001, "myclass")
+        with stream:
+            self.assertTrue(status)
+            self.assertTrue(b"".join(stream).startswith(b"\x1f\x8b"))
+        self.assertEqual((fake.jobs['getcsv'], fake.jobs['getclasstgz']), (3, 3))
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from urllib.parse import parse_qs
+
+from wimsapi.stream import (AsyncCsvRows, AsyncFileStream, CsvRows, FileStream, FormBody,
+                            csv_chunks, peek, peek_async)
+
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+
+async def collect(rows):
+    result = []
+    async for row in rows:
+        result.append(row)
+    return result
+
+
+
+class AsyncChunks:
+    """Asynchronous iterable over chunks."""
+    
+    
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def test_peek_file(self):
+        body, chunks = peek([b'\x1f\x8b', b'\x08\x00', b'rest', b'end'])
+        self.assertIsNone(body)
+        self.assertEqual(b''.join(chunks), b'\x1f\x8b\x08\x00restend')
+    
+    
+    def test_peek_admraw(self):
+        body, chunks = peek([b' {"sta', b'tus": "ERROR"}'])
+        self.assertEqual(body, b' {"status": "ERROR"}')
+        self.assertIsNone(chunks)
+        
+        body, chunks = peek([b'ERROR\nclass', b' not existing'])
+        self.assertEqual(body, b'ERROR\nclass not existing')
+    
+    
+    def test_peek_too_big(self):
+        body, chunks = peek([b'{"a": 1}', b'x' * 10, b'y' * 10], max_size=15)
+        self.assertIsNone(body)
+        self.assertEqual(b''.join(chunks), b'{"a": 1}' + b'x' * 10 + b'y' * 10)
+    
+    
+    def test_file_stream(self):
+        closed = []
+        progress = []
+        stream = FileStream([b'abc', b'', b'def'], progress=lambda s, t: progress.append((s, t)),
+                            checksum="sha256", total=6)
+        stream.on_close(lambda: closed.append(True))
+        
+        self.assertEqual(list(stream), [b'abc', b'def'])
+        self.assertEqual(stream.size, 6)
+        self.assertEqual(progress, [(3, 6), (6, 6)])
+        self.assertEqual(stream.hexdigest(), hashlib.sha256(b'abcdef').hexdigest())
+        self.assertTrue(stream.closed)
+        self.assertEqual(closed, [True])
+        
+        stream.close()
+        self.assertEqual(closed, [True])
+        with self.assertRaises(ValueError):
+            FileStream([]).hexdigest()
+    
+    
+    def test_peek_async(self):
+        async def peeked(chunks):
+            body, chunks = await peek_async(chunks, max_size=10)
+            if chunks is None:
+                return body, None
+            content = b''
+            async for chunk in chunks:
+                content += chunk
+            return body, content
+        
+        self.assertEqual(run(peeked(AsyncChunks([b'\x1f\x8b', b'\x08\x00', b'rest']))),
+                         (None, b'\x1f\x8b\x08\x00rest'))
+        self.assertEqual(run(peeked([b'OK', b'\nmessage'])), (b'OK\nmessage', None))
+        self.assertEqual(run(peeked(AsyncChunks([b'OK\n', b'123456', b'789']))),
+                         (None, b'OK\n123456789'))
+    
+    
+    def test_async_file_stream(self):
+        async def read(stream):
+            chunks = []
+            async for chunk in stream:
+                chunks.append(chunk)
+            return chunks
+        
+        closed = []
+        progress = []
+        stream = AsyncFileStream(AsyncChunks([b'abc', b'', b'def']), checksum="sha256", total=6,
+                                 progress=lambda s, t: progress.append((s, t)))
+        stream.on_close(lambda: closed.append(True))
+        with self.assertRaises(TypeError):
+            iter(stream)
+        
+        self.assertEqual(run(read(stream)), [b'abc', b'def'])
+        self.assertEqual(progress, [(3, 6), (6, 6)])
+        self.assertEqual(stream.hexdigest(), hashlib.sha256(b'abcdef').hexdigest())
+        self.assertEqual(closed, [True])
+        self.assertEqual(run(read(stream)), [])
+        
+        self.assertEqual(run(AsyncFileStream([b'abc', b'def']).save(BytesIO())).size, 6)
+        stream = AsyncFileStream([b'abc', b'def'])
+        stream.on_close(lambda: closed.append(True))
+        
+        async def first(stream):
+            async with stream:
+                async for chunk in stream:
+                    return chunk
+        
+        self.assertEqual(run(first(stream)), b'abc')
+        self.assertEqual(closed, [True, True])
+    
+    
+    def test_save(self):
+        f = BytesIO()
+        FileStream([b'abc', b'def']).save(f)
+        self.assertEqual(f.getvalue(), b'abcdef')
+        
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            FileStream([b'abc', b'def']).save(path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b'abcdef')
+        finally:
+            os.remove(path)
+    
+    
+    def test_context_manager(self):
+        closed = []
+        with FileStream(iter([b'abc'])) as stream:
+            stream.on_close(lambda: closed.append(True))
+        self.assertEqual(closed, [True])
+    
+    
+    def test_csv_rows(self):
+        content = ('login,name,average0,sheet1\n'
+                   '"Login","Name","Average","Sheet 1"\n'
+                   '\n'
+                   '"jdoe","Doe, Jé",7.5,\n'
+                   '"sdoe","Doe, Sé",-,10\n').encode()
+        expected = [
+            {'login': 'jdoe', 'name': 'Doe, Jé', 'average0': 7.5, 'sheet1': None},
+            {'login': 'sdoe', 'name': 'Doe, Sé', 'average0': None, 'sheet1': 10.0},
+        ]
+        
+        self.assertEqual(list(CsvRows(content)), expected)
+        for size in (1, 2, 7):
+            chunks = [content[i:i + size] for i in range(0, len(content), size)]
+            self.assertEqual(list(CsvRows(chunks)), expected)
+        
+        content = 'login\tname\taverage0\tsheet1\n\n\njdoe\tDoe, Jé\t7.5\t\n'.encode()
+        rows = CsvRows(content, frmt='tsv', namedtuples=True)
+        row = next(rows)
+        self.assertEqual(rows.header, ['login', 'name', 'average0', 'sheet1'])
+        self.assertEqual((row.login, row.name, row.average0, row.sheet1),
+                         ('jdoe', 'Doe, Jé', 7.5, None))
+    
+    
+    def test_csv_rowsclose(self):
+        stream = FileStream([b'login\n"Login"\n\n"jdoe"\n"sdoe"\n'])
+        with CsvRows(stream) as rows:
+            self.assertEqual(next(rows), {'login': 'jdoe'})
+        self.assertTrue(stream.closed)
+        self.assertEqual(list(rows), [])
+        
+        self.assertEqual(list(CsvRows(b'')), [])
+        with self.assertRaises(ValueError):
+            CsvRows(b'', frmt='xls')
+    
+    
+    def test_async_csv_rows(self):
+        content = ('login,name,comments,average0\n'
+                   '"Login","Name","Comments","Average"\n'
+                   '\n'
+                   '"jdoe","Doe, Jé","First line\n""second"" line\n\nlast",7.5\n'
+                   '"sdoe","Doe, Sé",,-\n'
+                   '\n'
+                   '"xdoe",Doe, X"é,"\n').encode()
+        expected = list(CsvRows(content))
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(expected[0]['comments'], 'First line\n"second" line\n\nlast')
+        
+        self.assertEqual(run(collect(AsyncCsvRows(content))), expected)
+        for size in (1, 2, 7):
+            chunks = [content[i:i + size] for i in range(0, len(content), size)]
+            self.assertEqual(run(collect(AsyncCsvRows(chunks))), expected)
+            self.assertEqual(run(collect(AsyncCsvRows(AsyncFileStream(AsyncChunks(chunks))))),
+                             expected)
+        
+        content = 'login\tname\taverage0\n\n\njdoe\tDoe, Jé\t7.5'.encode()
+        rows = AsyncCsvRows(content, frmt='tsv', namedtuples=True)
+        row = run(rows.__anext__())
+        self.assertEqual(rows.header, ['login', 'name', 'average0'])
+        self.assertEqual((row.login, row.name, row.average0), ('jdoe', 'Doe, Jé', 7.5))
+        with self.assertRaises(TypeError):
+            next(rows)
+    
+    
+    def test_async_csv_rowsclose(self):
+        async def first(rows):
+            async with rows:
+                async for row in rows:
+                    return row
+        
+        stream = AsyncFileStream([b'login\n"Login"\n\n"jdoe"\n"sdoe"\n'])
+        csv_rows = AsyncCsvRows(stream)
+        self.assertEqual(run(first(csv_rows)), {'login': 'jdoe'})
+        self.assertTrue(stream.closed)
+        self.assertEqual(run(collect(csv_rows)), [])
+        
+        self.assertEqual(run(collect(AsyncCsvRows(b''))), [])
+        with self.assertRaises(ValueError):
+            AsyncCsvRows(b'', frmt='xls')
+    
+    
+    def test_csv_chunks(self):
+        self.assertEqual("".join(csv_chunks("a,b\n1,2")), "a,b\n1,2")
+        self.assertEqual("".join(csv_chunks([["a", "b"], ["1", "x,y"]])), 'a,b\n1,"x,y"\n')
+        self.assertEqual("".join(csv_chunks(BytesIO("a,é\n".encode()), chunk_size=3)), "a,é\n")
+        
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with open(path, "w", encoding="utf-8", newline="\r\n") as f:
+                f.write("a,é\n1,2\n")
+            self.assertEqual("".join(csv_chunks(path, file=True, chunk_size=2)), "a,é\n1,2\n")
+        finally:
+            os.remove(path)
+    
+    
+    def test_form_body(self):
+        body = FormBody({'job': 'putcsv', 'qclass': 1, 'option': None}, 'data1',
+                        ["a,é\n", "1,2&3\n"])
+        self.assertEqual(body['job'], 'putcsv')
+        self.assertEqual(parse_qs(body.payload().decode(), encoding="ISO-8859-1"), {
+            'job': ['putcsv'], 'qclass': ['1'], 'data1': ['a,é\n1,2&3\n']
+        })
+        body.close()
+        
+        with FormBody({'job': 'putcsv'}, 'data1', ["x" * 100] * 10, max_size=100) as body:
+            payload = body.payload()
+            self.assertTrue(hasattr(payload, "read"))
+            self.assertEqual(len(payload.read()), body.size)
+        self.assertTrue(body.file.closed)
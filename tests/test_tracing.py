@@ -0,0 +1,120 @@
+import logging
+import unittest
+
+from wimsapi import tracing
+from wimsapi.api import WimsAPI
+from wimsapi.exam import Exam
+from wimsapi.exceptions import AdmRawError
+from wimsapi.fake import FakeWims
+from wimsapi.retry import RetryPolicy
+from wimsapi.sheet import Sheet
+from wimsapi.user import User
+from wimsapi.wclass import Class
+
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = tracing.InMemoryExporter()
+        tracing.set_exporter(self.exporter)
+        self.fake = FakeWims("myself", "toto")
+        self.fake.add_class("myclass", qclass=9001)
+        self.fake.add_user(9001, "jdoe", {'lastname': "Doe", 'firstname': "John"})
+    
+    
+    def tearDown(self):
+        tracing.set_exporter(None)
+    
+    
+    def test_disabled(self):
+        tracing.set_exporter(None)
+        self.assertFalse(tracing.enabled())
+        with tracing.span("operation") as span:
+            self.assertIsNone(span)
+        Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
+        self.assertEqual(self.exporter.spans, [])
+    
+    
+    def test_nested(self):
+        c = Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
+        spans = self.exporter.spans
+        root = spans[-1]
+        self.assertEqual(root.name, "Class.get")
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes, {'wims.qclass': "9001", 'wims.rclass': "myclass"})
+        self.assertEqual(sorted(s.name for s in spans[:-1]), ["getclass", "getuser"])
+        for span in spans[:-1]:
+            self.assertEqual(span.parent_id, root.span_id)
+            self.assertEqual(span.trace_id, root.trace_id)
+            self.assertEqual(span.attributes['wims.job'], span.name)
+            self.assertEqual(span.attributes['wims.status'], "OK")
+            self.assertLessEqual(span.duration, root.duration)
+        getuser = next(s for s in spans if s.name == "getuser")
+        self.assertEqual(getuser.attributes['wims.quser'], "supervisor")
+        
+        self.exporter.clear()
+        User.list(c)
+        self.assertEqual([s.name for s in self.exporter.spans], ["getcsv", "User.list"])
+        getcsv, user_list = self.exporter.spans
+        self.assertEqual(user_list.attributes, {'wims.qclass': "9001", 'wims.rclass': "myclass"})
+        self.assertEqual(getcsv.parent, user_list)
+    
+    
+    def test_item_attributes(self):
+        c = Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
+        s = Sheet("Sheet")
+        c.additem(s)
+        self.exporter.clear()
+        s.scores()
+        root = self.exporter.spans[-1]
+        self.assertEqual(root.name, "Sheet.scores")
+        self.assertEqual(root.attributes['wims.qsheet'], "1")
+        self.assertEqual(root.attributes['wims.qclass'], "9001")
+        job = next(s for s in self.exporter.spans if s.name == "getsheetscores")
+        self.assertEqual(job.attributes['wims.qsheet'], "1")
+    
+    
+    def test_lazy_items(self):
+        c = Class.get(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
+        c.additem(Exam("Exam", exammode=1))
+        self.fake.jobs.clear()
+        exam = Exam.list(c, lazy=True)[0]
+        exam.scores()
+        self.assertEqual(self.fake.jobs, {'listexams': 1, 'getexamscores': 1})
+        self.assertEqual(self.exporter.spans[-1].attributes['wims.qexam'], "1")
+    
+    
+    def test_error(self):
+        self.fake.fail_next("timeout")
+        api = WimsAPI(URL, "myself", "toto", transport=self.fake,
+                      retry=RetryPolicy(retries=1, backoff=0))
+        api.checkident()
+        first, second = self.exporter.spans
+        self.assertEqual(first.attributes['wims.attempt'], 0)
+        self.assertIsNotNone(first.error)
+        self.assertEqual(second.attributes['wims.attempt'], 1)
+        self.assertIsNone(second.error)
+        
+        with self.assertRaises(AdmRawError):
+            Class.get(URL, "myself", "toto", 1, "myclass", transport=self.fake)
+        self.assertIsInstance(self.exporter.spans[-1].error, AdmRawError)
+        self.assertEqual(self.exporter.spans[-2].attributes['wims.status'], "ERROR")
+    
+    
+    def test_batch(self):
+        api = WimsAPI(URL, "myself", "toto", transport=self.fake)
+        with tracing.span("sync") as parent:
+            api.map("getuser", [{'qclass': 9001, 'rclass': "myclass", 'quser': "jdoe"}] * 3)
+        self.assertEqual([s.parent_id for s in self.exporter.spans[:-1]], [parent.span_id] * 3)
+    
+    
+    def test_logging_exporter(self):
+        tracing.set_exporter(tracing.LoggingExporter())
+        with self.assertLogs("wimsapi.tracing", logging.DEBUG) as logs:
+            Class.check(URL, "myself", "toto", 9001, "myclass", transport=self.fake)
+        self.assertTrue(logs.output[0].startswith("DEBUG:wimsapi.tracing:  checkclass "))
+        self.assertTrue(logs.output[1].startswith("DEBUG:wimsapi.tracing:Class.check "))
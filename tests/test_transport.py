@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+
+from wimsapi.api import WimsAPI
+from wimsapi.exceptions import InvalidResponseError
+from wimsapi.transport import (FakeTransport, RecordingTransport, ReplayTransport, form_fields,
+                               split_chunks)
+from wimsapi.stream import FileStream, FormBody
+
+
+URL = "http://wims.test/wims/wims.cgi"
+
+
+
+class TransportTestCase(unittest.TestCase):
+
+    def test_form_fields(self):
+        fields = {'job': 'getuser', 'qclass': 9001, 'name': 'é'.encode("latin1"), 'option': None}
+        self.assertEqual(form_fields(fields),
+                         {'job': 'getuser', 'qclass': '9001', 'name': 'é'})
+        body = FormBody({'job': 'putcsv', 'qclass': 9001}, 'data1', ["a,é\n", "1,2\n"])
+        self.assertEqual(form_fields(body), {'job': 'putcsv', 'qclass': '9001',
+                                             'data1': 'a,é\n1,2\n'})
+    
+    
+    def test_split_chunks(self):
+        self.assertEqual(split_chunks(b'abcdefg', 3), [b'abc', b'def', b'g'])
+        self.assertEqual(split_chunks(b'', 3), [])
+    
+    
+    def test_fake(self):
+        transport = FakeTransport({
+            'checkident': {'status': 'OK', 'code': 'A'},
+            'getclasstgz': b'\x1f\x8b\x08\x00' + b'x' * 100,
+            'getuser': lambda fields: {'status': 'OK', 'quser': fields['quser']},
+        })
+        api = WimsAPI(URL, "myself", "toto", transport=transport)
+        
+        self.assertEqual(api.checkident(), (True, {'status': 'OK', 'code': 'A'}))
+        self.assertEqual(api.getuser(9001, "myclass", "jdoe")[1]['quser'], 'jdoe')
+        self.assertEqual(api.getclasstgz(9001, "myclass"),
+                         (True, b'\x1f\x8b\x08\x00' + b'x' * 100))
+        status, stream = api.getclasstgz_stream(9001, "myclass", chunk_size=10)
+        self.assertIsInstance(stream, FileStream)
+        self.assertEqual(len(list(stream)), 11)
+        
+        status, response = api.getsheet(9001, "myclass", 1)
+        self.assertFalse(status)
+        self.assertEqual(response['message'], "No response defined for job 'getsheet'")
+        self.assertEqual([r['job'] for r in transport.requests],
+                         ['checkident', 'getuser', 'getclasstgz', 'getclasstgz', 'getsheet'])
+        self.assertEqual(transport.requests[0]['passwd'], 'toto')
+    
+    
+    def test_fake_handler(self):
+        transport = FakeTransport(handler=lambda fields: (500, {}, b'<html>Error</html>'))
+        api = WimsAPI(URL, "myself", "toto", transport=transport)
+        with self.assertRaises(InvalidResponseError):
+            api.checkident()
+    
+    
+    def test_record_stream(self):
+        class Chunks:
+            closed = False
+            
+            def __iter__(self):
+                return iter([b'{"status": ', b'"OK"}'])
+            
+            def close(self):
+                self.closed = True
+        
+        chunks = Chunks()
+        recording = RecordingTransport(lambda url, fields, chunk_size: (200, {}, chunks))
+        status, _, body = recording(URL, {'job': "getcsv"}, chunk_size=4)
+        self.assertTrue(chunks.closed)
+        self.assertEqual(b''.join(body), b'{"status": "OK"}')
+        self.assertEqual(recording.records[0]['body'], '{"status": "OK"}')
+    
+    
+    def test_record_replay(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            fake = FakeTransport(handler=lambda fields: {'status': 'OK', 'n': len(fake.requests)})
+            recording = RecordingTransport(fake, path)
+            api = WimsAPI(URL, "myself", "toto", transport=recording)
+            api.getclass(9001, "myclass")
+            api.getclass(9001, "myclass")
+            api.getuser(9001, "myclass", "jdoe")
+            
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual(records, recording.records)
+            self.assertEqual(records[0]['fields']['passwd'], '*')
+            self.assertEqual(records[0]['fields']['ident'], '*')
+            
+            for replay in [ReplayTransport(path), ReplayTransport(recording.records)]:
+                api = WimsAPI(URL, "other", "password", transport=replay)
+                self.assertEqual(api.getclass(9001, "myclass")[1]['n'], 1)
+                self.assertEqual(api.getuser(9001, "myclass", "jdoe")[1]['n'], 3)
+                self.assertEqual(api.getclass(9001, "myclass")[1]['n'], 2)
+                self.assertEqual(api.getclass(9001, "myclass")[1]['n'], 2)
+                with self.assertRaises(LookupError):
+                    api.getclass(9002, "myclass")
+        finally:
+            os.remove(path)
@@ -0,0 +1,111 @@
+import time
+
+from wimsapi.exam import Exam
+from wimsapi.exceptions import AdmRawError, InvalidItemTypeError, NotSavedError
+from wimsapi.sheet import Sheet
+from wimsapi.unitofwork import UnitOfWork
+from wimsapi.user import User
+from wimsapi.wclass import Class
+
+from tests.fixtures import FakeWimsFixture
+
+
+
+class UnitOfWorkTestCase(FakeWimsFixture):
+
+    def setUp(self):
+        super().setUp()
+        self.fake.add_user(9001, "old", {'lastname': "Old", 'firstname': "John"})
+        self.wclass = self.get_class()
+        
+        self.sent = []
+        for job in ("adduser", "deluser", "addsheet", "addexam"):
+            method = getattr(self.fake, "_job_" + job)
+            setattr(self.fake, "_job_" + job, self._recording(job, method))
+    
+    
+    def _recording(self, job, method):
+        return lambda fields: self.sent.append(job) or method(fields)
+    
+    
+    def test_flush(self):
+        work = UnitOfWork(self.wclass)
+        users = [User("user%d" % i, "Doe", "John", "pass") for i in range(3)]
+        exam, sheet = Exam("Exam"), Sheet("Sheet")
+        work.additem(exam)
+        for user in users:
+            work.additem(user)
+        work.save(sheet)
+        work.delitem("old", User)
+        self.assertEqual(len(work), 6)
+        self.assertEqual(work.staged, [exam] + users + [sheet, "old"])
+        self.fake.jobs.clear()
+        
+        self.assertEqual(work.flush(), [exam] + users + [sheet, "old"])
+        self.assertEqual(len(work), 0)
+        self.assertEqual(self.sent[0], "deluser")
+        self.assertEqual(self.sent[-1], "addexam")
+        self.assertEqual(self.fake.jobs['checksheet'], 1)
+        self.assertNotIn('checkuser', self.fake.jobs)
+        self.assertEqual(sorted(u.quser for u in User.list(self.wclass)),
+                         ["user0", "user1", "user2"])
+        self.assertEqual(Sheet.get(self.wclass, sheet.qsheet).title, "Sheet")
+        self.assertTrue(self.wclass.checkitem(exam))
+        self.assertEqual(work.flush(), [])
+    
+    
+    def test_concurrency(self):
+        self.fake.latency = 0.05
+        work = UnitOfWork(self.wclass, max_workers=10)
+        for i in range(10):
+            work.additem(User("user%d" % i, "Doe", "John", "pass"))
+        start = time.perf_counter()
+        work.flush()
+        self.assertLess(time.perf_counter() - start, 0.05 * 5)
+        self.assertEqual(self.fake.jobs['adduser'], 10)
+    
+    
+    def test_errors(self):
+        work = UnitOfWork(self.wclass)
+        user = User("jdoe", "Doe", "John", "pass")
+        work.delitem("unknown", User)
+        work.additem(user)
+        results = work.flush()
+        self.assertIsInstance(results[0], AdmRawError)
+        self.assertIs(results[1], user)
+        self.assertTrue(User.check(self.wclass, "jdoe"))
+    
+    
+    def test_replace(self):
+        work = UnitOfWork(self.wclass)
+        user = User.get(self.wclass, "old")
+        work.save(user)
+        work.delitem(user)
+        work.delitem("old", User)
+        work.delitem("old", Sheet)
+        self.assertEqual(len(work), 3)
+        self.assertEqual(work.staged, [user, "old", "old"])
+        self.assertEqual(work._operations[0], ("delete", user, User))
+        work.clear()
+        self.assertEqual(len(work), 0)
+        work.delitem("old", User)
+        self.assertEqual(work.staged, ["old"])
+        work.flush()
+        work.save(user)
+        self.assertEqual(work.staged, [user])
+    
+    
+    def test_exceptions(self):
+        with self.assertRaises(NotSavedError):
+            UnitOfWork(Class("myclass", "A class", "an institution", "mail@mail.com", "password",
+                             User("supervisor", "last", "first", "pass")))
+        
+        work = UnitOfWork(self.wclass)
+        with self.assertRaises(InvalidItemTypeError):
+            work.additem(1)
+        with self.assertRaises(InvalidItemTypeError):
+            work.save("old")
+        with self.assertRaises(InvalidItemTypeError):
+            work.delitem("old")
+        with self.assertRaises(InvalidItemTypeError):
+            work.delitem("old", int)
@@ -3,11 +3,15 @@ import unittest
 
 from wimsapi.api import WimsAPI
 from wimsapi.exceptions import AdmRawError, InvalidIdentifier, NotSavedError
+from wimsapi.fake import AdmRawJobError
 from wimsapi.user import User
 from wimsapi.wclass import Class
 
+from tests.fixtures import FakeWimsFixture
+
 
 WIMS_URL = os.getenv("WIMS_URL") or "http://localhost:7777/wims/wims.cgi/"
+URL = "http://wims.test/wims/wims.cgi"
 
 
 
@@ -177,3 +181,76 @@ class UserTestCase(unittest.TestCase):
         
         with self.assertRaises(NotSavedError):
             u1 == u3
+    
+    
+    def test_csv_rows(self):
+        users = (User("jdoe%d" % i, "Doe", "John", "pass", "mail@mail.com") for i in range(2))
+        rows = list(User.csv_rows(users, ["login", "name", "email"]))
+        self.assertEqual(rows, [
+            ["login", "name", "email"],
+            ["Login", "Name", "Email"],
+            ["jdoe0", "Doe John", "mail@mail.com"],
+            ["jdoe1", "Doe John", "mail@mail.com"],
+        ])
+        
+        with self.assertRaises(ValueError):
+            next(User.csv_rows([], ["login", "unknown"]))
+
+
+
+class FakeUserTestCase(FakeWimsFixture):
+    
+    
+    def test_user_list(self):
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass", regnum="42", comments="Comment"))
+        c.additem(User("jsmith", "Smith", "John", "pass"))
+        self.fake.jobs.clear()
+        
+        users = User.list(c)
+        self.assertEqual(self.fake.jobs, {'getcsv': 1})
+        self.assertEqual([u.quser for u in users], ["jdoe", "jsmith"])
+        self.assertEqual(users[0].fullname, "Jane Doe")
+        self.assertEqual((users[0].password, users[0].regnum), ("pass", "42"))
+        self.assertEqual(self.fake.jobs, {'getcsv': 1})
+        
+        self.assertEqual(users[0].comments, "Comment")
+        self.assertEqual(users[0].supervisable, "no")
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'getuser': 1})
+        with self.assertRaises(AttributeError):
+            users[0].unknown
+        
+        users[1].email = "jsmith@wimsapi.org"
+        users[1].save()
+        self.assertEqual(User.get(c, "jsmith").email, "jsmith@wimsapi.org")
+        self.assertEqual(User.get(c, "jsmith").agreecgu, "yes")
+    
+    
+    def test_user_list_fallback(self):
+        def getcsv(fields):
+            raise AdmRawJobError("getcsv is disabled")
+        
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass", comments="Comment"))
+        self.fake._job_getcsv = getcsv
+        self.fake.jobs.clear()
+        
+        users = User.list(c)
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'getclass': 1, 'getuser': 1})
+        self.assertEqual([u.quser for u in users], ["jdoe"])
+        self.assertEqual((users[0].password, users[0].comments), ("pass", "Comment"))
+        
+        # HTML error page sent instead of the roster
+        del self.fake._job_getcsv
+        self.fake.fail_next("html", job="getcsv")
+        c.invalidate()
+        self.fake.jobs.clear()
+        self.assertEqual([u.quser for u in User.list(c)], ["jdoe"])
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'getclass': 1, 'getuser': 1})
+        
+        # File which is not a roster
+        self.fake._job_getcsv = lambda fields: ("text/plain", b"Not a roster\n")
+        c.invalidate()
+        self.fake.jobs.clear()
+        self.assertEqual([u.quser for u in User.list(c)], ["jdoe"])
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'getclass': 1, 'getuser': 1})
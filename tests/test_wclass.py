@@ -4,13 +4,18 @@ import unittest
 from unittest import mock
 
 from wimsapi.api import WimsAPI
+from wimsapi.exam import Exam
 from wimsapi.exceptions import AdmRawError, InvalidItemTypeError, NotSavedError
+from wimsapi.fake import AdmRawJobError
 from wimsapi.sheet import Sheet
 from wimsapi.user import User
 from wimsapi.wclass import Class, one_year_later
 
+from tests.fixtures import FakeWimsFixture
+
 
 WIMS_URL = os.getenv("WIMS_URL") or "http://localhost:7777/wims/wims.cgi/"
+URL = "http://wims.test/wims/wims.cgi"
 
 
 
@@ -293,3 +298,346 @@ class ClassTestCase(unittest.TestCase):
             sorted(c.listitem(Sheet), key=lambda i: i.qsheet))
         
         c.delete()
+
+
+
+class FakeClassTestCase(FakeWimsFixture):
+    
+    
+    def test_class_list(self):
+        self.fake.add_class("myclass", {'description': "B", 'password': "pass2"},
+                            {'lastname': "Smith", 'password': "pass3"}, qclass=9002)
+        self.fake.add_class("other", qclass=9003)
+        self.fake.jobs.clear()
+        
+        classes = Class.list(URL, "myself", "toto", "myclass", transport=self.fake)
+        self.assertEqual(self.fake.jobs, {'listclasses': 1, 'getuser': 2})
+        self.assertEqual([(c.qclass, c.name, c.password, c.supervisor.password) for c in classes],
+                         [("9001", "A class", "pass", "pass"), ("9002", "B", "pass2", "pass3")])
+        self.assertEqual(classes[1].supervisor._class, classes[1])
+        self.assertEqual(classes[0].__dict__.keys(),
+                         Class.get(URL, "myself", "toto", 9001, "myclass",
+                                   transport=self.fake).__dict__.keys())
+        
+        # Servers ignoring the option of listclasses
+        self.fake.jobs.clear()
+        option = self.fake._job_listclasses
+        self.fake._job_listclasses = lambda fields: option(
+            {k: v for k, v in fields.items() if k != 'option'}
+        )
+        classes = Class.list(URL, "myself", "toto", "myclass", transport=self.fake)
+        self.assertEqual(self.fake.jobs, {'listclasses': 1, 'getuser': 2, 'getclass': 2})
+        self.assertEqual([c.name for c in classes], ["A class", "B"])
+    
+    
+    def test_class_list_lazy(self):
+        self.fake.add_class("myclass", {'description': "B"}, qclass=9002)
+        self.fake.jobs.clear()
+        
+        classes = Class.list(URL, "myself", "toto", "myclass", lazy=True, transport=self.fake)
+        self.assertEqual(self.fake.jobs, {'listclasses': 1})
+        self.assertEqual([c.qclass for c in classes], ["9001", "9002"])
+        self.assertEqual(classes[0], classes[0])
+        self.assertEqual(self.fake.jobs, {'listclasses': 1})
+        
+        self.assertEqual(classes[0].name, "A class")
+        self.assertEqual(classes[0].supervisor.fullname, "John Doe")
+        self.assertIs(classes[0].supervisor._class, classes[0])
+        self.assertEqual(self.fake.jobs, {'listclasses': 1, 'getclass': 1, 'getuser': 1})
+        with self.assertRaises(AttributeError):
+            classes[0].unknown
+        
+        classes[1].institution = "Inst"
+        classes[1].save()
+        self.assertEqual(classes[1].name, "B")
+        self.assertEqual(self.fake.jobs['modclass'], 1)
+        self.assertEqual(self.api.getclass(9002, "myclass")[1]['institution'], "Inst")
+
+
+
+class IdentityMapTestCase(FakeWimsFixture):
+
+
+    def test_refresh(self):
+        c = self.get_class()
+        api = c._api
+        u = User("jdoe", "Doe", "Jane", "pass")
+        c.additem(u)
+        self.api.modclass(9001, "myclass", {'description': "Modified"})
+        self.fake.jobs.clear()
+        
+        self.assertIs(c.refresh(), c)
+        self.assertEqual(self.fake.jobs, {'getclass': 1, 'getuser': 1})
+        self.assertEqual(c.name, "Modified")
+        self.assertIs(c._api, api)
+        self.assertIs(c.supervisor._class, c)
+        self.assertIsNot(User.get(c, "jdoe"), u)
+    
+    
+    def test_identity_map(self):
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass"))
+        s = Sheet("Sheet")
+        c.additem(s)
+        e = Exam("Exam")
+        c.additem(e)
+        self.fake.jobs.clear()
+        
+        u = User.get(c, "jdoe")
+        self.assertIs(c.getitem("jdoe", User), u)
+        self.assertIs(User.list(c)[0], u)
+        self.assertIs(s.scores()[0].user, u)
+        self.assertIs(Sheet.get(c, 1), Sheet.list(c)[0])
+        self.assertIs(Exam.get(c, "1"), Exam.get(c, 1))
+        self.assertEqual(self.fake.jobs, {'getuser': 1, 'getcsv': 1, 'getsheetscores': 1,
+                                          'getsheet': 1, 'listsheets': 1, 'getexam': 1})
+        
+        self.api.moduser(9001, "myclass", "jdoe", {'firstname': "John"})
+        self.assertEqual(User.get(c, "jdoe").firstname, "Jane")
+        self.assertIs(u.refresh(), u)
+        self.assertEqual(u.firstname, "John")
+        self.assertIs(User.get(c, "jdoe"), u)
+        
+        c.invalidate(User, "jdoe")
+        self.assertIsNot(User.get(c, "jdoe"), u)
+        c.invalidate(Sheet)
+        self.assertIsNot(Sheet.get(c, 1), s)
+        self.assertIs(Exam.get(c, 1), Exam.get(c, 1))
+        c.invalidate()
+        self.assertEqual(c._items, {})
+        
+        exam = Exam.get(c, 1)
+        exam.delete()
+        with self.assertRaises(AdmRawError):
+            Exam.get(c, 1)
+        self.assertNotIn('_items', c._to_payload())
+
+
+
+class LazyItemsTestCase(FakeWimsFixture):
+
+
+    def test_lazy_items(self):
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass"))
+        c.additem(User("jsmith", "Smith", "John", "pass"))
+        for i in range(3):
+            c.additem(Sheet("Sheet %d" % i, sheetmode=1))
+        c.additem(Exam("Exam"))
+        self.fake.jobs.clear()
+        
+        sheets = c.listitem(Sheet, lazy=True)
+        self.assertEqual([s.qsheet for s in sheets], ["1", "2", "3"])
+        self.assertEqual(self.fake.jobs, {'listsheets': 1})
+        self.assertEqual(sheets[0].title, "Sheet 0")
+        self.assertEqual(self.fake.jobs, {'listsheets': 1, 'getsheet': 1})
+        self.assertIs(c.loaditems(sheets)[2], sheets[2])
+        self.assertEqual((sheets[2].title, sheets[2].sheetmode), ("Sheet 2", "1"))
+        self.assertEqual(self.fake.jobs, {'listsheets': 1, 'getsheet': 3})
+        c.loaditems(sheets)
+        self.assertEqual(self.fake.jobs['getsheet'], 3)
+        
+        exams = Exam.list(c)
+        self.assertEqual(exams[0].title, "Exam")
+        self.assertEqual((self.fake.jobs['listexams'], self.fake.jobs['getexam']), (1, 1))
+        with self.assertRaises(AttributeError):
+            exams[0].unknown
+        
+        users = c.loaditems(score.user for score in sheets[1].scores())
+        self.assertEqual([u.lastname for u in users], ["Doe", "Smith"])
+        self.assertEqual(self.fake.jobs['getuser'], 2)
+        
+        c.invalidate()
+        sheet = Sheet.list(c, lazy=True)[1]
+        sheet.title = "Title"
+        sheet.save()
+        self.assertEqual(sheet.sheetmode, "1")
+        self.assertEqual(Sheet.get(c, 2).title, "Title")
+        self.assertEqual(self.api.getsheet(9001, "myclass", 2)[1]['sheet_title'], "Title")
+
+
+
+class DirtyTrackingTestCase(FakeWimsFixture):
+
+
+    def test_dirty_tracking(self):
+        def recording(job):
+            method = getattr(self.fake, "_job_" + job)
+            return lambda fields: sent.append((job, fields['data1'])) or method(fields)
+        
+        sent = []
+        for job in ("moduser", "modsheet", "modclass"):
+            setattr(self.fake, "_job_" + job, recording(job))
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass"))
+        c.additem(Sheet("Sheet"))
+        self.fake.jobs.clear()
+        
+        u = User.get(c, "jdoe")
+        s = Sheet.get(c, 1)
+        self.assertNotIn('wclass', u._to_payload())
+        self.assertNotIn('exos', s._to_payload())
+        u.save()
+        s.save()
+        c.save()
+        self.assertEqual(self.fake.jobs, {'getuser': 1, 'getsheet': 1})
+        
+        u.email = "jdoe@wimsapi.org"
+        u.save()
+        u.save()
+        s.title = "Title"
+        s.save(check_exists=False)
+        c.institution = "Inst"
+        c.save()
+        self.assertEqual(sent, [("moduser", "email=jdoe@wimsapi.org"), ("modsheet", "title=Title"),
+                                ("modclass", "institution=Inst")])
+        self.assertEqual(User.get(c, "jdoe").email, "jdoe@wimsapi.org")
+        
+        del sent[:]
+        c.invalidate()
+        self.fake.jobs.clear()
+        user = User.list(c)[0]
+        user.save()
+        user.regnum = "42"
+        user.save(check_exists=False)
+        self.assertEqual(sent, [("moduser", "regnum=42")])
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'moduser': 1})
+        self.assertEqual(user.comments, "")
+        user.save()
+        self.assertEqual(len(sent), 1)
+
+
+
+class ExistenceTestCase(FakeWimsFixture):
+
+
+    def test_existence(self):
+        c = self.get_class()
+        c.additem(User("jdoe", "Doe", "Jane", "pass"))
+        self.fake.jobs.clear()
+        
+        u = User.get(c, "jdoe")
+        u.email = "jdoe@wimsapi.org"
+        u.save()
+        s = Sheet("Sheet")
+        s.save(c)
+        s.title = "Title"
+        s.save()
+        self.assertEqual(self.fake.jobs, {'getuser': 1, 'moduser': 1, 'checksheet': 1,
+                                          'addsheet': 1, 'modsheet': 1})
+        
+        self.fake.jobs.clear()
+        c.primeitems(Exam)
+        e = Exam("Exam")
+        e.save(c)
+        self.assertTrue(c.checkitem(e))
+        e.delete()
+        self.assertFalse(c.checkitem(e))
+        self.assertEqual(self.fake.jobs, {'listexams': 1, 'addexam': 1, 'delexam': 1})
+        
+        self.fake.jobs.clear()
+        User.list(c)
+        self.assertTrue(c.checkitem("jdoe", User))
+        User.remove(c, u)
+        self.assertFalse(c.checkitem("jdoe", User))
+        u.save()
+        self.assertEqual(self.fake.jobs, {'getcsv': 1, 'deluser': 1, 'adduser': 1})
+        self.assertTrue(User.check(c, "jdoe"))
+        
+        c.invalidate(User)
+        self.fake.jobs.clear()
+        self.assertTrue(c.checkitem("jdoe", User))
+        self.assertEqual(self.fake.jobs, {'checkuser': 1})
+
+
+
+class BulkUsersTestCase(FakeWimsFixture):
+
+
+    def test_addusers(self):
+        def putcsv(fields):
+            raise AdmRawJobError("putcsv is disabled")
+        
+        c = self.get_class()
+        users = [User("user%d" % i, "Doe", "John", "pass", "user%d@wimsapi.org" % i)
+                 for i in range(50)]
+        special = [User("ap'ostrophe", "Doe", "Jane", "pass"),
+                   User("jdoe", "Doe", "Jane", "pass", regprop1="group A")]
+        self.fake.jobs.clear()
+        
+        self.assertEqual(c.addusers(users + special), users + special)
+        self.assertEqual(self.fake.jobs, {'getclass': 1, 'putcsv': 1, 'adduser': 2})
+        self.assertEqual(special[0].quser, "apostrophe")
+        self.assertEqual(User.get(c, "user7").email, "user7@wimsapi.org")
+        self.assertEqual(User.get(c, "jdoe").regprop1, "group A")
+        
+        self.fake.jobs.clear()
+        users[0].email = "modified@wimsapi.org"
+        users[0].save()
+        self.assertEqual(self.fake.jobs, {'moduser': 1})
+        
+        # Existing users are not modified by putcsv, but fail as with additem()
+        self.fake.jobs.clear()
+        new = [User("user50", "Doe", "John", "pass"), User("jdoe", "Smith", "John", "other"),
+               User("user7", "Smith", "John", "other"), User("user50", "Smith", "Jim", "pass")]
+        results = c.addusers(new)
+        self.assertEqual(self.fake.jobs, {'putcsv': 1, 'adduser': 3})
+        self.assertIs(results[0], new[0])
+        for result in results[1:]:
+            self.assertIsInstance(result, AdmRawError)
+            self.assertIn("already exists", str(result))
+        self.assertFalse(new[1]._saved)
+        c.invalidate()
+        self.assertEqual((User.get(c, "jdoe").lastname, User.get(c, "jdoe").password),
+                         ("Doe", "pass"))
+        self.assertEqual(User.get(c, "user7").email, "user7@wimsapi.org")
+        self.assertEqual(User.get(c, "user50").firstname, "John")
+        
+        self.fake.jobs.clear()
+        self.fake._job_putcsv = putcsv
+        new = [User("user51", "Doe", "John", "pass"),
+               User("user52", "Doe", "John", "pass", regprop1="group A")]
+        results = c.addusers(new)
+        self.assertEqual(self.fake.jobs, {'getclass': 1, 'putcsv': 1, 'adduser': 1})
+        self.assertIsInstance(results[0], AdmRawError)
+        self.assertIs(results[1], new[1])
+        self.assertFalse(c.checkitem("user51", User))
+        with self.assertRaises(InvalidItemTypeError):
+            c.addusers([Sheet()])
+    
+    
+    def test_modusers_delusers(self):
+        c = self.get_class()
+        c.addusers([User("user%d" % i, "Doe", "John", "pass") for i in range(10)])
+        c.invalidate()
+        users = User.list(c)
+        ghost = User("ghost", "Doe", "John", "pass")
+        for user in users:
+            user.email = user.quser + "@wimsapi.org"
+        users[0].regprop1 = "group A"
+        users[1].lastname = "Smith"
+        self.fake.jobs.clear()
+        
+        results = c.modusers(users + [ghost], max_workers=2)
+        self.assertEqual(results[:-1], users)
+        self.assertIsInstance(results[-1], AdmRawError)
+        self.assertEqual(self.fake.jobs, {'putcsv': 2, 'moduser': 2})
+        self.assertEqual(c.modusers(users), users)
+        self.assertEqual(self.fake.jobs, {'putcsv': 2, 'moduser': 2})
+        c.invalidate()
+        user = User.get(c, "user1")
+        self.assertEqual((user.email, user.lastname), ("user1@wimsapi.org", "Smith"))
+        self.assertEqual(User.get(c, "user0").regprop1, "group A")
+        self.assertEqual(User.get(c, "user9").email, "user9@wimsapi.org")
+        
+        self.fake.jobs.clear()
+        results = c.delusers(users[:5] + ["user5", "ghost"])
+        self.assertEqual(results[:-1], users[:5] + ["user5"])
+        self.assertIsInstance(results[-1], AdmRawError)
+        self.assertEqual(self.fake.jobs, {'deluser': 7})
+        self.assertEqual([u.quser for u in User.list(c)], ["user6", "user7", "user8", "user9"])
+        self.assertFalse(users[0]._saved)
+        with self.assertRaises(InvalidItemTypeError):
+            c.delusers([1])
+        with self.assertRaises(InvalidItemTypeError):
+            c.modusers(["user6"])
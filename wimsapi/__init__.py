@@ -1,9 +1,12 @@
 from .api import WimsAPI
 from .exam import Exam
-from .exceptions import (AdmRawError, InvalidItemTypeError, InvalidResponseError, NotSavedError,
-                         WimsAPIError)
+from .exceptions import (AdmRawError, CircuitOpenError, InvalidItemTypeError,
+                         InvalidResponseError, NotSavedError, WimsAPIError)
+from .hooks import Hook, MetricsCollector, RequestEvent
+from .retry import CircuitBreaker, RetryPolicy
 from .score import ExamScore, ExerciseScore, SheetScore
 from .sheet import Sheet
+from .unitofwork import UnitOfWork
 from .user import User
 from .wclass import Class
 
@@ -0,0 +1,387 @@
+"""Asynchronous version of the low-level API of the adm/raw module of WIMS.
+
+AsyncWimsAPI exposes exactly the same jobs as WimsAPI, but every method is a coroutine sending
+its request through an aiohttp.ClientSession (see AiohttpTransport):
+
+    async with AsyncWimsAPI(url, ident, passwd) as api:
+        status, response = await api.getclass(qclass, rclass)
+
+aiohttp must be installed to use this module (pip install wimsapi[aio]).
+
+For more information, see https://wimsapi.readthedocs.io/aio/"""
+
+import asyncio
+import inspect
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from wimsapi import tracing
+from wimsapi.api import BufferedResponse, WimsAPI, check_file, parse_response, status_of
+from wimsapi.hooks import RequestEvent
+from wimsapi.stream import (AsyncCsvRows, AsyncFileStream, CSV_DELIMITERS, FileStream, FormBody,
+                            peek_async, read_async)
+from wimsapi.transport import Transport
+
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+
+def encode_params(params):
+    """Return params as an 'application/x-www-form-urlencoded' body encoded in 'ISO-8859-1'.
+    
+    Like requests, parameters whose value is None are not sent. A wimsapi.stream.FormBody is
+    read from its temporary file."""
+    if isinstance(params, FormBody):
+        payload = params.payload()
+        return payload if isinstance(payload, bytes) else payload.read()
+    return urlencode([
+        (k, v.encode("ISO-8859-1") if isinstance(v, str) else v)
+        for k, v in params.items() if v is not None
+    ]).encode("ascii")
+
+
+
+@contextmanager
+def requests_errors():
+    """Raise the timeouts and connection errors of aiohttp as their requests counterparts."""
+    try:
+        yield
+    except asyncio.TimeoutError as e:
+        raise requests.Timeout(str(e)) from e
+    except aiohttp.ClientConnectionError as e:
+        raise requests.ConnectionError(str(e)) from e
+
+
+
+class ResponseChunks:
+    """Asynchronous iterator over the chunks of bytes of an aiohttp.ClientResponse, of at most
+    chunk_size bytes each.
+    
+    close() releases the connection of the response."""
+    
+    
+    def __init__(self, response, chunk_size):
+        self._response = response
+        self._chunks = response.content.iter_chunked(chunk_size)
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        with requests_errors():
+            return await self._chunks.__anext__()
+    
+    
+    def close(self):
+        """Release the connection of the response."""
+        self._response.release()
+
+
+
+class AiohttpTransport(Transport):
+    """Asynchronous transport sending the requests through an aiohttp.ClientSession.
+    
+    Calling this transport returns a coroutine. Timeouts and connection errors are raised as
+    their requests counterparts, so that they are handled the same way as with WimsAPI. If
+    chunk_size is given, the body is returned as a ResponseChunks, which must be closed.
+    
+    Parameters:
+        limit - (int) Maximum number of simultaneous connections (defaults to 100), 0 for no
+                limit.
+        keepalive_timeout - (float) Number of seconds an idle connection is kept alive
+                            (defaults to 15).
+    
+    Keyword arguments are given to aiohttp.ClientSession.post()."""
+    
+    
+    def __init__(self, limit=100, keepalive_timeout=15):
+        if aiohttp is None:  # pragma: no cover
+            raise ImportError("aiohttp must be installed to use AiohttpTransport "
+                              "(pip install wimsapi[aio])")
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+    
+    
+    async def __call__(self, url, fields, chunk_size=None, **kwargs):
+        headers = {"Content-Type": "application/x-www-form-urlencoded; charset=ISO-8859-1"}
+        with requests_errors():
+            if chunk_size is not None:
+                response = await self.session.post(url, data=encode_params(fields),
+                                                   headers=headers, **kwargs)
+                return response.status, response.headers, ResponseChunks(response, chunk_size)
+            
+            async with self.session.post(url, data=encode_params(fields), headers=headers,
+                                         **kwargs) as response:
+                return response.status, response.headers, await response.read()
+    
+    
+    @property
+    def session(self):
+        """Returns the aiohttp.ClientSession used by this transport.
+        
+        The session is created on first access, it must thus be accessed within a running
+        event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    
+    async def close(self):
+        """Close every connection kept alive by this transport."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+
+class AsyncWimsAPI(WimsAPI):
+    """Asynchronous counterpart of WimsAPI.
+    
+    Every job of WimsAPI is available with the same parameters, but must be awaited. The
+    returned values are the same as those of WimsAPI, except that the streaming jobs (e.g.
+    getclasstgz_stream()) return a wimsapi.stream.AsyncFileStream instead of a FileStream, and
+    getcsv_rows() a wimsapi.stream.AsyncCsvRows instead of a CsvRows.
+    
+    Parameters:
+        url - (str) url to the wims server CGI. e.g. https://wims.unice.fr/wims/wims.cgi
+        ident - (str) Sender identifier (a word, according to the definition
+                in WIMS_HOME/log/classes/.connections/)
+        passwd - (str) Sender password (as defined in WIMS_HOME/log/classes/.connections/)
+        limit - (int) Maximum number of simultaneous connections (defaults to 100), 0 for no
+                limit.
+        keepalive_timeout - (float) Number of seconds an idle connection is kept alive
+                            (defaults to 15).
+        transport - (wimsapi.transport.Transport) Transport sending the requests, defaults to an
+                    AiohttpTransport built from the two arguments above. Synchronous transports
+                    (e.g. wimsapi.transport.ReplayTransport) can also be used.
+        kwargs - (dict) Keyword argument that will be passed to the transport
+                 (aiohttp.ClientSession.post() by default).
+    
+    The underlying aiohttp.ClientSession is created on the first request, and must be closed
+    with 'await close()', or by using the instance as an asynchronous context manager."""
+    
+    
+    def __init__(self, url, ident, passwd, limit=100, keepalive_timeout=15, transport=None,
+                 **kwargs):
+        if transport is None:
+            transport = AiohttpTransport(limit, keepalive_timeout)
+        super().__init__(url, ident, passwd, transport=transport, **kwargs)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+    
+    
+    def __enter__(self):
+        raise TypeError("Use 'async with' with an instance of AsyncWimsAPI")
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):  # pragma: no cover
+        pass
+    
+    
+    async def __aenter__(self):
+        return self
+    
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    
+    @property
+    def session(self):
+        """Returns the aiohttp.ClientSession of the AiohttpTransport used by this instance of
+        AsyncWimsAPI.
+        
+        The session is created on first access, it must thus be accessed within a running
+        event loop."""
+        return self.transport.session
+    
+    
+    async def close(self):
+        """Close every connection kept alive by the transport of this instance of
+        AsyncWimsAPI."""
+        closed = self.transport.close()
+        if inspect.isawaitable(closed):
+            await closed
+    
+    
+    async def batch(self, calls, max_workers=None):
+        """Execute the given jobs concurrently and return their results in the same order.
+        
+        Same as WimsAPI.batch(), but at most max_workers (defaults to limit) jobs are awaited
+        at the same time instead of being executed on a pool of threads."""
+        calls = [(self._job(job), kwargs) for job, kwargs in calls]
+        semaphore = asyncio.Semaphore(max_workers or self.limit or len(calls) or 1)
+        
+        async def run(method, kwargs):
+            async with semaphore:
+                return await method(**kwargs)
+        
+        return await asyncio.gather(*[run(m, k) for m, k in calls], return_exceptions=True)
+    
+    
+    async def map(self, job, kwargs_list, max_workers=None):
+        """Execute job concurrently once for each dictionary of arguments in kwargs_list."""
+        return await self.batch([(job, kwargs) for kwargs in kwargs_list], max_workers)
+    
+    
+    async def _post(self, params, _event=None, **kwargs):
+        """Send params to the WIMS server through the transport and return the fully read
+        response."""
+        response = self.transport(self.url, params, **{**self.request_kwargs, **kwargs})
+        if inspect.isawaitable(response):
+            response = await response
+        response = BufferedResponse(*response)
+        if _event is not None:
+            self._record_response(_event, response)
+        return response
+    
+    
+    async def _send(self, call, event):
+        """Return 'await call(event)', calling the hooks of this instance around it if event is
+        not None."""
+        if event is None:
+            return await call(None)
+        
+        start = self._before_request(event)
+        try:
+            result = await call(event)
+        except Exception as e:
+            self._on_error(event, start, e)
+            raise
+        self._after_response(event, start, result)
+        return result
+    
+    
+    async def _execute(self, job, call, params):
+        """Return the result of 'await call(event)', applying the retry policy and the circuit
+        breaker of this instance."""
+        attempt = 0
+        while True:
+            event = RequestEvent(job, params, attempt) if self.hooks else None
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                with tracing.job_span(job, params, attempt) as span:
+                    async with self.rate_limiter.limit(job) as slot:
+                        result = await self._send(call, event)
+                        if isinstance(result, FileStream):
+                            result.on_close(slot.detach())
+                    if span is not None:
+                        span.set_attribute('wims.status', status_of(result))
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure(e)
+                if self.retry is None or not self.retry.should_retry(job, attempt, e):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                return result
+    
+    
+    async def _call(self, params, verbose=False, **kwargs):
+        async def call(event):
+            return parse_response(await self._post(params, event, **kwargs), verbose)
+        
+        response = await self._execute(params['job'], call, params)
+        return response['status'] == 'OK', response
+    
+    
+    async def _call_form(self, body, verbose=False, **kwargs):
+        with body:
+            return await self._call(body, verbose, **kwargs)
+    
+    
+    async def _call_file(self, params, _stream=None, **kwargs):
+        if _stream is not None:
+            return await self._stream_file(params, **_stream, **kwargs)
+        
+        async def call(event):
+            request = await self._post(params, event, **kwargs)
+            response = parse_response(request, return_request=True)
+            if isinstance(response, dict):
+                return response
+            check_file(request)
+            return request.content
+        
+        response = await self._execute(params['job'], call, params)
+        return (
+            response['status'] == 'OK' if isinstance(response, dict) else True,
+            response
+        )
+    
+    
+    async def _stream_file(self, params, chunk_size=65536, progress=None, checksum=None,
+                           **kwargs):
+        """Same as WimsAPI._stream_file(), but the file is returned as a
+        wimsapi.stream.AsyncFileStream."""
+        async def call(event):
+            response = self.transport(self.url, params, chunk_size=chunk_size,
+                                      **{**self.request_kwargs, **kwargs})
+            if inspect.isawaitable(response):
+                response = await response
+            status, headers, content = response
+            headers = CaseInsensitiveDict(headers)
+            close = getattr(content, "close", lambda: None)
+            try:
+                body, chunks = await peek_async(content)
+            except BaseException:
+                close()
+                raise
+            total = headers.get("Content-Length")
+            if event is not None:
+                event.http_status = status
+                event.response_size = int(total) if total else None
+                event.format = 'other'
+            if body is not None:
+                request = BufferedResponse(status, headers, body)
+                response = parse_response(request, return_request=True)
+                if isinstance(response, dict):
+                    close()
+                    if event is not None:
+                        self._record_response(event, request)
+                    return response
+                chunks = [body]
+            
+            if status >= 400:
+                try:
+                    check_file(BufferedResponse(status, headers, await read_async(chunks)))
+                finally:
+                    close()
+            
+            stream = AsyncFileStream(chunks, progress, checksum, int(total) if total else None)
+            stream.on_close(close)
+            return stream
+        
+        response = await self._execute(params['job'], call, params)
+        return (
+            response['status'] == 'OK' if isinstance(response, dict) else True,
+            response
+        )
+    
+    
+    async def getcsv_rows(self, qclass, rclass, options, frmt='csv', namedtuples=False,
+                          encoding='utf-8', chunk_size=65536, code=None, **kwargs):
+        """Same as WimsAPI.getcsv_rows(), but the rows are returned as a
+        wimsapi.stream.AsyncCsvRows, iterated with 'async for'."""
+        if frmt not in CSV_DELIMITERS:
+            raise ValueError("frmt must be one of %s" % ", ".join(CSV_DELIMITERS))
+        status, response = await self.getcsv_stream(qclass, rclass, options, frmt, chunk_size,
+                                                    code=code, **kwargs)
+        if not isinstance(response, FileStream):
+            return status, response
+        return True, AsyncCsvRows(response, frmt, encoding, namedtuples)
@@ -17,21 +17,31 @@ For more information, see https://wimsapi.readthedocs.io/adm-raw/"""
 
 import json
 import random
+import re
 import string
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
+from wimsapi import tracing
 from wimsapi.exceptions import InvalidResponseError
+from wimsapi.hooks import RequestEvent
+from wimsapi.ratelimit import RateLimiter
+from wimsapi.stream import CSV_DELIMITERS, CsvRows, FileStream, FormBody, csv_chunks, peek
+from wimsapi.transport import SessionTransport, create_session, post  # noqa: F401
 
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def post(url, **kwargs):
-    """Convert strings to 'ISO-8859-1' before sending the post request."""
-    
-    for k, v in kwargs["data"].items():
-        kwargs["data"][k] = v if not isinstance(v, str) else v.encode("ISO-8859-1")
-    kwargs["headers"] = {"Content-Type": "application/x-www-form-urlencoded; charset=ISO-8859-1"}
-    return requests.post(url, **kwargs)
+
+LEADING_WHITESPACE = re.compile(rb'\s*')
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 
 
@@ -41,18 +51,50 @@ def random_code():
 
 
 
+def response_format(request):
+    """Return the format of the content of request: 'json' or 'wims' if it is an adm/raw
+    response in the corresponding format, 'other' otherwise (e.g. a file)."""
+    content = request.content
+    start = LEADING_WHITESPACE.match(content).end()
+    if content[start:start + 1] == b'{' or 'json' in request.headers.get('Content-Type', ''):
+        return 'json'
+    if content.startswith((b'OK', b'ERROR'), start):
+        return 'wims'
+    return 'other'
+
+
+
+def status_of(result):
+    """Return the status of result, the parsed response of a job: the status of the adm/raw
+    response, or 'OK' for a file."""
+    return result.get('status') if isinstance(result, dict) else 'OK'
+
+
+
 def parse_response(request, verbose=False, return_request=False):
     """Return a dictionary containing at least 'status' and 'message' keys.
     
     The goal is that the response is always the same, whether the output type of the WIMS server is
     set to JSON or WIMS.
     
+    The format is picked from the Content-Type or the first bytes of the content, which is decoded
+    at most once. Content which is not an adm/raw response (e.g. a file) is never decoded.
+    
     Warning: output must be set 'ident_type=json' in 'WIMS_HOME/log/classes/.connections/IDENT'
     for this API to work properly."""
-    try:
-        response = request.json()
-    except json.JSONDecodeError:
-        status, message = request.text.split('\n', maxsplit=1)
+    content = request.content
+    format_ = response_format(request)
+    
+    response = None
+    if format_ == 'json':
+        try:
+            response = json_loads(content if request.encoding is None
+                                  else content.decode(request.encoding, errors="replace"))
+        except ValueError:
+            pass
+    elif format_ == 'wims':
+        text = content.decode(request.encoding or "utf-8", errors="replace")
+        status, _, message = text.partition('\n')
         code = "N/A"
         if ' ' in status:
             status, code = status.split(' ', maxsplit=1)
@@ -61,7 +103,8 @@ def parse_response(request, verbose=False, return_request=False):
             'message': message if '\n' not in message else message[:-1],
             'code':    code,
         }
-    if response['status'] not in ["ERROR", "OK"]:
+    
+    if not isinstance(response, dict) or response.get('status') not in ["ERROR", "OK"]:
         if not return_request:  # pragma: no cover
             if not verbose:
                 msg = ("Use verbose=True to see the received response content "
@@ -75,6 +118,43 @@ def parse_response(request, verbose=False, return_request=False):
 
 
 
+def check_file(request):
+    """Raise InvalidResponseError if request, a BufferedResponse which is not an adm/raw
+    response, is an HTTP error page (e.g. sent by Apache when the CGI times out under load)
+    instead of a file."""
+    if request.status_code >= 400:
+        raise InvalidResponseError(
+            "WIMS server responded with the HTTP status %d instead of a file. "
+            % request.status_code, request.text
+        )
+
+
+
+class BufferedResponse:
+    """Fully read response of a request.
+    
+    Mimic the part of requests.Response used by parse_response()."""
+    
+    
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = get_encoding_from_headers(self.headers)
+    
+    
+    @property
+    def text(self):
+        """Content of the response, decoded according to its Content-Type."""
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+    
+    
+    def json(self):
+        """Return the json-encoded content of the response."""
+        return json.loads(self.text)
+
+
+
 class WimsAPI:
     """This class allow a python3 script to communicate with a WIMS server.
     
@@ -83,7 +163,32 @@ class WimsAPI:
         ident - (str) Sender identifier (a word, according to the definition
                 in WIMS_HOME/log/classes/.connections/)
         passwd - (str) Sender password (as defined in WIMS_HOME/log/classes/.connections/)
-        kwargs - (dict) Keyword argument that will be passed to the request.post() calls.
+        pool_connections - (int) Number of connection pools to cache (defaults to 10).
+        pool_maxsize - (int) Maximum number of connections kept alive in each pool (defaults
+                       to 10).
+        max_retries - (int | urllib3.util.Retry) Retry policy of the HTTP adapter (defaults to 0).
+        session_lifetime - (float) Number of seconds after which the pooled session is closed
+                           and replaced by a new one, None (default) to keep it forever.
+        transport - (wimsapi.transport.Transport) Transport sending the requests, defaults to a
+                    wimsapi.transport.SessionTransport built from the four arguments above.
+        retry - (wimsapi.retry.RetryPolicy) How jobs failing because of a transient error are
+                retried, None (default) to never retry.
+        circuit_breaker - (wimsapi.retry.CircuitBreaker) Circuit breaker making requests fail fast
+                          with CircuitOpenError while the server seems to be down, None (default)
+                          to always send the requests.
+        rate_limits - (dict) Limits of each family of jobs ('read', 'write' or 'download'), e.g.
+                      {'read': {'rate': 20, 'concurrency': 4}}. These limits are shared by every
+                      instance targeting the same url, see wimsapi.ratelimit.RateLimiter.
+        hooks - (list) wimsapi.hooks.Hook called around every request (e.g. a
+                wimsapi.hooks.MetricsCollector), see wimsapi.hooks.
+        kwargs - (dict) Keyword argument that will be passed to the transport (request.post() by
+                 default).
+    
+    By default, every request is sent through a pooled keep-alive session, connections are thus
+    reused between calls. Use close() or a with statement to release them:
+    
+        with WimsAPI(url, ident, passwd) as api:
+            api.checkident()
     
     
     Two optionnal parameter can be passed to every method:
@@ -110,12 +215,270 @@ class WimsAPI:
     For more information, see https://wimsapi.readthedocs.io/adm-raw/"""
     
     
-    def __init__(self, url, ident, passwd, **kwargs):
+    def __init__(self, url, ident, passwd, pool_connections=10, pool_maxsize=10, max_retries=0,
+                 session_lifetime=None, transport=None, retry=None, circuit_breaker=None,
+                 rate_limits=None, hooks=None, **kwargs):
         self.params = {'module': 'adm/raw', 'ident': ident, 'passwd': passwd}
         if not url.endswith('/'):
             url += '/'
         self.url = url
         self.request_kwargs = kwargs
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.session_lifetime = session_lifetime
+        self.transport = transport if transport is not None else SessionTransport(
+            pool_connections, pool_maxsize, max_retries, session_lifetime
+        )
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.hooks = list(hooks or [])
+        self.rate_limiter = RateLimiter.for_url(url)
+        for family, limits in (rate_limits or {}).items():
+            self.rate_limiter.configure(family, **limits)
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    
+    @property
+    def session(self):
+        """Returns the pooled session of the wimsapi.transport.SessionTransport used by this
+        instance of WimsAPI."""
+        return self.transport.session
+    
+    
+    def close(self):
+        """Close every connection kept alive by the transport of this instance of WimsAPI.
+        
+        The instance can still be used afterward, new connections will be opened."""
+        self.transport.close()
+    
+    
+    def _post(self, params, _event=None, **kwargs):
+        """Send params to the WIMS server through the transport and return the response.
+        
+        If _event is given, the response is described in this wimsapi.hooks.RequestEvent."""
+        response = BufferedResponse(*self.transport(self.url, params,
+                                                    **{**self.request_kwargs, **kwargs}))
+        if _event is not None:
+            self._record_response(_event, response)
+        return response
+    
+    
+    @staticmethod
+    def _record_response(event, response):
+        """Describe response, a fully read BufferedResponse, in event."""
+        event.http_status = response.status_code
+        event.response_size = len(response.content)
+        event.format = response_format(response)
+    
+    
+    def _before_request(self, event):
+        """Call the before_request() method of every hook, and return the current time."""
+        for hook in self.hooks:
+            hook.before_request(event)
+        return time.perf_counter()
+    
+    
+    def _after_response(self, event, start, result):
+        """Complete event with the result of its request, started at start, and call the
+        after_response() method of every hook."""
+        event.elapsed = time.perf_counter() - start
+        event.status = status_of(result)
+        for hook in self.hooks:
+            hook.after_response(event)
+    
+    
+    def _on_error(self, event, start, error):
+        """Complete event with the error raised by its request, started at start, and call the
+        on_error() method of every hook."""
+        event.elapsed = time.perf_counter() - start
+        event.error = error
+        for hook in self.hooks:
+            hook.on_error(event)
+    
+    
+    def _send(self, call, event):
+        """Return call(event), calling the hooks of this instance around it if event is not
+        None."""
+        if event is None:
+            return call(None)
+        
+        start = self._before_request(event)
+        try:
+            result = call(event)
+        except Exception as e:
+            self._on_error(event, start, e)
+            raise
+        self._after_response(event, start, result)
+        return result
+    
+    
+    def _execute(self, job, call, params):
+        """Return the result of call(event), applying the retry policy and the circuit breaker
+        of this instance.
+        
+        event is a wimsapi.hooks.RequestEvent describing the request made from params, or None
+        if this instance has no hook. Each attempt is traced in its own span."""
+        attempt = 0
+        while True:
+            event = RequestEvent(job, params, attempt) if self.hooks else None
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                with tracing.job_span(job, params, attempt) as span, \
+                        self.rate_limiter.limit(job) as slot:
+                    result = self._send(call, event)
+                    if span is not None:
+                        span.set_attribute('wims.status', status_of(result))
+                    if isinstance(result, FileStream):
+                        result.on_close(slot.detach())
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure(e)
+                if self.retry is None or not self.retry.should_retry(job, attempt, e):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                return result
+    
+    
+    def _call(self, params, verbose=False, **kwargs):
+        """Send params to the WIMS server and return the parsed response as a tuple
+        (boolean, dictionary)."""
+        response = self._execute(
+            params['job'],
+            lambda event: parse_response(self._post(params, event, **kwargs), verbose),
+            params
+        )
+        return response['status'] == 'OK', response
+    
+    
+    def _call_form(self, body, verbose=False, **kwargs):
+        """Same as _call(), but params is a wimsapi.stream.FormBody, closed once WIMS has
+        responded."""
+        with body:
+            return self._call(body, verbose, **kwargs)
+    
+    
+    def _call_file(self, params, _stream=None, **kwargs):
+        """Send params to the WIMS server for a job returning a file.
+        
+        Return a tuple (boolean, dictionary) if WIMS responded with an adm/raw response,
+        (True, bytes) otherwise.
+        
+        If _stream is a dictionary, the file is streamed instead, see _stream_file()."""
+        if _stream is not None:
+            return self._stream_file(params, **_stream, **kwargs)
+        
+        def call(event):
+            request = self._post(params, event, **kwargs)
+            response = parse_response(request, return_request=True)
+            if isinstance(response, dict):
+                return response
+            check_file(request)
+            return request.content
+        
+        response = self._execute(params['job'], call, params)
+        return (
+            response['status'] == 'OK' if isinstance(response, dict) else True,
+            response
+        )
+    
+    
+    def _stream_file(self, params, chunk_size=65536, progress=None, checksum=None, **kwargs):
+        """Send params to the WIMS server for a job returning a file, without loading the file
+        in memory.
+        
+        Return a tuple (boolean, dictionary) if WIMS responded with an adm/raw response,
+        (True, wimsapi.stream.FileStream) otherwise."""
+        def call(event):
+            status, headers, content = self.transport(
+                self.url, params, chunk_size=chunk_size, **{**self.request_kwargs, **kwargs}
+            )
+            headers = CaseInsensitiveDict(headers)
+            close = getattr(content, "close", lambda: None)
+            body, chunks = peek(content)
+            total = headers.get("Content-Length")
+            if event is not None:
+                event.http_status = status
+                event.response_size = int(total) if total else None
+                event.format = 'other'
+            if body is not None:
+                request = BufferedResponse(status, headers, body)
+                response = parse_response(request, return_request=True)
+                if isinstance(response, dict):
+                    close()
+                    if event is not None:
+                        self._record_response(event, request)
+                    return response
+                chunks = [body]
+            
+            if status >= 400:
+                try:
+                    check_file(BufferedResponse(status, headers, b''.join(chunks)))
+                finally:
+                    close()
+            
+            stream = FileStream(chunks, progress, checksum, int(total) if total else None)
+            stream.on_close(close)
+            return stream
+        
+        response = self._execute(params['job'], call, params)
+        return (
+            response['status'] == 'OK' if isinstance(response, dict) else True,
+            response
+        )
+    
+    
+    def _job(self, job):
+        """Return the method of this instance corresponding to job."""
+        method = getattr(self, job, None) if not job.startswith('_') else None
+        if not callable(method):
+            raise ValueError("'%s' is not a job of %s" % (job, type(self).__name__))
+        return method
+    
+    
+    def batch(self, calls, max_workers=None):
+        """Execute the given jobs concurrently and return their results in the same order.
+        
+        calls must be an iterable of tuple (job, kwargs), where job is the name of a method of
+        WimsAPI and kwargs a dictionary containing its arguments, e.g.:
+        
+            api.batch([("getuser", {"qclass": 9001, "rclass": "myclass", "quser": "jdoe"}),
+                       ("getsheet", {"qclass": 9001, "rclass": "myclass", "qsheet": 1})])
+        
+        The jobs are executed on a pool of at most max_workers threads (defaults to
+        pool_maxsize, so that every thread can keep its own connection alive).
+        
+        Each element of the returned list is either the tuple returned by the corresponding
+        job, or the exception it raised."""
+        calls = [(self._job(job), kwargs) for job, kwargs in calls]
+        if not calls:
+            return []
+        
+        max_workers = min(max_workers or self.pool_maxsize, len(calls))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(tracing.propagate(method), **kwargs)
+                       for method, kwargs in calls]
+        
+        return [f.exception() or f.result() for f in futures]
+    
+    
+    def map(self, job, kwargs_list, max_workers=None):
+        """Execute job concurrently once for each dictionary of arguments in kwargs_list.
+        
+        Shortcut for batch([(job, kwargs) for kwargs in kwargs_list], max_workers)."""
+        return self.batch([(job, kwargs) for kwargs in kwargs_list], max_workers)
     
     
     @property
@@ -183,9 +546,7 @@ class WimsAPI:
             },
             **({'qclass': qclass} if qclass is not None else {})
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def addexam(self, qclass, rclass, exam_info, verbose=False, code=None, **kwargs):
@@ -210,9 +571,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in exam_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def addexo(self, qclass, rclass, qexo, exo_src, no_build=False, verbose=False, code=None,
@@ -240,9 +599,7 @@ class WimsAPI:
         }
         if no_build:
             params['option'] = 'no_build'
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def addsheet(self, qclass, rclass, sheet_info, verbose=False, code=None, **kwargs):
@@ -294,9 +651,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in sheet_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def adduser(self, qclass, rclass, quser, user_info, verbose=False, code=None, **kwargs):
@@ -336,9 +691,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in user_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def authuser(self, qclass, rclass, quser, hashlogin=None, verbose=False, code=None, ip=None,
@@ -375,9 +728,7 @@ class WimsAPI:
         }
         if hashlogin:
             params['hashlogin'] = hashlogin
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def buildexos(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -395,9 +746,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def checkclass(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -415,9 +764,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def checkexam(self, qclass, rclass, qexam, verbose=False, code=None, **kwargs):
@@ -437,9 +784,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def checkident(self, verbose=False, code=None, **kwargs):
@@ -448,9 +793,7 @@ class WimsAPI:
             **self.params,
             **{'job': 'checkident', 'code': code if code else random_code()}
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def checksheet(self, qclass, rclass, qsheet, verbose=False, code=None, **kwargs):
@@ -470,9 +813,7 @@ class WimsAPI:
                 'qsheet': qsheet,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def checkuser(self, qclass, rclass, quser, verbose=False, code=None, **kwargs):
@@ -492,9 +833,7 @@ class WimsAPI:
                 'quser':  quser,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def cleanclass(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -512,9 +851,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def copyclass(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -532,9 +869,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def delclass(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -552,9 +887,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def delexam(self, qclass, rclass, qexam, verbose=False, code=None, **kwargs):
@@ -574,9 +907,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def delexo(self, qclass, rclass, qexo, verbose=False, code=None, **kwargs):
@@ -596,9 +927,7 @@ class WimsAPI:
                 'qexo':   qexo,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def delsheet(self, qclass, rclass, qsheet, verbose=False, code=None, **kwargs):
@@ -619,9 +948,7 @@ class WimsAPI:
                 'qsheet': qsheet,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def deluser(self, qclass, rclass, quser, verbose=False, code=None, **kwargs):
@@ -641,9 +968,7 @@ class WimsAPI:
                 'quser':  quser,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getclass(self, qclass, rclass, options=None, verbose=False, code=None, **kwargs):
@@ -674,9 +999,7 @@ class WimsAPI:
         }
         if options:
             params['option'] = ','.join(options)
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getclassesuser(self, rclass, quser, verbose=False, code=None, **kwargs):
@@ -705,9 +1028,7 @@ class WimsAPI:
                 'quser':  quser,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getclassfile(self, qclass, rclass, filename, code=None, **kwargs):
@@ -728,12 +1049,26 @@ class WimsAPI:
                 'option': filename,
             }
         }
-        request = post(self.url, data=params, stream=True, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, return_request=True)
-        return (
-            response['status'] == 'OK' if isinstance(response, dict) else True,
-            response if isinstance(response, dict) else request.content
-        )
+        return self._call_file(params, **kwargs)
+    
+    
+    def getclassfile_stream(self, qclass, rclass, filename, chunk_size=65536, progress=None,
+                            checksum=None, code=None, **kwargs):
+        """Same as getclassfile(), but the file is streamed instead of being loaded in memory.
+        
+        Return a tuple (True, wimsapi.stream.FileStream) if WIMS sent the file, the stream must
+        be fully read or closed to release the connection. For more information, see
+        WimsAPI.getclassfile() documentation.
+        
+        Parameters:
+            chunk_size - (int) maximum size in bytes of each chunk read (defaults to 65536).
+            progress - (callable) called as progress(size, total) after each chunk, where size is
+                       the number of bytes read so far and total the size given by WIMS (None if
+                       unknown).
+            checksum - (str) name of a hashlib algorithm (e.g. 'sha256') used to compute the
+                       checksum while streaming, available through FileStream.hexdigest()."""
+        stream = {'chunk_size': chunk_size, 'progress': progress, 'checksum': checksum}
+        return self.getclassfile(qclass, rclass, filename, code, _stream=stream, **kwargs)
     
     
     def getclassmodif(self, qclass, rclass, date, verbose=False, code=None, **kwargs):
@@ -753,9 +1088,7 @@ class WimsAPI:
                 'data1':  date,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getclasstgz(self, qclass, rclass, code=None, **kwargs):
@@ -773,12 +1106,27 @@ class WimsAPI:
                 'qclass': qclass,
             }
         }
-        request = post(self.url, data=params, stream=True, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, return_request=True)
-        return (
-            response['status'] == 'OK' if isinstance(response, dict) else True,
-            response if isinstance(response, dict) else request.content
-        )
+        return self._call_file(params, **kwargs)
+    
+    
+    def getclasstgz_stream(self, qclass, rclass, chunk_size=65536, progress=None, checksum=None,
+                           code=None, **kwargs):
+        """Same as getclasstgz(), but the archive is streamed instead of being loaded in
+        memory.
+        
+        Return a tuple (True, wimsapi.stream.FileStream) if WIMS sent the archive, the stream must
+        be fully read or closed to release the connection. For more information, see
+        WimsAPI.getclasstgz() documentation.
+        
+        Parameters:
+            chunk_size - (int) maximum size in bytes of each chunk read (defaults to 65536).
+            progress - (callable) called as progress(size, total) after each chunk, where size is
+                       the number of bytes read so far and total the size given by WIMS (None if
+                       unknown).
+            checksum - (str) name of a hashlib algorithm (e.g. 'sha256') used to compute the
+                       checksum while streaming, available through FileStream.hexdigest()."""
+        stream = {'chunk_size': chunk_size, 'progress': progress, 'checksum': checksum}
+        return self.getclasstgz(qclass, rclass, code, _stream=stream, **kwargs)
     
     
     def getcsv(self, qclass, rclass, options, frmt='csv', code=None, **kwargs):
@@ -831,12 +1179,51 @@ class WimsAPI:
         }
         if options:
             params['option'] = ','.join(options)
-        request = post(self.url, data=params, stream=True, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, return_request=True)
-        return (
-            response['status'] == 'OK' if isinstance(response, dict) else True,
-            response if isinstance(response, dict) else request.content
-        )
+        return self._call_file(params, **kwargs)
+    
+    
+    def getcsv_stream(self, qclass, rclass, options, frmt='csv', chunk_size=65536, progress=None,
+                      checksum=None, code=None, **kwargs):
+        """Same as getcsv(), but the spreadsheet is streamed instead of being loaded in memory.
+        
+        Return a tuple (True, wimsapi.stream.FileStream) if WIMS sent the spreadsheet, the stream
+        must be fully read or closed to release the connection. For more information, see
+        WimsAPI.getcsv() documentation.
+        
+        Parameters:
+            chunk_size - (int) maximum size in bytes of each chunk read (defaults to 65536).
+            progress - (callable) called as progress(size, total) after each chunk, where size is
+                       the number of bytes read so far and total the size given by WIMS (None if
+                       unknown).
+            checksum - (str) name of a hashlib algorithm (e.g. 'sha256') used to compute the
+                       checksum while streaming, available through FileStream.hexdigest()."""
+        stream = {'chunk_size': chunk_size, 'progress': progress, 'checksum': checksum}
+        return self.getcsv(qclass, rclass, options, frmt, code, _stream=stream, **kwargs)
+    
+    
+    def getcsv_rows(self, qclass, rclass, options, frmt='csv', namedtuples=False,
+                    encoding='utf-8', chunk_size=65536, code=None, **kwargs):
+        """Same as getcsv(), but the spreadsheet is streamed and parsed row by row.
+        
+        Return a tuple (True, wimsapi.stream.CsvRows) if WIMS sent the spreadsheet, an iterator
+        yielding one dictionary (or namedtuple) per user, mapping the names of the columns to
+        their values. The description row and the blank row are skipped, and score columns
+        (average0, exam1, sheet1, manual1, ...) are converted to float (None if there is no
+        score). The iterator must be exhausted or closed to release the connection. For more
+        information, see WimsAPI.getcsv() documentation.
+        
+        Parameters:
+            frmt - (str) output format ('csv' or 'tsv', defaults to csv).
+            namedtuples - (bool) yield namedtuples instead of dictionaries (defaults to False).
+            encoding - (str) encoding of the spreadsheet (defaults to utf-8).
+            chunk_size - (int) maximum size in bytes of each chunk read (defaults to 65536)."""
+        if frmt not in CSV_DELIMITERS:
+            raise ValueError("frmt must be one of %s" % ", ".join(CSV_DELIMITERS))
+        status, response = self.getcsv_stream(qclass, rclass, options, frmt, chunk_size,
+                                              code=code, **kwargs)
+        if not isinstance(response, FileStream):
+            return status, response
+        return True, CsvRows(response, frmt, encoding, namedtuples)
     
     
     def getexam(self, qclass, rclass, qexam, verbose=False, code=None, **kwargs):
@@ -856,9 +1243,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getexamlog(self, qclass, rclass, quser, qexam, verbose=False, code=None, **kwargs):
@@ -880,9 +1265,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getexamscores(self, qclass, rclass, qexam, verbose=False, code=None, **kwargs):
@@ -902,9 +1285,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getexo(self, qclass, rclass, qsheet, qexo, verbose=False, code=None, **kwargs):
@@ -926,9 +1307,7 @@ class WimsAPI:
                 'qexo':   qexo,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getexofile(self, qclass, rclass, qexo, code=None, **kwargs):
@@ -948,12 +1327,26 @@ class WimsAPI:
                 'qexo':   qexo,
             }
         }
-        request = post(self.url, data=params, stream=True, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, return_request=True)
-        return (
-            response['status'] == 'OK' if isinstance(response, dict) else True,
-            response if isinstance(response, dict) else request.content
-        )
+        return self._call_file(params, **kwargs)
+    
+    
+    def getexofile_stream(self, qclass, rclass, qexo, chunk_size=65536, progress=None,
+                          checksum=None, code=None, **kwargs):
+        """Same as getexofile(), but the source is streamed instead of being loaded in memory.
+        
+        Return a tuple (True, wimsapi.stream.FileStream) if WIMS sent the source, the stream must
+        be fully read or closed to release the connection. For more information, see
+        WimsAPI.getexofile() documentation.
+        
+        Parameters:
+            chunk_size - (int) maximum size in bytes of each chunk read (defaults to 65536).
+            progress - (callable) called as progress(size, total) after each chunk, where size is
+                       the number of bytes read so far and total the size given by WIMS (None if
+                       unknown).
+            checksum - (str) name of a hashlib algorithm (e.g. 'sha256') used to compute the
+                       checksum while streaming, available through FileStream.hexdigest()."""
+        stream = {'chunk_size': chunk_size, 'progress': progress, 'checksum': checksum}
+        return self.getexofile(qclass, rclass, qexo, code, _stream=stream, **kwargs)
     
     
     def getexosheet(self, qclass, rclass, qsheet, qexo, verbose=False, code=None, **kwargs):
@@ -975,9 +1368,7 @@ class WimsAPI:
                 'qexo':   qexo,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getinfoserver(self, verbose=False, code=None, **kwargs):
@@ -989,9 +1380,7 @@ class WimsAPI:
                 'code': code if code else random_code(),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getlog(self, qclass, rclass, quser, verbose=False, code=None, **kwargs):
@@ -1011,9 +1400,7 @@ class WimsAPI:
                 'quser':  quser,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getmodule(self, module, verbose=False, code=None, **kwargs):
@@ -1029,9 +1416,7 @@ class WimsAPI:
                 'option': module,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getscore(self, qclass, rclass, quser, qsheet=None, verbose=False, code=None, **kwargs):
@@ -1057,9 +1442,7 @@ class WimsAPI:
         }
         if qsheet is not None:
             params['qsheet'] = qsheet
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getscores(self, qclass, rclass, options, code=None, **kwargs):
@@ -1096,9 +1479,7 @@ class WimsAPI:
         }
         if options:
             params['option'] = ','.join(options)
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getsheetscores(self, qclass, rclass, qsheet, verbose=False, code=None, **kwargs):
@@ -1118,9 +1499,7 @@ class WimsAPI:
                 'qsheet': qsheet,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getsheetstats(self, qclass, rclass, qsheet, verbose=False, code=None, **kwargs):
@@ -1140,9 +1519,7 @@ class WimsAPI:
                 'qsheet': qsheet,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def gettime(self, verbose=False, code=None, **kwargs):
@@ -1156,9 +1533,7 @@ class WimsAPI:
                 'code': code if code else random_code(),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def getuser(self, qclass, rclass, quser, options=None, verbose=False, code=None, **kwargs):
@@ -1188,9 +1563,7 @@ class WimsAPI:
         }
         if options:
             params['option'] = ','.join(options)
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def lightpopup(self, qclass, rclass, quser, session, exercice, about=True, code=None, **kwargs):
@@ -1219,12 +1592,7 @@ class WimsAPI:
                 'option':  'about' if about else 'noabout',
             }
         }
-        request = post(self.url, data=params, stream=True, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, return_request=True)
-        return (
-            response['status'] == 'OK' if isinstance(response, dict) else True,
-            response if isinstance(response, dict) else request.content
-        )
+        return self._call_file(params, **kwargs)
     
     
     def linkexo(self, qclass, rclass, qsheet, qexo, qexam, verbose=False, code=None, **kwargs):
@@ -1248,9 +1616,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def linksheet(self, qclass, rclass, qsheet, qexam, verbose=False, code=None, **kwargs):
@@ -1273,12 +1639,10 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
-    def listclasses(self, rclass, verbose=False, code=None, **kwargs):
+    def listclasses(self, rclass, options=None, verbose=False, code=None, **kwargs):
         """List all the classes having connection with rclass.
         
         Optionally, the parameter 'options' may contain the names of fields
@@ -1302,9 +1666,9 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        if options:
+            params['option'] = ','.join(options)
+        return self._call(params, verbose, **kwargs)
     
     
     def listexams(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -1322,9 +1686,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def listexos(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -1342,9 +1704,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def listlinks(self, qclass, rclass, qsheet, qexam, verbose=False, code=None, **kwargs):
@@ -1367,9 +1727,7 @@ class WimsAPI:
                 'qexam':  qexam,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def listmodules(self, level='H4', verbose=False, code=None, **kwargs):
@@ -1387,9 +1745,7 @@ class WimsAPI:
                 'option': level,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def listsheets(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -1407,9 +1763,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def modclass(self, qclass, rclass, class_info, verbose=False, code=None, **kwargs):
@@ -1444,9 +1798,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in class_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def modexam(self, qclass, rclass, qexam, exam_info, verbose=False, code=None, **kwargs):
@@ -1473,9 +1825,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in exam_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def modexosheet(self, verbose=False, code=None, **kwargs):
@@ -1520,9 +1870,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in sheet_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def moduser(self, qclass, rclass, quser, user_info, verbose=False, code=None, **kwargs):
@@ -1561,9 +1909,7 @@ class WimsAPI:
                 'data1':  '\n'.join([str(k) + "=" + str(v) for k, v in user_info.items()]),
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def movexo(self, qclass, qclass2, rclass, qsheet, copy=False, verbose=False, code=None,
@@ -1592,9 +1938,7 @@ class WimsAPI:
         }
         if copy:
             params['option'] = 'copy'
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def movexos(self, qclass, qclass2, rclass, copy=False, verbose=False, code=None, **kwargs):
@@ -1620,18 +1964,22 @@ class WimsAPI:
         }
         if copy:
             params['option'] = 'copy'
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
-    def putcsv(self, qclass, rclass, csv, file=True, verbose=False, code=None, **kwargs):
+    def putcsv(self, qclass, rclass, csv, file=True, verbose=False, code=None, encoding='utf-8',
+               **kwargs):
         """Put data into the class.
         
         csv should respect this format: The first row of the table contains
         the names of the fields. The second row gives short
         descriptions of each field. The second row is blank.
         The rest is the table content, with one row for each user.
+        
+        The csv is never loaded in memory as a whole: it is encoded chunk by chunk into a
+        temporary file, kept in memory up to 1 MiB and written on disk beyond. Rows can be built
+        from users with wimsapi.User.csv_rows().
+        
         The following data columns can be included in the csv, with their respective meanings:
             login       : user identifiers
             password    : user passwords (uncrypted)
@@ -1656,10 +2004,12 @@ class WimsAPI:
             qclass - (int) identifier of the class on the receiving server.
             rclass - (str) identifier of the class on the sending server.
             csv	   - (str) path to a csv if 'file' is True (default), content of a csv otherwise.
-            file   - (bool) Whether csv must be interpreted as a path to a csv or a .csv string"""
-        if file:
-            with open(csv) as f:
-                csv = f.read()
+                     Can also be a text or binary file object, or an iterable of rows (each row
+                     being a sequence of fields).
+            file   - (bool) Whether a str csv must be interpreted as a path to a csv or a .csv
+                     string
+            encoding - (str) encoding of the csv file if csv is a path or a binary file object
+                       (defaults to utf-8)."""
         params = {
             **self.params,
             **{
@@ -1667,12 +2017,10 @@ class WimsAPI:
                 'code':   code if code else random_code(),
                 'qclass': qclass,
                 'rclass': rclass,
-                'data1':  csv,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        body = FormBody(params, 'data1', csv_chunks(csv, file, encoding))
+        return self._call_form(body, verbose, **kwargs)
     
     
     def putexo(self, qclass, rclass, qsheet, module, options=None, verbose=False, code=None,
@@ -1705,9 +2053,7 @@ class WimsAPI:
         if options:
             params['data1'] += ('\nparams='
                                 + '\n'.join([str(k) + "=" + str(v) for k, v in options.items()]))
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def recuser(self, qclass, rclass, quser, verbose=False, code=None, **kwargs):
@@ -1727,9 +2073,7 @@ class WimsAPI:
                 'quser':  quser,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def repairclass(self, qclass, rclass, verbose=False, code=None, **kwargs):
@@ -1747,9 +2091,7 @@ class WimsAPI:
                 'rclass': rclass,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def search(self, verbose=False, code=None, **kwargs):
@@ -1780,9 +2122,7 @@ class WimsAPI:
                 'data1':  qclass2,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def testexo(self, exo_src, verbose=False, code=None, **kwargs):
@@ -1798,9 +2138,7 @@ class WimsAPI:
                 'data1': exo_src,
             }
         }
-        request = post(self.url, data=params, **{**self.request_kwargs, **kwargs})
-        response = parse_response(request, verbose)
-        return response['status'] == 'OK', response
+        return self._call(params, verbose, **kwargs)
     
     
     def update(self, verbose=False, code=None, **kwargs):
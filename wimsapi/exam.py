@@ -4,6 +4,7 @@ import sys
 from .exceptions import AdmRawError, NotSavedError
 from .item import ClassItemABC
 from .score import ExamScore
+from .tracing import traced
 from .user import User
 from .utils import one_year_later
 
@@ -19,6 +20,8 @@ class Exam(ClassItemABC):
         duration - (int) duration of each attempt of the exam in minutes (defaults to 60)
         attempts - (int) number of possible attempts for this exam (defaults to 1)"""
     
+    _id_attribute = 'qexam'
+    
     
     def __init__(self, title=None, description=None, expiration=None, duration=60, attempts=1,
                  exammode=0, **kwargs):
@@ -84,22 +87,38 @@ class Exam(ClassItemABC):
         return hash((self._class.qclass, self.qexam))
     
     
+    def _load_call(self):
+        return ("getexam", {'qclass': self._class.qclass, 'rclass': self._class.rclass,
+                            'qexam': self.qexam, 'verbose': True})
+    
+    
+    def _load(self, response):
+        new = self._build(self._class, response)
+        del self.__dict__['_lazy']
+        for k, v in new.__dict__.items():
+            self.__dict__.setdefault(k, v)
+        self._persisted = new._persisted
+    
+    
+    @traced
     def refresh(self):
         """Refresh this instance of a WIMS Exam from the server itself."""
         if not self.wclass:
             raise NotSavedError("Can't refresh unsaved exam")
         
-        new = Exam.get(self._class, self.qexam)
+        new = Exam._fetch(self._class, self.qexam)
         self.__class__ = new.__class__
         self.__dict__ = new.__dict__
         
         return self
     
     
-    def _to_payload(self):
-        return {k: v for k, v in self.__dict__.items() if k not in ['qexam', '_saved', '_class']}
+    def _payload(self):
+        return {k: v for k, v in self.__dict__.items()
+                if not k.startswith('_') and k not in ['qexam', 'wclass', 'exos']}
     
     
+    @traced
     def save(self, wclass=None, check_exists=True):
         """Save the Exam in the given class.
 
@@ -110,7 +129,12 @@ class Exam(ClassItemABC):
 
         If check_exists is True, the api will check if a exam with the same ID
         exists on the WIMS' server. If it exists, save will instead modify this
-        exam instead of trying to create new one."""
+        exam instead of trying to create new one. No request is sent for this check if the exam
+        is already known to exist in wclass (it was loaded from or saved in wclass), or if the
+        existence cache of wclass has been primed (see Class.primeitems()).
+        
+        If the exam was loaded from or saved in wclass, only the fields modified since then are
+        sent, and no request is sent at all if none was."""
         if not wclass and not self._class:
             raise NotSavedError("wclass must be provided if this exam has neither been imported "
                                 "from a WIMS class nor saved once yet")
@@ -120,12 +144,16 @@ class Exam(ClassItemABC):
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to save a exam")
         
-        if wclass is not None and check_exists:
-            self._saved = wclass.checkitem(self)
+        changes = self._changes(wclass)
+        if not changes:
+            return
+        
+        if not self._known(wclass):
+            self._saved = check_exists and wclass.checkitem(self)
         
         if self._saved:
             status, response = wclass._api.modexam(
-                wclass.qclass, wclass.rclass, self.qexam, self._to_payload(), verbose=True)
+                wclass.qclass, wclass.rclass, self.qexam, changes, verbose=True)
         else:
             status, response = wclass._api.addexam(
                 wclass.qclass, wclass.rclass, self._to_payload(), verbose=True)
@@ -134,10 +162,14 @@ class Exam(ClassItemABC):
             raise AdmRawError(response['message'])
         
         self.qexam = response['exam_id'] if "exam_id" in response else response["queryexam"]
+        wclass._record(type(self), self.qexam, True)
+        self._persist()
+        self._saved = True
         self._class = wclass
         self.wclass = True
     
     
+    @traced
     def delete(self):
         """Delete the exam from its associated WIMS class on the server."""
         if not self.wclass:
@@ -148,11 +180,14 @@ class Exam(ClassItemABC):
         if not status:
             raise AdmRawError(response['message'])
         
+        self._class._forget(type(self), self.qexam)
+        self._saved = False
         self.wclass = False
         self._class = None
     
     
     @classmethod
+    @traced
     def check(cls, wclass, exam):
         """Returns True if exam is in wclass, False otherwise.
 
@@ -176,6 +211,7 @@ class Exam(ClassItemABC):
     
     
     @classmethod
+    @traced
     def remove(cls, wclass, exam):
         """Remove the exam from wclass.
 
@@ -190,19 +226,43 @@ class Exam(ClassItemABC):
         status, response = wclass._api.delexam(wclass.qclass, wclass.rclass, qexam, verbose=True)
         if not status:
             raise AdmRawError(response['message'])
+        
+        wclass._forget(cls, qexam)
+        if isinstance(exam, cls):
+            exam._saved = False
     
     
     @classmethod
+    @traced
     def get(cls, wclass, qexam):
-        """Returns an instance of Exam corresponding to qexam in wclass."""
+        """Returns an instance of Exam corresponding to qexam in wclass.
+        
+        The exam is kept in the identity map of wclass: getting it again returns the same
+        instance without sending any request (see Class.invalidate())."""
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to get a exam")
         
+        exam = wclass._cached(cls, qexam)
+        if exam is None:
+            exam = wclass._remember(cls, qexam, cls._fetch(wclass, qexam))
+        return exam
+    
+    
+    @classmethod
+    def _fetch(cls, wclass, qexam):
+        """Return a new instance of Exam corresponding to qexam in wclass, fetched from the
+        server."""
         status, exam_info = wclass._api.getexam(wclass.qclass, wclass.rclass, qexam,
                                                 verbose=True)
         if not status:
             raise AdmRawError(exam_info['message'])
         
+        return cls._build(wclass, exam_info)
+    
+    
+    @classmethod
+    def _build(cls, wclass, exam_info):
+        """Return an instance of Exam of wclass from the response of getexam."""
         duplicate = dict(exam_info)
         for k, v in duplicate.items():
             if k.startswith("exam_"):
@@ -212,31 +272,66 @@ class Exam(ClassItemABC):
         exam = Exam(**exam_info)
         exam.qexam = exam_info["query_exam"]
         exam._class = wclass
+        exam._saved = True
+        exam.wclass = True
+        exam._persist()
+        return exam
+    
+    
+    @classmethod
+    def _partial(cls, wclass, qexam):
+        """Return an instance of Exam of wclass only knowing its identifier, without sending any
+        request. Its other attributes are loaded on first access to any of them."""
+        exam = cls.__new__(cls)
+        exam._lazy = True
+        exam._class = wclass
+        exam._saved = True
         exam.wclass = True
+        exam.qexam = qexam
+        exam._persisted = dict()
         return exam
     
     
     @classmethod
-    def list(cls, wclass):
-        """Returns a list of every Exam of wclass."""
+    def _identifiers(cls, wclass):
         status, response = wclass._api.listexams(wclass.qclass, wclass.rclass, verbose=True)
         if not status:
             raise AdmRawError(response['message'])
+        return [qexam for qexam in response["examlist"] if qexam != '']
+    
+    
+    @classmethod
+    @traced
+    def list(cls, wclass, lazy=False):
+        """Returns a list of every Exam of wclass.
+        
+        The exams missing from the identity map of wclass are fetched concurrently. If lazy is
+        True, they are not fetched: each exam is loaded on first access to any attribute other
+        than qexam (see Class.loaditems() to load several of them at once).
         
-        return [cls.get(wclass, qexam) for qexam in response["examlist"] if qexam != '']
+        The existence cache of wclass is primed with the listed exams (see
+        Class.primeitems())."""
+        qexams = cls._identifiers(wclass)
+        wclass._prime(cls, qexams)
+        exams = [wclass._remember(cls, qexam, cls._partial(wclass, qexam)) for qexam in qexams]
+        return exams if lazy else wclass.loaditems(exams)
     
     
+    @traced
     def scores(self, user=None):
         """Returns a list of ExamScore for every user. If user is given returns only its
         SheetScore.
         
-        user can either be an instance of wimsapi.User or its quser."""
+        user can either be an instance of wimsapi.User or its quser.
+        
+        Scores are fetched with a single request. The users of the scores are taken from the
+        identity map of the class, those which are not are only loaded when one of their
+        properties (other than quser) is accessed."""
         if not self.wclass:
             raise NotSavedError("Sheet must be saved before being able to retrieve scores")
         
         quser = user.quser if isinstance(user, User) else user
-        if quser is not None and not self._class.checkitem(quser, User):  # Checks that quser exists
-            raise ValueError("User '%s' does not exists in class '%s'" % (user, self._class.qclass))
+        given = user if isinstance(user, User) else None
         
         status, response = self._class._api.getexamscores(self._class.qclass, self._class.rclass,
                                                           self.qexam, verbose=True)
@@ -248,7 +343,12 @@ class Exam(ClassItemABC):
             # Ignore score of other users if quser is given
             if quser is not None and data['id'] != quser:
                 continue
-            user = self._class.getitem(data['id'], User)
-            scores.append(ExamScore(self, user, data["score"], data["attempts"]))
+            # Users are only loaded if one of their properties is accessed
+            score_user = given if given is not None else self._class._remember(
+                User, data['id'], User._partial(self._class, data['id'])
+            )
+            scores.append(ExamScore(self, score_user, data["score"], data["attempts"]))
         
+        if quser is not None and not scores:
+            raise ValueError("User '%s' does not exists in class '%s'" % (user, self._class.qclass))
         return scores[0] if quser is not None else scores
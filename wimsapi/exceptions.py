@@ -43,6 +43,14 @@ class InvalidItemTypeError(WimsAPIError):
     pass
 
 
+
 class InvalidIdentifier(WimsAPIError):
     """Raised when an identifier containing invalid character is sent to WIMS."""
     pass
+
+
+
+class CircuitOpenError(WimsAPIError):
+    """Raised when a request is not sent because the circuit breaker considers the WIMS server
+    as down."""
+    pass
@@ -0,0 +1,989 @@
+"""Stateful stand-in for the adm/raw module of WIMS, to develop, test and benchmark code using
+wimsapi without a WIMS server.
+
+FakeWims keeps classes, users, sheets, exams, scores and logs in memory and answers the jobs of
+adm/raw with the same JSON responses as WIMS. It is a transport (see wimsapi.transport), and can
+thus be used in-process:
+
+    fake = FakeWims("myself", "toto")
+    api = WimsAPI("http://fake/wims.cgi", "myself", "toto", transport=fake)
+
+It can also be served over HTTP on a local port, e.g. for AsyncWimsAPI or another process:
+
+    with FakeWimsServer(fake) as server:
+        c = Class.get(server.url, "myself", "toto", 9001, "myclass")
+
+Latency and failures can be injected to exercise the retry policy, the circuit breaker and the
+rate limiter, see FakeWims."""
+
+import copy
+import csv
+import datetime
+import io
+import json
+import random
+import re
+import string
+import tarfile
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from .transport import Transport, form_fields, split_chunks
+from .user import CSV_COLUMNS
+from .utils import one_year_later
+
+
+SERVER_VERSION = "4.29"
+
+FAILURES = ('html', 'disconnect', 'timeout')
+
+CLASS_FIELDS = OrderedDict([
+    ('password', ''), ('creator', ''), ('secure', 'all'), ('external_auth', ''),
+    ('mixed_external_auth', ''), ('cas_auth', ''), ('php_auth', ''), ('authidp', ''),
+    ('supervisor', ''), ('description', ''), ('institution', ''), ('lang', 'en'), ('email', ''),
+    ('expiration', ''), ('limit', '30'), ('topscores', ''), ('superclass', ''), ('type', ''),
+    ('level', 'H4'), ('parent', ''), ('typename', 'class'), ('bgcolor', ''), ('bgimg', ''),
+    ('scorecolor', ''), ('css', ''), ('logo', ''), ('logoside', ''), ('refcolor', ''),
+    ('ref_menucolor', ''), ('ref_button_color', ''), ('ref_button_bgcolor', ''),
+    ('ref_button_help_color', ''), ('ref_button_help_bgcolor', ''), ('theme', 'standard'),
+    ('theme_icon', ''), ('connections', ''), ('creation', ''),
+])
+
+USER_FIELDS = OrderedDict([
+    ('firstname', ''), ('lastname', ''), ('email', ''), ('comments', ''), ('regnum', ''),
+    ('photourl', ''), ('participate', ''), ('password', ''), ('courses', ''), ('classes', ''),
+    ('supervise', ''), ('supervisable', 'no'), ('external_auth', ''), ('agreecgu', 'yes'),
+    ('regprop1', ''), ('regprop2', ''), ('regprop3', ''), ('regprop4', ''), ('regprop5', ''),
+])
+
+SHEET_FIELDS = OrderedDict([
+    ('title', ''), ('description', ''), ('expiration', ''), ('status', '0'), ('weight', '1'),
+    ('formula', '2'), ('indicator', '1'), ('contents', ''),
+])
+
+EXAM_FIELDS = OrderedDict([
+    ('title', ''), ('description', ''), ('expiration', ''), ('status', '0'), ('duration', '60'),
+    ('attempts', '1'),
+])
+
+SHEET_FORMULAS = ["max(I,Q)", "I", "I*Q^0.3", "I*Q^0.5", "I*Q", "I^2*Q", "I*Q^2"]
+
+SCORE_COLUMNS = {
+    'averages': ['average0', 'average1', 'average2'],
+    'allscore': ['average0', 'average1', 'average2', 'exams', 'sheets', 'manuals'],
+}
+
+QUSER_INVALID = re.compile(r"[^A-Za-z0-9_.\-]")
+
+
+
+class AdmRawJobError(Exception):
+    """Raised by the jobs of FakeWims to answer with an adm/raw error."""
+
+
+
+def parse_data(data):
+    """Parse the 'key=value' lines of the data1 / data2 fields of a request."""
+    parsed = OrderedDict()
+    for line in data.split('\n'):
+        if '=' in line:
+            key, _, value = line.partition('=')
+            parsed[key.strip()] = value
+    return parsed
+
+
+
+class _FakeClass:
+    """State of a class hosted by FakeWims."""
+    
+    
+    def __init__(self, qclass, rclass, fields, supervisor):
+        self.qclass = qclass
+        self.rclass = rclass
+        self.fields = fields
+        self.supervisor = supervisor
+        self.users = OrderedDict()
+        self.trash = OrderedDict()
+        self.sheets = OrderedDict()
+        self.exams = OrderedDict()
+        self.sheet_scores = dict()
+        self.exam_scores = dict()
+        self.logs = dict()
+        self.exam_logs = dict()
+    
+    
+    def user(self, quser):
+        """Return the fields of quser, supervisor included."""
+        if quser == "supervisor":
+            return self.supervisor
+        if quser not in self.users:
+            raise AdmRawJobError('user %s not in this class (%s)' % (quser, self.qclass))
+        return self.users[quser]
+    
+    
+    def item(self, kind, identifier):
+        """Return the sheet or exam identified by identifier."""
+        items = self.sheets if kind == "sheet" else self.exams
+        if str(identifier) not in items:
+            raise AdmRawJobError('element #%s of type %s does not exist in this class (%s)'
+                                 % (identifier, kind, self.qclass))
+        return items[str(identifier)]
+
+
+
+class FakeWims(Transport):
+    """Stateful fake of the adm/raw module of WIMS, used as a transport.
+    
+    Every job creating, reading, modifying or deleting classes, users, sheets and exams is
+    implemented, as well as the jobs reading scores (getsheetscores, getexamscores, getscore,
+    getcsv), logs (getlog, getexamlog), putcsv, putexo, getclasstgz and the server jobs. Other
+    jobs are answered with an adm/raw error. Since FakeWims does not run exercises, scores and
+    logs are set with set_sheet_score(), set_exam_score() and add_log().
+    
+    Each request is delayed by latency seconds, then fails with a probability of error_rate.
+    A failure is chosen among failures:
+        html - an HTML error page is sent with the status 500.
+        disconnect - the connection is dropped without any response (requests.ConnectionError
+                     in-process).
+        timeout - no response is sent for timeout_delay seconds before the connection is
+                  dropped (requests.Timeout in-process, raised as soon as the timeout given to
+                  the request is exceeded).
+    Failures can also be scheduled with fail_next().
+    
+    The number of requests received for each job is counted in the attribute 'jobs' (a
+    collections.Counter).
+    
+    Parameters:
+        ident - (str) identifier accepted by this server (defaults to 'myself').
+        passwd - (str) password accepted by this server (defaults to 'toto').
+        latency - (float / callable) delay in seconds added to each request, or a callable
+                  without argument returning this delay (e.g. lambda: random.expovariate(50)).
+        error_rate - (float) probability that a request fails (defaults to 0).
+        failures - (tuple) kinds of failures randomly chosen (defaults to every kind).
+        timeout_delay - (float) seconds a 'timeout' failure keeps the connection open when
+                        served over HTTP (defaults to 10).
+        seed - (int) seed of the random generator used for the failures and the generated
+               identifiers."""
+    
+    
+    def __init__(self, ident="myself", passwd="toto", latency=0, error_rate=0,
+                 failures=FAILURES, timeout_delay=10, seed=None):
+        for failure in failures:
+            if failure not in FAILURES:
+                raise ValueError("Unknown failure '%s', must be one of %s"
+                                 % (failure, ", ".join(FAILURES)))
+        self.ident = ident
+        self.passwd = passwd
+        self.latency = latency
+        self.error_rate = error_rate
+        self.failures = tuple(failures)
+        self.timeout_delay = timeout_delay
+        self.classes = OrderedDict()
+        self.jobs = Counter()
+        self._random = random.Random(seed)
+        self._scheduled = deque()
+        self._lock = threading.RLock()
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        fields = form_fields(fields)
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, tuple):
+            timeout = timeout[1]
+        
+        failure = self.prepare(fields, timeout)
+        if failure == "disconnect":
+            raise requests.ConnectionError("Connection dropped by FakeWims")
+        if failure == "timeout":
+            if timeout is not None:
+                time.sleep(timeout)
+            raise requests.Timeout("FakeWims did not answer in time")
+        
+        status, headers, body = self.html_error() if failure == "html" else self.respond(fields)
+        return status, headers, split_chunks(body, chunk_size) if chunk_size else body
+    
+    
+    def fail_next(self, failure="html", count=1, job=None):
+        """Make the next count requests (of job if given) fail with failure, regardless of
+        error_rate."""
+        if failure not in FAILURES:
+            raise ValueError("Unknown failure '%s', must be one of %s"
+                             % (failure, ", ".join(FAILURES)))
+        with self._lock:
+            self._scheduled.extend([(failure, job)] * count)
+    
+    
+    def prepare(self, fields, timeout=None):
+        """Count the request, wait for the latency and return the failure it must be answered
+        with, None if it must be answered normally.
+        
+        The wait is cut short once timeout seconds have elapsed, the request then fails with
+        'timeout'."""
+        job = fields.get('job')
+        with self._lock:
+            self.jobs[job] += 1
+            failure = None
+            for i, (scheduled, scheduled_job) in enumerate(self._scheduled):
+                if scheduled_job is None or scheduled_job == job:
+                    failure = scheduled
+                    del self._scheduled[i]
+                    break
+            if failure is None and self.error_rate and self._random.random() < self.error_rate:
+                failure = self._random.choice(self.failures)
+        
+        delay = self.latency() if callable(self.latency) else self.latency
+        if timeout is not None and delay > timeout and failure is None:
+            failure = "timeout"
+        if delay and failure != "timeout":
+            time.sleep(delay)
+        return failure
+    
+    
+    @staticmethod
+    def html_error():
+        """Return the response (status, headers, body) sent by Apache when the CGI fails."""
+        body = (b"<!DOCTYPE HTML PUBLIC \"-//IETF//DTD HTML 2.0//EN\">\n<html><head>\n"
+                b"<title>500 Internal Server Error</title>\n</head><body>\n"
+                b"<h1>Internal Server Error</h1>\n</body></html>\n")
+        return 500, {'Content-Type': 'text/html; charset=iso-8859-1'}, body
+    
+    
+    def respond(self, fields):
+        """Execute the job of the request fields (a dictionary of str) and return the response
+        (status, headers, body)."""
+        job = fields.get('job', '')
+        response = OrderedDict([('status', 'OK'), ('code', fields.get('code', '')), ('job', job)])
+        try:
+            if fields.get('module', 'adm/raw') != 'adm/raw':
+                raise AdmRawJobError("module must be adm/raw")
+            if fields.get('ident') != self.ident or fields.get('passwd') != self.passwd:
+                raise AdmRawJobError("bad identification")
+            method = getattr(self, "_job_" + job, None)
+            if method is None:
+                raise AdmRawJobError("job '%s' is not supported by FakeWims" % job)
+            with self._lock:
+                result = method(fields)
+        except AdmRawJobError as e:
+            response['status'] = 'ERROR'
+            response['message'] = str(e)
+            result = response
+        
+        if isinstance(result, tuple):
+            content_type, body = result
+            return 200, {'Content-Type': content_type, 'Content-Length': str(len(body))}, body
+        if result is not response:
+            response.update(result)
+        body = json.dumps(response).encode()
+        return 200, {'Content-Type': 'application/json; charset=utf-8'}, body
+    
+    
+    def _random_id(self, size, chars=string.digits):
+        return ''.join(self._random.choice(chars) for _ in range(size))
+    
+    
+    def _class(self, fields):
+        """Return the class targeted by the request, checking that rclass can access it."""
+        qclass = fields.get('qclass', '')
+        wclass = self.classes.get(qclass)
+        if wclass is None:
+            raise AdmRawJobError('class %s not existing' % qclass)
+        if wclass.rclass != fields.get('rclass'):
+            raise AdmRawJobError('connection refused by requested class (%s)' % qclass)
+        return wclass
+    
+    
+    @staticmethod
+    def _option(fields, available):
+        """Return the fields queried in option, every field of available if none."""
+        option = [o.strip() for o in fields.get('option', '').split(',') if o.strip()]
+        return [o for o in option if o in available] if option else list(available)
+    
+    
+    @staticmethod
+    def _update(target, data, known, aliases=None):
+        """Update target with the keys of data which are in known, returns the number of
+        modified keys."""
+        modified = 0
+        for key, value in data.items():
+            key = (aliases or {}).get(key, key)
+            if key in known:
+                target[key] = value
+                modified += 1
+        return modified
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Direct manipulation of the state
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def add_class(self, rclass, fields=None, supervisor=None, qclass=None):
+        """Create a class without sending a request and return its qclass.
+        
+        Parameters:
+            rclass - (str) identifier of the class on the sending server.
+            fields - (dict) fields of the class (see CLASS_FIELDS).
+            supervisor - (dict) fields of the supervisor (see USER_FIELDS).
+            qclass - (str) identifier of the class, randomly chosen if not given."""
+        with self._lock:
+            if qclass is None:
+                qclass = self._random_id(7)
+                while qclass in self.classes:
+                    qclass = self._random_id(7)
+            qclass = str(qclass)
+            if qclass in self.classes:
+                raise AdmRawJobError("class %s already exists" % qclass)
+            
+            class_fields = OrderedDict(CLASS_FIELDS)
+            class_fields['expiration'] = one_year_later()
+            class_fields['creation'] = datetime.date.today().strftime("%Y%m%d")
+            class_fields['creator'] = self.ident
+            self._update(class_fields, fields or {}, CLASS_FIELDS)
+            supervisor_fields = OrderedDict(USER_FIELDS)
+            supervisor_fields['supervisable'] = 'yes'
+            self._update(supervisor_fields, supervisor or {}, USER_FIELDS)
+            self.classes[qclass] = _FakeClass(qclass, rclass, class_fields, supervisor_fields)
+            return qclass
+    
+    
+    def add_user(self, qclass, quser, fields=None):
+        """Add an user to the class qclass without sending a request and return its quser.
+        
+        fields contains the properties of the user (see USER_FIELDS). Like WIMS, invalid
+        characters are removed from quser."""
+        with self._lock:
+            wclass = self.classes[str(qclass)]
+            quser = QUSER_INVALID.sub('', quser)
+            if not quser:
+                raise AdmRawJobError("invalid user identifier")
+            if quser == "supervisor" or quser in wclass.users:
+                raise AdmRawJobError("user %s already exists" % quser)
+            user = OrderedDict(USER_FIELDS)
+            self._update(user, fields or {}, USER_FIELDS)
+            wclass.users[quser] = user
+            return quser
+    
+    
+    def add_sheet(self, qclass, fields=None):
+        """Add a sheet to the class qclass without sending a request and return its qsheet.
+        
+        fields contains the properties of the sheet (see SHEET_FIELDS), 'sheetmode' is accepted
+        as an alias of 'status'."""
+        return self._add_item(qclass, "sheet", SHEET_FIELDS, fields, {'sheetmode': 'status'})
+    
+    
+    def add_exam(self, qclass, fields=None):
+        """Add an exam to the class qclass without sending a request and return its qexam.
+        
+        fields contains the properties of the exam (see EXAM_FIELDS), 'exammode' is accepted
+        as an alias of 'status'."""
+        return self._add_item(qclass, "exam", EXAM_FIELDS, fields, {'exammode': 'status'})
+    
+    
+    def _add_item(self, qclass, kind, defaults, fields, aliases):
+        with self._lock:
+            wclass = self.classes[str(qclass)]
+            items = wclass.sheets if kind == "sheet" else wclass.exams
+            identifier = str(max([int(i) for i in items] + [0]) + 1)
+            item = OrderedDict(defaults)
+            item['title'] = "%s %s" % (kind, identifier)
+            item['description'] = item['title']
+            item['expiration'] = one_year_later()
+            self._update(item, {k: str(v) for k, v in (fields or {}).items()}, defaults, aliases)
+            item['exos'] = []
+            items[identifier] = item
+            return identifier
+    
+    
+    def set_sheet_score(self, qclass, qsheet, quser, **scores):
+        """Set the scores of quser on the sheet qsheet, as sent by getsheetscores.
+        
+        scores may contain user_quality, user_percent, user_best, user_level and the lists
+        got_detail, mean_detail, best_detail, level_detail, last_detail and try_detail (one
+        value per exercise), missing values default to 0."""
+        with self._lock:
+            wclass = self.classes[str(qclass)]
+            wclass.user(quser)
+            wclass.item("sheet", qsheet)
+            wclass.sheet_scores.setdefault(str(qsheet), {}).setdefault(quser, {}).update(scores)
+    
+    
+    def set_exam_score(self, qclass, qexam, quser, score, attempts=1):
+        """Set the score of quser on the exam qexam."""
+        with self._lock:
+            wclass = self.classes[str(qclass)]
+            wclass.user(quser)
+            wclass.item("exam", qexam)
+            wclass.exam_scores.setdefault(str(qexam), {})[quser] = {
+                'score': score, 'attempts': attempts
+            }
+    
+    
+    def add_log(self, qclass, quser, line, qexam=None):
+        """Append line to the log of quser, or to its log of the exam qexam if given."""
+        with self._lock:
+            wclass = self.classes[str(qclass)]
+            wclass.user(quser)
+            if qexam is None:
+                wclass.logs.setdefault(quser, []).append(line)
+            else:
+                wclass.exam_logs.setdefault(quser, {}).setdefault(str(qexam), []).append(line)
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Server jobs
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def _job_checkident(self, fields):
+        return {'message': "Connection accepted"}
+    
+    
+    def _job_gettime(self, fields):
+        return {'server_time': datetime.datetime.now().strftime("%Y%m%d.%H:%M:%S")}
+    
+    
+    def _job_getinfoserver(self, fields):
+        return {'server_version': SERVER_VERSION}
+    
+    
+    def _job_listclasses(self, fields):
+        classes = []
+        for wclass in self.classes.values():
+            if wclass.rclass != fields.get('rclass'):
+                continue
+            entry = OrderedDict([('qclass', wclass.qclass)])
+            if 'option' in fields:
+                available = self._class_properties(wclass)
+                entry.update((k, available[k]) for k in self._option(fields, available))
+            classes.append(entry)
+        if not classes:
+            raise AdmRawJobError("there is no class allowed for this server")
+        return {'classes_list': classes}
+    
+    
+    def _job_getclassesuser(self, fields):
+        quser = fields.get('quser')
+        return {'classes_list': [
+            {'qclass': c.qclass} for c in self.classes.values()
+            if c.rclass == fields.get('rclass') and (quser == "supervisor" or quser in c.users)
+        ]}
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Classes
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def _job_addclass(self, fields):
+        qclass = self.add_class(fields.get('rclass'), parse_data(fields.get('data1', '')),
+                                parse_data(fields.get('data2', '')), fields.get('qclass') or None)
+        return {'message': "class %s correctly added" % qclass, 'class_id': qclass}
+    
+    
+    def _job_checkclass(self, fields):
+        self._class(fields)
+        return {'message': "Class exists"}
+    
+    
+    @staticmethod
+    def _class_properties(wclass):
+        """Return the properties of wclass sent by getclass."""
+        available = OrderedDict(wclass.fields)
+        available['rclass'] = wclass.rclass
+        available['userlist'] = list(wclass.users)
+        available['usercount'] = str(len(wclass.users))
+        available['examcount'] = str(len(wclass.exams))
+        available['sheetcount'] = str(len(wclass.sheets))
+        return available
+    
+    
+    def _job_getclass(self, fields):
+        wclass = self._class(fields)
+        available = self._class_properties(wclass)
+        return OrderedDict(
+            [('query_class', wclass.qclass)]
+            + [(k, available[k]) for k in self._option(fields, available)]
+        )
+    
+    
+    def _job_modclass(self, fields):
+        self._update(self._class(fields).fields, parse_data(fields.get('data1', '')),
+                     CLASS_FIELDS)
+        return {'message': "Modifications done"}
+    
+    
+    def _job_delclass(self, fields):
+        del self.classes[self._class(fields).qclass]
+        return {'message': "class %s correctly deleted" % fields['qclass']}
+    
+    
+    def _job_cleanclass(self, fields):
+        wclass = self._class(fields)
+        wclass.users.clear()
+        wclass.trash.clear()
+        wclass.sheet_scores.clear()
+        wclass.exam_scores.clear()
+        wclass.logs.clear()
+        wclass.exam_logs.clear()
+        return {'message': "class %s correctly cleaned" % wclass.qclass}
+    
+    
+    def _job_copyclass(self, fields):
+        wclass = self._class(fields)
+        qclass = self.add_class(wclass.rclass, wclass.fields, wclass.supervisor)
+        new = self.classes[qclass]
+        new.users = copy.deepcopy(wclass.users)
+        new.sheets = copy.deepcopy(wclass.sheets)
+        new.exams = copy.deepcopy(wclass.exams)
+        return {'message': "class %s correctly copied" % wclass.qclass, 'new_class': qclass}
+    
+    
+    def _job_getclasstgz(self, fields):
+        wclass = self._class(fields)
+        files = [(".def", wclass.fields), (".users/supervisor", wclass.supervisor)]
+        files += [(".users/" + quser, user) for quser, user in wclass.users.items()]
+        files += [("sheets/.sheet" + q, s) for q, s in wclass.sheets.items()]
+        files += [("exams/.exam" + q, e) for q, e in wclass.exams.items()]
+        
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            for name, data in files:
+                content = "\n".join("%s=%s" % (k, v) for k, v in data.items()).encode()
+                info = tarfile.TarInfo("%s/%s" % (wclass.qclass, name))
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return "application/x-gzip", archive.getvalue()
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Users
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def _job_adduser(self, fields):
+        wclass = self._class(fields)
+        data = parse_data(fields.get('data1', ''))
+        for mandatory in ('lastname', 'firstname', 'password'):
+            if not data.get(mandatory):
+                raise AdmRawJobError("%s of user %s is missing" % (mandatory, fields.get('quser')))
+        quser = self.add_user(wclass.qclass, fields.get('quser', ''), data)
+        return {'message': "user %s correctly added" % quser, 'user_id': quser}
+    
+    
+    def _job_checkuser(self, fields):
+        self._class(fields).user(fields.get('quser'))
+        return {'message': "user %s exists" % fields['quser']}
+    
+    
+    def _job_getuser(self, fields):
+        user = self._class(fields).user(fields.get('quser'))
+        available = [k for k in user if k != 'password']
+        if 'option' in fields:
+            available = self._option(fields, user)
+        return OrderedDict([('query_user', fields['quser'])] + [(k, user[k]) for k in available])
+    
+    
+    def _job_moduser(self, fields):
+        user = self._class(fields).user(fields.get('quser'))
+        self._update(user, parse_data(fields.get('data1', '')), USER_FIELDS)
+        return {'message': "Modifications done"}
+    
+    
+    def _job_deluser(self, fields):
+        wclass = self._class(fields)
+        quser = fields.get('quser')
+        if quser == "supervisor":
+            raise AdmRawJobError("supervisor can't be deleted")
+        wclass.trash[quser] = wclass.user(quser)
+        del wclass.users[quser]
+        return {'message': "User %s moved to trash." % quser}
+    
+    
+    def _job_recuser(self, fields):
+        wclass = self._class(fields)
+        quser = fields.get('quser')
+        if quser not in wclass.trash:
+            raise AdmRawJobError("user %s not in the trash of this class (%s)"
+                                 % (quser, wclass.qclass))
+        wclass.users[quser] = wclass.trash.pop(quser)
+        return {'message': "User successfully recovered"}
+    
+    
+    def _job_authuser(self, fields):
+        self._class(fields).user(fields.get('quser'))
+        session = self._random_id(10, string.ascii_uppercase + string.digits)
+        return {'wims_session': session, 'home_url': "?session=%s" % session}
+    
+    
+    def _job_getlog(self, fields):
+        wclass = self._class(fields)
+        quser = fields.get('quser')
+        wclass.user(quser)
+        return {'query_user': quser, 'user_log': list(wclass.logs.get(quser, []))}
+    
+    
+    def _job_getexamlog(self, fields):
+        wclass = self._class(fields)
+        quser = fields.get('quser')
+        wclass.user(quser)
+        logs = wclass.exam_logs.get(quser)
+        if not logs:
+            raise AdmRawJobError("the user %s hasn't any exam log in this class." % quser)
+        wclass.item("exam", fields.get('qexam'))
+        return {'query_user': quser, 'query_exam': fields['qexam'],
+                'exam_log': list(logs.get(fields['qexam'], []))}
+    
+    
+    def _job_getcsv(self, fields):
+        wclass = self._class(fields)
+        frmt = fields.get('frmt', 'csv')
+        if frmt not in ('csv', 'tsv'):
+            raise AdmRawJobError("format %s is not supported by FakeWims" % frmt)
+        
+        columns = []
+        for option in [o.strip() for o in fields.get('option', '').split(',') if o.strip()]:
+            for column in SCORE_COLUMNS.get(option, [option]):
+                if column == 'sheets':
+                    columns += ['sheet' + q for q in wclass.sheets]
+                elif column == 'exams':
+                    columns += ['exam' + q for q in wclass.exams]
+                elif column != 'manuals':
+                    columns.append(column)
+        
+        content = io.StringIO()
+        writer = csv.writer(content, delimiter=',' if frmt == 'csv' else '\t',
+                            lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerow([CSV_COLUMNS.get(c, c.capitalize()) for c in columns])
+        writer.writerow([])
+        for quser, user in wclass.users.items():
+            writer.writerow([self._csv_field(wclass, quser, user, c) for c in columns])
+        return "text/csv", content.getvalue().encode()
+    
+    
+    def _csv_field(self, wclass, quser, user, column):
+        if column == 'login':
+            return quser
+        if column == 'name':
+            return user['lastname'] + " " + user['firstname']
+        if column.startswith('sheet') and column[5:] in wclass.sheets:
+            scores = wclass.sheet_scores.get(column[5:], {}).get(quser)
+            return "" if scores is None else self._sheet_grade(wclass.sheets[column[5:]], scores)
+        if column.startswith('exam') and column[4:] in wclass.exams:
+            scores = wclass.exam_scores.get(column[4:], {}).get(quser)
+            return "" if scores is None else scores['score']
+        return user.get(column, "")
+    
+    
+    @staticmethod
+    def _sheet_grade(sheet, scores):
+        """Compute the grade (over 10) of a sheet, as done by WIMS."""
+        indicator = ('user_percent', 'user_best', 'user_level')[int(sheet['indicator'])]
+        formula = SHEET_FORMULAS[int(sheet['formula'])].replace("^", "**")
+        variables = {'I': scores.get(indicator, 0) / 100, 'Q': scores.get('user_quality', 0) / 10}
+        return round(10 * eval(formula, {'max': max}, variables), 2)
+    
+    
+    def _job_putcsv(self, fields):
+        wclass = self._class(fields)
+        data = fields.get('data1', '')
+        delimiter = '\t' if '\t' in data.partition('\n')[0] else ','
+        rows = csv.reader(io.StringIO(data), delimiter=delimiter)
+        header = [c.strip() for c in next(rows, [])]
+        next(rows, None)  # Descriptions of the fields
+        if 'login' not in header:
+            raise AdmRawJobError("the column login is mandatory")
+        
+        added = modified = 0
+        for row in rows:
+            if not any(field.strip() for field in row):
+                continue
+            row = dict(zip(header, row))
+            quser = row.pop('login')
+            if quser in wclass.users:
+                modified += 1
+            else:
+                quser = self.add_user(wclass.qclass, quser)
+                added += 1
+            self._update(wclass.users[quser], row, USER_FIELDS)
+        return {'message': "%d users added and %d users modified in class %s"
+                           % (added, modified, wclass.qclass)}
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Sheets
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def _job_addsheet(self, fields):
+        qsheet = self.add_sheet(self._class(fields).qclass, parse_data(fields.get('data1', '')))
+        return {'message': "sheet #%s correctly added" % qsheet, 'sheet_id': qsheet}
+    
+    
+    def _job_checksheet(self, fields):
+        self._class(fields).item("sheet", fields.get('qsheet'))
+        return {'message': "sheet %s exists" % fields['qsheet']}
+    
+    
+    def _job_getsheet(self, fields):
+        sheet = self._class(fields).item("sheet", fields.get('qsheet'))
+        available = OrderedDict([('exo_cnt', len(sheet['exos']))])
+        for key in ('status', 'expiration', 'title', 'description'):
+            available['sheet_' + key] = sheet[key]
+        available['exolist'] = [exo['module'] for exo in sheet['exos']]
+        for key in ('title', 'params', 'points', 'weight', 'description'):
+            available[key] = [exo[key] for exo in sheet['exos']]
+        return OrderedDict(
+            [('query_sheet', fields['qsheet'])]
+            + [(k, available[k]) for k in self._option(fields, available)]
+        )
+    
+    
+    def _job_listsheets(self, fields):
+        sheets = list(self._class(fields).sheets)
+        return {'nbsheet': str(len(sheets)), 'sheetlist': sheets}
+    
+    
+    def _job_modsheet(self, fields):
+        sheet = self._class(fields).item("sheet", fields.get('qsheet'))
+        modified = self._update(sheet, parse_data(fields.get('data1', '')), SHEET_FIELDS,
+                                {'sheetmode': 'status'})
+        return {'message':    "%d modifications done on sheet %s." % (modified, fields['qsheet']),
+                'querysheet': fields['qsheet']}
+    
+    
+    def _job_delsheet(self, fields):
+        wclass = self._class(fields)
+        wclass.item("sheet", fields.get('qsheet'))
+        del wclass.sheets[fields['qsheet']]
+        wclass.sheet_scores.pop(fields['qsheet'], None)
+        return {'message': "sheet #%s of class %s correctly deleted"
+                           % (fields['qsheet'], wclass.qclass)}
+    
+    
+    def _job_putexo(self, fields):
+        sheet = self._class(fields).item("sheet", fields.get('qsheet'))
+        data = parse_data(fields.get('data1', ''))
+        exo = {'module': data.get('module', ''), 'params': data.get('params', ''),
+               'points': int(data.get('points', 10)), 'weight': int(data.get('weight', 1))}
+        exo['title'] = data.get('title', exo['module'])
+        exo['description'] = data.get('description', '')
+        sheet['exos'].append(exo)
+        return {'message': "exercice correctly added in sheet #%s" % fields['qsheet']}
+    
+    
+    def _job_getsheetscores(self, fields):
+        wclass = self._class(fields)
+        qsheet = fields.get('qsheet')
+        sheet = wclass.item("sheet", qsheet)
+        exos = len(sheet['exos'])
+        data_scores = []
+        for quser in wclass.users:
+            scores = {'id': quser, 'user_quality': 0, 'user_percent': 0, 'user_best': 0,
+                      'user_level': 0}
+            for key in ('got', 'mean', 'best', 'level', 'last', 'try'):
+                scores[key + '_detail'] = [0] * exos
+            scores.update(wclass.sheet_scores.get(qsheet, {}).get(quser, {}))
+            data_scores.append(scores)
+        return {
+            'query_class':   wclass.qclass,
+            'query_sheet':   qsheet,
+            'sheet_formula': {'formula': SHEET_FORMULAS[int(sheet['formula'])],
+                              'I':       sheet['indicator']},
+            'exo_weights':   [exo['weight'] for exo in sheet['exos']],
+            'requires':      [exo['points'] for exo in sheet['exos']],
+            'data_scores':   data_scores,
+        }
+    
+    
+    def _job_getsheetstats(self, fields):
+        wclass = self._class(fields)
+        qsheet = fields.get('qsheet')
+        exos = len(wclass.item("sheet", qsheet)['exos'])
+        scores = list(wclass.sheet_scores.get(qsheet, {}).values())
+        stats = {}
+        for key in ('got', 'mean'):
+            details = [s.get(key + '_detail', [0] * exos) for s in scores]
+            stats['sheet_%s_details' % key] = [
+                round(sum(d[i] for d in details) / len(details), 2) if details else 0
+                for i in range(exos)
+            ]
+        return stats
+    
+    
+    def _job_getscore(self, fields):
+        wclass = self._class(fields)
+        quser = fields.get('quser')
+        wclass.user(quser)
+        return {'query_user': quser, 'exam_scores': [[
+            scores[quser]['score'] for scores in wclass.exam_scores.values() if quser in scores
+        ]]}
+    
+    
+    # ---------------------------------------------------------------------------------------
+    # Exams
+    # ---------------------------------------------------------------------------------------
+    
+    
+    def _job_addexam(self, fields):
+        qexam = self.add_exam(self._class(fields).qclass, parse_data(fields.get('data1', '')))
+        return {'message': "exam #%s correctly added" % qexam, 'exam_id': qexam}
+    
+    
+    def _job_checkexam(self, fields):
+        self._class(fields).item("exam", fields.get('qexam'))
+        return {'message': "exam %s exists" % fields['qexam']}
+    
+    
+    def _job_getexam(self, fields):
+        exam = self._class(fields).item("exam", fields.get('qexam'))
+        available = OrderedDict([('exo_cnt', len(exam['exos']))])
+        for key in EXAM_FIELDS:
+            available['exam_' + key] = exam[key]
+        available['exolist'] = list(exam['exos'])
+        return OrderedDict(
+            [('query_exam', fields['qexam'])]
+            + [(k, available[k]) for k in self._option(fields, available)]
+        )
+    
+    
+    def _job_listexams(self, fields):
+        exams = list(self._class(fields).exams)
+        return {'nbexam': str(len(exams)), 'examlist': exams}
+    
+    
+    def _job_modexam(self, fields):
+        exam = self._class(fields).item("exam", fields.get('qexam'))
+        modified = self._update(exam, parse_data(fields.get('data1', '')), EXAM_FIELDS,
+                                {'exammode': 'status'})
+        return {'message':   "%d modifications done on exam %s." % (modified, fields['qexam']),
+                'queryexam': fields['qexam']}
+    
+    
+    def _job_delexam(self, fields):
+        wclass = self._class(fields)
+        wclass.item("exam", fields.get('qexam'))
+        del wclass.exams[fields['qexam']]
+        wclass.exam_scores.pop(fields['qexam'], None)
+        return {'message': "Exam #%s of class %s correctly deleted"
+                           % (fields['qexam'], wclass.qclass)}
+    
+    
+    def _job_getexamscores(self, fields):
+        wclass = self._class(fields)
+        qexam = fields.get('qexam')
+        if wclass.item("exam", qexam)['status'] != '1':
+            raise AdmRawJobError("Exam #%s must be active" % qexam)
+        scores = wclass.exam_scores.get(qexam, {})
+        return {'query_exam': qexam, 'data_scores': [
+            dict({'id': quser, 'score': 0, 'attempts': 0}, **scores.get(quser, {}))
+            for quser in wclass.users
+        ]}
+
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+
+class _FakeWimsHandler(BaseHTTPRequestHandler):
+    """Answer the requests sent to a FakeWimsServer, keeping connections alive."""
+    
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    
+    
+    def do_GET(self):
+        self.answer(urlsplit(self.path).query)
+    
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.answer(self.rfile.read(length).decode("ascii"))
+    
+    
+    def answer(self, query):
+        fields = {
+            k: v[0] for k, v in
+            parse_qs(query, keep_blank_values=True, encoding="ISO-8859-1").items()
+        }
+        fake = self.server.fake
+        failure = fake.prepare(fields)
+        if failure in ("disconnect", "timeout"):
+            if failure == "timeout":
+                time.sleep(fake.timeout_delay)
+            self.close_connection = True
+            return
+        
+        status, headers, body = fake.html_error() if failure == "html" else fake.respond(fields)
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() != 'content-length':
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    
+    def log_message(self, format, *args):
+        pass
+
+
+
+class FakeWimsServer:
+    """Serve a FakeWims over HTTP, on a background thread.
+    
+    The server is started when entering its 'with' block (or by start()) and stopped when
+    leaving it (or by stop()).
+    
+    Parameters:
+        fake - (FakeWims) fake answering the requests (defaults to a new FakeWims).
+        host - (str) address the server listens on (defaults to 127.0.0.1).
+        port - (int) port the server listens on, 0 (default) to pick a free port."""
+    
+    
+    def __init__(self, fake=None, host="127.0.0.1", port=0):
+        self.fake = fake if fake is not None else FakeWims()
+        self._server = _ThreadingHTTPServer((host, port), _FakeWimsHandler)
+        self._server.fake = self.fake
+        self._thread = None
+    
+    
+    def __enter__(self):
+        return self.start()
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+    
+    
+    @property
+    def url(self):
+        """Returns the url of the WIMS CGI served."""
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d/wims/wims.cgi" % (host, port)
+    
+    
+    def start(self):
+        """Start serving requests, returns this server."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+    
+    
+    def stop(self):
+        """Stop serving requests and close the listening socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
@@ -0,0 +1,283 @@
+"""Hooks called by WimsAPI around every request sent to the WIMS server.
+
+A hook is an instance of Hook given to WimsAPI through its 'hooks' argument. Its methods are
+called with a RequestEvent describing the request, once for each attempt:
+
+    before_request(event)  - right before the request is sent.
+    after_response(event)  - once the response has been received and parsed.
+    on_error(event)        - if the request raised an exception (event.error), before it is
+                             retried or propagated.
+
+MetricsCollector is a hook keeping counters and latency histograms of every job, which can be
+exported in the Prometheus text format:
+
+    metrics = MetricsCollector()
+    api = WimsAPI(url, ident, passwd, hooks=[metrics])
+    ...
+    metrics.write_prometheus("/var/lib/node_exporter/wimsapi.prom")"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .transport import payload_size
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+
+class RequestEvent:
+    """Describe one attempt of a request sent by WimsAPI.
+    
+    Attributes:
+        job - (str) adm/raw job of the request.
+        qclass - (str) identifier of the class targeted by the request, None if the job does not
+                 target a class.
+        attempt - (int) number of the attempt, starting at 0 (greater when retried).
+        fields - (dict) form fields of the request.
+        status - (str) 'OK' or 'ERROR' (the status of the adm/raw response), None until a
+                 response is received.
+        http_status - (int) HTTP status code of the response.
+        response_size - (int) size of the response body in bytes (its Content-Length if the
+                        response is streamed, None if unknown).
+        format - (str) format of the response: 'json', 'wims', or 'other' for any content which
+                 is not an adm/raw response (e.g. a file).
+        elapsed - (float) seconds spent sending the request and parsing its response (until the
+                  first chunk for streamed files).
+        error - (Exception) exception raised by the request, if any."""
+    
+    
+    def __init__(self, job, fields, attempt=0):
+        self.job = job
+        self.fields = fields
+        self.qclass = str(fields['qclass']) if fields.get('qclass') is not None else None
+        self.attempt = attempt
+        self.status = None
+        self.http_status = None
+        self.response_size = None
+        self.format = None
+        self.elapsed = None
+        self.error = None
+        self._request_size = None
+    
+    
+    def __repr__(self):
+        return "<RequestEvent job=%s qclass=%s attempt=%d>" % (self.job, self.qclass,
+                                                               self.attempt)
+    
+    
+    @property
+    def request_size(self):
+        """Returns the size in bytes of the url-encoded body of the request."""
+        if self._request_size is None:
+            self._request_size = payload_size(self.fields)
+        return self._request_size
+
+
+
+class Hook:
+    """Base class of the hooks, see this module's documentation.
+    
+    Every method does nothing by default, subclasses only need to override the ones they use."""
+    
+    
+    def before_request(self, event):
+        """Called right before the request described by event is sent."""
+    
+    
+    def after_response(self, event):
+        """Called once the response to the request described by event has been parsed."""
+    
+    
+    def on_error(self, event):
+        """Called when the request described by event raised event.error."""
+
+
+
+class _JobMetrics:
+    """Counters and latency histogram of a job."""
+    
+    
+    def __init__(self, buckets):
+        self.requests = 0
+        self.responses = dict()
+        self.errors = dict()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.buckets = [0] * len(buckets)
+        self.seconds = 0.0
+
+
+
+class MetricsCollector(Hook):
+    """Hook keeping, for each job, counters and an histogram of the latency of its requests.
+    
+    Every attempt is counted, including those retried or which raised an exception. A same
+    instance can be shared by several WimsAPI.
+    
+    Parameters:
+        buckets - (tuple) upper bounds in seconds of the buckets of the latency histograms
+                  (defaults to wimsapi.hooks.DEFAULT_BUCKETS).
+        namespace - (str) prefix of the name of the exported metrics (defaults to 'wimsapi')."""
+    
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace="wimsapi"):
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._jobs = dict()
+        self._lock = threading.Lock()
+    
+    
+    def _metrics(self, job):
+        metrics = self._jobs.get(job)
+        if metrics is None:
+            metrics = self._jobs[job] = _JobMetrics(self.buckets)
+        return metrics
+    
+    
+    def _observe(self, metrics, event):
+        if event.elapsed is not None:
+            metrics.seconds += event.elapsed
+            for i, bound in enumerate(self.buckets):
+                if event.elapsed <= bound:
+                    metrics.buckets[i] += 1
+                    break
+        metrics.request_bytes += event.request_size
+    
+    
+    def after_response(self, event):
+        with self._lock:
+            metrics = self._metrics(event.job)
+            metrics.requests += 1
+            key = (event.status, event.format)
+            metrics.responses[key] = metrics.responses.get(key, 0) + 1
+            metrics.response_bytes += event.response_size or 0
+            self._observe(metrics, event)
+    
+    
+    def on_error(self, event):
+        with self._lock:
+            metrics = self._metrics(event.job)
+            metrics.requests += 1
+            error = type(event.error).__name__
+            metrics.errors[error] = metrics.errors.get(error, 0) + 1
+            self._observe(metrics, event)
+    
+    
+    def reset(self):
+        """Discard every collected metric."""
+        with self._lock:
+            self._jobs = dict()
+    
+    
+    def stats(self):
+        """Returns an OrderedDict mapping each job to a dictionary with the keys 'requests',
+        'errors', 'seconds' (total latency), 'mean' (mean latency), 'request_bytes' and
+        'response_bytes'.
+        
+        Jobs are sorted by decreasing total latency, so that the jobs dominating the time spent
+        communicating with WIMS come first."""
+        with self._lock:
+            stats = [
+                (job, {
+                    'requests':       m.requests,
+                    'errors':         sum(m.errors.values()),
+                    'seconds':        m.seconds,
+                    'mean':           m.seconds / m.requests if m.requests else 0.0,
+                    'request_bytes':  m.request_bytes,
+                    'response_bytes': m.response_bytes,
+                })
+                for job, m in self._jobs.items()
+            ]
+        return OrderedDict(sorted(stats, key=lambda s: (-s[1]['seconds'], s[0])))
+    
+    
+    def prometheus(self):
+        """Returns the collected metrics in the Prometheus text exposition format."""
+        ns = self.namespace
+        with self._lock:
+            jobs = sorted(self._jobs.items())
+            
+            lines = []
+            
+            def family(name, kind, help_):
+                lines.append("# HELP %s_%s %s" % (ns, name, help_))
+                lines.append("# TYPE %s_%s %s" % (ns, name, kind))
+            
+            def sample(name, labels, value):
+                lines.append("%s_%s{%s} %s" % (ns, name, ",".join(
+                    '%s="%s"' % (k, _escape(v)) for k, v in labels
+                ), _format(value)))
+            
+            family("requests_total", "counter", "Requests sent to WIMS, by job.")
+            for job, m in jobs:
+                sample("requests_total", [("job", job)], m.requests)
+            
+            family("responses_total", "counter", "Responses received from WIMS, by job, status "
+                                                 "and format.")
+            for job, m in jobs:
+                for (status, format_), count in sorted(m.responses.items(), key=str):
+                    sample("responses_total", [("job", job), ("status", status or ""),
+                                               ("format", format_ or "")], count)
+            
+            family("errors_total", "counter", "Requests which raised an exception, by job and "
+                                              "exception.")
+            for job, m in jobs:
+                for error, count in sorted(m.errors.items()):
+                    sample("errors_total", [("job", job), ("error", error)], count)
+            
+            family("request_bytes_total", "counter", "Bytes sent to WIMS, by job.")
+            for job, m in jobs:
+                sample("request_bytes_total", [("job", job)], m.request_bytes)
+            
+            family("response_bytes_total", "counter", "Bytes received from WIMS, by job.")
+            for job, m in jobs:
+                sample("response_bytes_total", [("job", job)], m.response_bytes)
+            
+            family("request_duration_seconds", "histogram", "Latency of the requests sent to "
+                                                            "WIMS, by job.")
+            for job, m in jobs:
+                cumulative = 0
+                for bound, count in zip(self.buckets, m.buckets):
+                    cumulative += count
+                    sample("request_duration_seconds_bucket",
+                           [("job", job), ("le", _format(bound))], cumulative)
+                sample("request_duration_seconds_bucket", [("job", job), ("le", "+Inf")],
+                       m.requests)
+                sample("request_duration_seconds_sum", [("job", job)], m.seconds)
+                sample("request_duration_seconds_count", [("job", job)], m.requests)
+        
+        return "\n".join(lines) + "\n"
+    
+    
+    def write_prometheus(self, path):
+        """Write the collected metrics in the Prometheus text exposition format to path.
+        
+        The file is replaced atomically, so that it can be read at any time by the textfile
+        collector of the Prometheus node exporter."""
+        directory, name = os.path.split(path)
+        f = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory or os.curdir,
+                                        prefix=name + ".", suffix=".tmp", delete=False)
+        try:
+            with f:
+                f.write(self.prometheus())
+            # NamedTemporaryFile() is only readable by its owner, unlike a file created by open()
+            os.chmod(f.name, 0o644)
+            os.replace(f.name, path)
+        except BaseException:
+            os.remove(f.name)
+            raise
+
+
+
+def _escape(value):
+    """Escape value to be used as the value of a label."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+
+def _format(value):
+    """Format value as a Prometheus sample value."""
+    return repr(value) if isinstance(value, float) else str(value)
@@ -1,10 +1,98 @@
 from abc import ABC, abstractmethod
 
+from .exceptions import AdmRawError
+from .utils import modified
+
 
 
 class ClassItemABC(ABC):  # pragma: no cover
     """Allow to implement any kind of item of a WIMS class without the need
-    of actually modifying wimsapi.class.Class."""
+    of actually modifying wimsapi.class.Class.
+    
+    An item may be lazy: created from its identifier only, with its attribute '_lazy' set to
+    True. Such an item is loaded on first access to an attribute which has not been set yet,
+    using the job returned by _load_call() and _load() which must then be implemented.
+    
+    The attribute '_persisted' of an item holds the fields of its payload as known by the
+    server (when it was last loaded or saved), so that only the modified fields are sent when
+    it is saved again.
+    
+    The attribute '_saved' of an item is True when the item is known to exist in its class
+    ('_class'), so that saving it does not need to check whether it exists. '_id_attribute' is
+    the name of the attribute holding the identifier of the item."""
+    
+    _id_attribute = None
+    
+    
+    def __getattr__(self, name):
+        """Load a lazy item on first access to an attribute which has not been set yet."""
+        if name.startswith('_') or not self.__dict__.get('_lazy'):
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (type(self).__name__, name))
+        self._hydrate()
+        return getattr(self, name)
+    
+    
+    def _hydrate(self):
+        """Load this item if it is lazy, does nothing otherwise."""
+        if not self.__dict__.get('_lazy'):
+            return
+        job, kwargs = self._load_call()
+        status, response = getattr(self._class._api, job)(**kwargs)
+        if not status:
+            raise AdmRawError(response['message'])
+        self._load(response)
+    
+    
+    def _payload(self):
+        """Return the fields of this item sent to WIMS, without loading it if it is lazy."""
+        raise NotImplementedError
+    
+    
+    def _to_payload(self):
+        """Return the fields of this item sent to WIMS."""
+        self._hydrate()
+        return self._payload()
+    
+    
+    def _changes(self, wclass):
+        """Return the fields of the payload of this item modified since it was last loaded from
+        or saved in wclass, the whole payload if it was not (or if it has been deleted since).
+        
+        Lazy items are not loaded: the fields which have not been loaded are not modified."""
+        if not self._known(wclass):
+            return self._to_payload()
+        return modified(self._payload(), self.__dict__.get('_persisted', {}))
+    
+    
+    def _persist(self):
+        """Record the current payload of this item as the one known by the server."""
+        self._persisted = self._payload()
+    
+    
+    def _known(self, wclass):
+        """Return True if this item is known to exist in wclass: it was loaded from or saved in
+        wclass, and has not been deleted since."""
+        fields = self.__dict__
+        return bool(fields.get('_saved') and fields.get('wclass')
+                    and fields.get('_class') is wclass)
+    
+    
+    @classmethod
+    def _identifiers(cls, wclass):
+        """Return the identifiers of every instance of cls in wclass (see Class.primeitems())."""
+        raise NotImplementedError
+    
+    
+    def _load_call(self):
+        """Return the tuple (job, kwargs) given to WimsAPI.batch() to load this lazy item."""
+        raise NotImplementedError
+    
+    
+    def _load(self, response):
+        """Set the attributes of this lazy item which have not been set yet from response, the
+        dictionary sent by the job returned by _load_call(), and mark it as loaded."""
+        raise NotImplementedError
     
     
     @abstractmethod
@@ -0,0 +1,303 @@
+"""Client-side rate limiting of the requests sent to a WIMS server.
+
+Jobs are divided in three families, each of them having its own limits:
+    read - jobs only reading data (get*, check*, list*).
+    write - every other job (add*, mod*, del*, putcsv, ...).
+    download - jobs sending back heavy files (getclasstgz).
+
+A family can be limited both in number of requests per second (through a token bucket allowing
+bursts of 'burst' requests) and in number of concurrent in-flight requests.
+
+Every WimsAPI targeting the same url share the same RateLimiter, limits thus apply to the whole
+process:
+
+    RateLimiter.for_url(url).configure("read", rate=20, concurrency=4)
+    RateLimiter.for_url(url).configure("download", concurrency=1)"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from .retry import is_idempotent
+
+
+FAMILIES = ('read', 'write', 'download')
+
+DOWNLOAD_JOBS = ('getclasstgz',)
+
+
+
+def job_family(job):
+    """Returns the family ('read', 'write' or 'download') of job."""
+    if job in DOWNLOAD_JOBS:
+        return 'download'
+    return 'read' if is_idempotent(job) else 'write'
+
+
+
+class TokenBucket:
+    """Allow at most rate acquisitions per second, with bursts of at most burst acquisitions.
+    
+    Parameters:
+        rate - (float) number of tokens added to the bucket each second.
+        burst - (int) capacity of the bucket (defaults to max(1, rate))."""
+    
+    
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    
+    def update(self, rate, burst=None):
+        """Change the rate and the capacity of the bucket, keeping the tokens it holds (up to
+        its new capacity)."""
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = rate
+            self.burst = burst if burst is not None else max(1, rate)
+            self._tokens = min(self.burst, self._tokens)
+    
+    
+    def reserve(self):
+        """Take a token from the bucket and return the number of seconds to wait before it is
+        actually available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+
+class _Waiter:
+    """Request waiting for an in-flight slot of a FamilyLimit, either in a thread or, if loop is
+    given, in a coroutine running on loop."""
+    
+    
+    def __init__(self, loop=None):
+        self.granted = False
+        self._loop = loop
+        self._event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+    
+    
+    def wake(self):
+        """Hand an in-flight slot to the request and wake it up, return False if it cannot be
+        woken up (its event loop is closed)."""
+        if self._loop is None:
+            self._event.set()
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._resolve)
+            except RuntimeError:
+                return False
+        self.granted = True
+        return True
+    
+    
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+    
+    
+    def wait(self):
+        """Block the current thread until the request is woken up."""
+        self._event.wait()
+
+
+
+class FamilyLimit:
+    """Limits applied to one family of jobs.
+    
+    Requests waiting for an in-flight slot, either in a thread (enter()) or in a coroutine
+    (enter_async()), are queued together: each released slot is handed to the request which
+    has been waiting the longest.
+    
+    Parameters:
+        rate - (float) maximum number of requests per second, None for no limit.
+        burst - (int) maximum number of requests sent at once when rate allows it (defaults to
+                max(1, rate)).
+        concurrency - (int) maximum number of in-flight requests, None for no limit."""
+    
+    
+    def __init__(self, rate=None, burst=None, concurrency=None):
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+    
+    
+    def update(self, rate=None, burst=None, concurrency=None):
+        """Change the limits, keeping the in-flight requests and the tokens of the bucket."""
+        if rate is None:
+            self.bucket = None
+        elif self.bucket is None:
+            self.bucket = TokenBucket(rate, burst)
+        else:
+            self.bucket.update(rate, burst)
+        with self._lock:
+            self.concurrency = concurrency
+            self._grant()
+    
+    
+    def _free(self):
+        """Returns True if an in-flight slot is free."""
+        return self.concurrency is None or self.in_flight < self.concurrency
+    
+    
+    def _grant(self):
+        """Hand the free in-flight slots to the waiting requests, the lock being held."""
+        while self._waiters and self._free():
+            if self._waiters.popleft().wake():
+                self.in_flight += 1
+    
+    
+    def _queue(self, loop=None):
+        """Take an in-flight slot and return None if one is free and no request is waiting,
+        queue a new _Waiter and return it otherwise. The lock must be held."""
+        if not self._waiters and self._free():
+            self.in_flight += 1
+            return None
+        waiter = _Waiter(loop)
+        self._waiters.append(waiter)
+        return waiter
+    
+    
+    def enter(self):
+        """Block until the request can be sent."""
+        with self._lock:
+            waiter = self._queue()
+        if waiter is not None:
+            waiter.wait()
+        if self.bucket is not None:
+            time.sleep(self.bucket.reserve())
+    
+    
+    async def enter_async(self):
+        """Wait, without blocking the event loop, until the request can be sent."""
+        with self._lock:
+            waiter = self._queue(asyncio.get_event_loop())
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if not waiter.granted:
+                        self._waiters.remove(waiter)
+                        raise
+                self.exit()
+                raise
+        if self.bucket is not None:
+            try:
+                await asyncio.sleep(self.bucket.reserve())
+            except asyncio.CancelledError:
+                self.exit()
+                raise
+    
+    
+    def exit(self):
+        """Release the in-flight slot taken by enter()."""
+        with self._lock:
+            self.in_flight -= 1
+            self._grant()
+
+
+
+class _Slot:
+    """Context manager (synchronous or asynchronous) holding a slot of a FamilyLimit."""
+    
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.detached = False
+    
+    
+    def __enter__(self):
+        self.limit.enter()
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.detached:
+            self.limit.exit()
+    
+    
+    async def __aenter__(self):
+        await self.limit.enter_async()
+        return self
+    
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if not self.detached:
+            self.limit.exit()
+    
+    
+    def detach(self):
+        """Keep the slot when leaving the context manager, and return a function releasing it.
+        
+        Used to hold the slot until a streamed response has been fully read."""
+        self.detached = True
+        return self.limit.exit
+
+
+
+class RateLimiter:
+    """Limits of the requests sent to a WIMS server, by family of jobs.
+    
+    Use RateLimiter.for_url() to get the instance shared by every WimsAPI targeting a given url.
+    No limit is applied until configure() is called."""
+    
+    _instances = dict()
+    _instances_lock = threading.Lock()
+    
+    
+    def __init__(self):
+        self.limits = {family: FamilyLimit() for family in FAMILIES}
+    
+    
+    @classmethod
+    def for_url(cls, url):
+        """Returns the RateLimiter shared by every WimsAPI targeting url."""
+        if not url.endswith('/'):
+            url += '/'
+        with cls._instances_lock:
+            if url not in cls._instances:
+                cls._instances[url] = cls()
+            return cls._instances[url]
+    
+    
+    def configure(self, family, rate=None, burst=None, concurrency=None):
+        """Set the limits of family ('read', 'write' or 'download').
+        
+        The limits are updated in place: requests in flight, possibly sent by another WimsAPI
+        sharing this RateLimiter, are still counted against the new limits.
+        
+        Parameters:
+            rate - (float) maximum number of requests per second, None (default) for no limit.
+            burst - (int) maximum number of requests sent at once when rate allows it (defaults
+                    to max(1, rate)).
+            concurrency - (int) maximum number of in-flight requests, None (default) for no
+                          limit."""
+        if family not in FAMILIES:
+            raise ValueError("family must be one of %s" % ", ".join(FAMILIES))
+        if concurrency is not None and concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.limits[family].update(rate, burst, concurrency)
+    
+    
+    def limit(self, job):
+        """Returns a context manager, usable either with 'with' or 'async with', waiting until
+        job can be sent according to the limits of its family."""
+        return _Slot(self.limits[job_family(job)])
@@ -0,0 +1,152 @@
+"""Retry policy and circuit breaker used by WimsAPI to handle transient failures.
+
+A failure is considered transient when the WIMS server could not be reached, did not answer in
+time, or answered with something that is not an adm/raw response (e.g. an HTML error page sent
+by Apache when the CGI times out under load)."""
+
+import random
+import threading
+import time
+
+import requests
+
+from .exceptions import CircuitOpenError, InvalidResponseError
+
+
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, InvalidResponseError)
+
+IDEMPOTENT_PREFIXES = ('get', 'check', 'list')
+
+
+
+def is_idempotent(job):
+    """Returns True if job only reads data from the WIMS server, and can thus safely be sent
+    again, False otherwise."""
+    return job.startswith(IDEMPOTENT_PREFIXES)
+
+
+
+class RetryPolicy:
+    """Define how a job failing because of a transient error is retried.
+    
+    Only idempotent jobs (get*, check*, list*) are retried, unless idempotent_only is False.
+    
+    The n-th retry is delayed by a random number of seconds between 0 and
+    min(max_backoff, backoff * 2 ** n) ("full jitter"), or exactly by this number if jitter is
+    False.
+    
+    Parameters:
+        retries - (int) maximum number of retries of a job (defaults to 3).
+        backoff - (float) base delay in seconds (defaults to 0.5).
+        max_backoff - (float) maximum delay in seconds (defaults to 30).
+        jitter - (bool) whether the delay is randomized (defaults to True).
+        exceptions - (tuple) exceptions considered as transient (defaults to
+                     wimsapi.retry.TRANSIENT_ERRORS).
+        idempotent_only - (bool) whether only idempotent jobs are retried (defaults to True)."""
+    
+    
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 exceptions=TRANSIENT_ERRORS, idempotent_only=True):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.exceptions = exceptions
+        self.idempotent_only = idempotent_only
+    
+    
+    def should_retry(self, job, attempt, error):
+        """Returns True if job, which failed with error on its attempt-th retry (starting at 0),
+        should be sent again."""
+        return (
+            attempt < self.retries
+            and isinstance(error, self.exceptions)
+            and not isinstance(error, CircuitOpenError)
+            and (not self.idempotent_only or is_idempotent(job))
+        )
+    
+    
+    def delay(self, attempt):
+        """Returns the number of seconds to wait before the attempt-th retry (starting at 0)."""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+
+class CircuitBreaker:
+    """Make requests fail fast while the WIMS server seems to be down.
+    
+    After failure_threshold consecutive transient failures, the circuit opens: every request
+    raises CircuitOpenError without being sent. Once reset_timeout seconds have elapsed, a single
+    trial request is allowed through: the circuit closes again if it succeeds, and stays open for
+    another reset_timeout if it fails with any error. Failures with other exceptions than those
+    listed in exceptions are not counted, see record_failure().
+    
+    A same instance can be shared by several WimsAPI targeting the same server.
+    
+    Parameters:
+        failure_threshold - (int) number of consecutive failures opening the circuit (defaults
+                            to 5).
+        reset_timeout - (float) number of seconds before a trial request is allowed (defaults
+                        to 30).
+        exceptions - (tuple) exceptions considered as failures (defaults to
+                     wimsapi.retry.TRANSIENT_ERRORS)."""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30, exceptions=TRANSIENT_ERRORS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.exceptions = exceptions
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._lock = threading.Lock()
+    
+    
+    @property
+    def state(self):
+        """Returns the current state of the circuit (CLOSED, OPEN or HALF_OPEN)."""
+        return self._state
+    
+    
+    def before_call(self):
+        """Raise CircuitOpenError if the request must not be sent."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if (self._state == self.OPEN
+                    and time.monotonic() - self._opened_at >= self.reset_timeout):
+                self._state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(
+                "WIMS server seems to be down, requests are suspended for %s seconds after %d "
+                "consecutive failures" % (self.reset_timeout, self.failures)
+            )
+    
+    
+    def record_success(self):
+        """Close the circuit."""
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+    
+    
+    def record_failure(self, error):
+        """Record the failure of a request with error.
+        
+        Only transient failures are counted: other failures neither increase nor reset the
+        number of consecutive failures. The circuit opens once this number reaches
+        failure_threshold, or whenever the trial request fails, whatever the error, since the
+        server has not proven to be reachable again."""
+        with self._lock:
+            transient = isinstance(error, self.exceptions)
+            if transient:
+                self.failures += 1
+            if (self._state == self.HALF_OPEN
+                    or (transient and self.failures >= self.failure_threshold)):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
@@ -4,6 +4,7 @@ import sys
 from .exceptions import AdmRawError, NotSavedError
 from .item import ClassItemABC
 from .score import ExerciseScore, SheetScore
+from .tracing import traced
 from .user import User
 from .utils import default, one_year_later
 
@@ -39,6 +40,8 @@ class Sheet(ClassItemABC):
             (=) must be replaced by the character AT (@). There is no check made, so the integrity
             of the contents is up to you only! (defaults to "")"""
     
+    _id_attribute = 'qsheet'
+    
     
     def __init__(self, title=None, description=None, expiration=None, sheetmode=0, weight=1,
                  formula=2, indicator=1, contents="", **kwargs):
@@ -106,22 +109,38 @@ class Sheet(ClassItemABC):
         return hash((self._class.qclass, self.qsheet))
     
     
+    def _load_call(self):
+        return ("getsheet", {'qclass': self._class.qclass, 'rclass': self._class.rclass,
+                             'qsheet': self.qsheet, 'verbose': True})
+    
+    
+    def _load(self, response):
+        new = self._build(self._class, response)
+        del self.__dict__['_lazy']
+        for k, v in new.__dict__.items():
+            self.__dict__.setdefault(k, v)
+        self._persisted = new._persisted
+    
+    
+    @traced
     def refresh(self):
         """Refresh this instance of a WIMS Sheet from the server itself."""
         if not self.wclass:
             raise NotSavedError("Can't refresh unsaved sheet")
         
-        new = Sheet.get(self._class, self.qsheet)
+        new = Sheet._fetch(self._class, self.qsheet)
         self.__class__ = new.__class__
         self.__dict__ = new.__dict__
         
         return self
     
     
-    def _to_payload(self):
-        return {k: v for k, v in self.__dict__.items() if k not in ['qsheet', '_saved', '_class']}
+    def _payload(self):
+        return {k: v for k, v in self.__dict__.items()
+                if not k.startswith('_') and k not in ['qsheet', 'wclass', 'exos']}
     
     
+    @traced
     def save(self, wclass=None, check_exists=True):
         """Save the Sheet in the given class.
 
@@ -132,7 +151,12 @@ class Sheet(ClassItemABC):
         
         If check_exists is True, the api will check if a sheet with the same ID
         exists on the WIMS' server. If it exists, save will instead modify this
-        sheet instead of trying to create new one."""
+        sheet instead of trying to create new one. No request is sent for this check if the sheet
+        is already known to exist in wclass (it was loaded from or saved in wclass), or if the
+        existence cache of wclass has been primed (see Class.primeitems()).
+        
+        If the sheet was loaded from or saved in wclass, only the fields modified since then are
+        sent, and no request is sent at all if none was."""
         if not wclass and not self._class:
             raise NotSavedError("wclass must be provided if this sheet has neither been imported "
                                 "from a WIMS class nor saved once yet")
@@ -142,12 +166,16 @@ class Sheet(ClassItemABC):
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to save a sheet")
         
-        if wclass is not None and check_exists:
-            self._saved = wclass.checkitem(self)
+        changes = self._changes(wclass)
+        if not changes:
+            return
+        
+        if not self._known(wclass):
+            self._saved = check_exists and wclass.checkitem(self)
         
         if self._saved:
             status, response = wclass._api.modsheet(
-                wclass.qclass, wclass.rclass, self.qsheet, self._to_payload(), verbose=True)
+                wclass.qclass, wclass.rclass, self.qsheet, changes, verbose=True)
         else:
             status, response = wclass._api.addsheet(
                 wclass.qclass, wclass.rclass, self._to_payload(), verbose=True)
@@ -156,10 +184,14 @@ class Sheet(ClassItemABC):
             raise AdmRawError(response['message'])
         
         self.qsheet = response['sheet_id'] if "sheet_id" in response else response["querysheet"]
+        wclass._record(type(self), self.qsheet, True)
+        self._persist()
+        self._saved = True
         self._class = wclass
         self.wclass = True
     
     
+    @traced
     def delete(self):
         """Delete the sheet from its associated WIMS class on the server."""
         if not self.wclass:
@@ -170,11 +202,14 @@ class Sheet(ClassItemABC):
         if not status:
             raise AdmRawError(response['message'])
         
+        self._class._forget(type(self), self.qsheet)
+        self._saved = False
         self.wclass = False
         self._class = None
     
     
     @classmethod
+    @traced
     def check(cls, wclass, sheet):
         """Returns True if sheet is in wclass, False otherwise.
 
@@ -198,6 +233,7 @@ class Sheet(ClassItemABC):
     
     
     @classmethod
+    @traced
     def remove(cls, wclass, sheet):
         """Remove the sheet from wclass.
 
@@ -212,19 +248,43 @@ class Sheet(ClassItemABC):
         status, response = wclass._api.delsheet(wclass.qclass, wclass.rclass, qsheet, verbose=True)
         if not status:
             raise AdmRawError(response['message'])
+        
+        wclass._forget(cls, qsheet)
+        if isinstance(sheet, cls):
+            sheet._saved = False
     
     
     @classmethod
+    @traced
     def get(cls, wclass, qsheet):
-        """Returns an instance of Sheet corresponding to qsheet in wclass."""
+        """Returns an instance of Sheet corresponding to qsheet in wclass.
+        
+        The sheet is kept in the identity map of wclass: getting it again returns the same
+        instance without sending any request (see Class.invalidate())."""
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to get a sheet")
         
+        sheet = wclass._cached(cls, qsheet)
+        if sheet is None:
+            sheet = wclass._remember(cls, qsheet, cls._fetch(wclass, qsheet))
+        return sheet
+    
+    
+    @classmethod
+    def _fetch(cls, wclass, qsheet):
+        """Return a new instance of Sheet corresponding to qsheet in wclass, fetched from the
+        server."""
         status, sheet_info = wclass._api.getsheet(wclass.qclass, wclass.rclass, qsheet,
                                                   verbose=True)
         if not status:
             raise AdmRawError(sheet_info['message'])
         
+        return cls._build(wclass, sheet_info)
+    
+    
+    @classmethod
+    def _build(cls, wclass, sheet_info):
+        """Return an instance of Sheet of wclass from the response of getsheet."""
         duplicate = dict(sheet_info)
         for k, v in duplicate.items():
             if k.startswith("sheet_"):
@@ -234,18 +294,49 @@ class Sheet(ClassItemABC):
         sheet = Sheet(**sheet_info)
         sheet.qsheet = sheet_info["query_sheet"]
         sheet._class = wclass
+        sheet._saved = True
+        sheet.wclass = True
+        sheet._persist()
+        return sheet
+    
+    
+    @classmethod
+    def _partial(cls, wclass, qsheet):
+        """Return an instance of Sheet of wclass only knowing its identifier, without sending any
+        request. Its other attributes are loaded on first access to any of them."""
+        sheet = cls.__new__(cls)
+        sheet._lazy = True
+        sheet._class = wclass
+        sheet._saved = True
         sheet.wclass = True
+        sheet.qsheet = qsheet
+        sheet._persisted = dict()
         return sheet
     
     
     @classmethod
-    def list(cls, wclass):
-        """Returns a list of every Sheet of wclass."""
+    def _identifiers(cls, wclass):
         status, response = wclass._api.listsheets(wclass.qclass, wclass.rclass, verbose=True)
         if not status:
             raise AdmRawError(response['message'])
+        return [qsheet for qsheet in response["sheetlist"] if qsheet != '']
+    
+    
+    @classmethod
+    @traced
+    def list(cls, wclass, lazy=False):
+        """Returns a list of every Sheet of wclass.
+        
+        The sheets missing from the identity map of wclass are fetched concurrently. If lazy is
+        True, they are not fetched: each sheet is loaded on first access to any attribute other
+        than qsheet (see Class.loaditems() to load several of them at once).
         
-        return [cls.get(wclass, qsheet) for qsheet in response["sheetlist"] if qsheet != '']
+        The existence cache of wclass is primed with the listed sheets (see
+        Class.primeitems())."""
+        qsheets = cls._identifiers(wclass)
+        wclass._prime(cls, qsheets)
+        sheets = [wclass._remember(cls, qsheet, cls._partial(wclass, qsheet)) for qsheet in qsheets]
+        return sheets if lazy else wclass.loaditems(sheets)
     
     
     @staticmethod
@@ -267,20 +358,24 @@ class Sheet(ClassItemABC):
         return round(eval(formula.replace("^", "**")), 2)
     
     
+    @traced
     def scores(self, user=None):
         """Returns a list of SheetScore for every user. If user is given returns only its
         SheetScore.
         
         user can either be an instance of wimsapi.User or its quser.
         
+        Scores are fetched with a single request. The users of the scores are taken from the
+        identity map of the class, those which are not are only loaded when one of their
+        properties (other than quser) is accessed.
+        
         A value of -1 on some members mean that WIMS did not send the value. This may be caused
         by an outdated WIMS server."""
         if not self.wclass:
             raise NotSavedError("Sheet must be saved before being able to retrieve scores")
         
         quser = user.quser if isinstance(user, User) else user
-        if quser is not None and not self._class.checkitem(quser, User):  # Checks that quser exists
-            raise ValueError("User '%s' does not exists in class '%s'" % (user, self._class.qclass))
+        given = user if isinstance(user, User) else None
         
         status, response = self._class._api.getsheetscores(self._class.qclass, self._class.rclass,
                                                            self.qsheet, verbose=True)
@@ -293,7 +388,10 @@ class Sheet(ClassItemABC):
             if quser is not None and data['id'] != quser:  # Searching for specific user score
                 continue
             
-            user = self._class.getitem(data['id'], User)
+            # Users are only loaded if one of their properties is accessed
+            score_user = given if given is not None else self._class._remember(
+                User, data['id'], User._partial(self._class, data['id'])
+            )
             try:
                 score = self._compute_grade(response["sheet_formula"]["formula"],
                                             response["sheet_formula"]["I"], data["user_quality"],
@@ -304,7 +402,7 @@ class Sheet(ClassItemABC):
             
             sheet_params = {
                 "sheet":     self,
-                "user":      user,
+                "user":      score_user,
                 "score":     score,
                 "quality":   data.get("user_quality", -1),
                 "cumul":     data.get("user_percent", -1),
@@ -316,7 +414,7 @@ class Sheet(ClassItemABC):
             for i in range(exo_count):
                 exo_params = {
                     "exo":      None,
-                    "user":     user,
+                    "user":     score_user,
                     "quality":  default(data, "mean_detail", i, -1),
                     "cumul":    default(data, "got_detail", i, -1),
                     "best":     default(data, "best_detail", i, -1),
@@ -330,4 +428,6 @@ class Sheet(ClassItemABC):
             
             scores.append(SheetScore(**sheet_params))
         
+        if quser is not None and not scores:
+            raise ValueError("User '%s' does not exists in class '%s'" % (user, self._class.qclass))
         return scores[0] if quser is not None else scores
@@ -0,0 +1,605 @@
+"""Streaming of the files sent by WIMS (class archives, class files, exercises sources, csv)
+and of the csv sent to WIMS.
+
+Files are read chunk by chunk instead of being loaded in memory:
+
+    status, stream = api.getclasstgz_stream(qclass, rclass, checksum="sha256")
+    if status:
+        stream.save("backup.tgz")
+        print(stream.size, stream.hexdigest())
+
+Spreadsheets sent by getcsv can also be read row by row with CsvRows, while the spreadsheet
+sent by putcsv is encoded chunk by chunk into a FormBody."""
+
+import codecs
+import csv
+import hashlib
+import io
+import itertools
+import re
+import tempfile
+from collections import deque, namedtuple
+from urllib.parse import parse_qs, quote_plus, urlencode
+
+
+ADMRAW_PREFIXES = (b'{', b'OK', b'ERROR')
+
+ADMRAW_MAX_SIZE = 1 << 20
+
+SCORE_COLUMN = re.compile(r"^(average|exam|sheet|manual)\d+$")
+
+CSV_DELIMITERS = {'csv': ',', 'tsv': '\t'}
+
+SPOOL_MAX_SIZE = 1 << 20
+
+
+
+def peek(chunks, max_size=ADMRAW_MAX_SIZE):
+    """Read the beginning of chunks to determine whether it may be an adm/raw response instead
+    of a file.
+    
+    Return a tuple (body, None) where body is the whole content if it starts like an adm/raw
+    response and is smaller than max_size, (None, chunks) otherwise where chunks is an iterator
+    over the whole content."""
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 5:
+            break
+    
+    if not head.lstrip().startswith(ADMRAW_PREFIXES):
+        return None, itertools.chain([head], chunks)
+    
+    body = [head]
+    size = len(head)
+    for chunk in chunks:
+        body.append(chunk)
+        size += len(chunk)
+        if size > max_size:
+            return None, itertools.chain(body, chunks)
+    return b''.join(body), None
+
+
+
+class _AsyncChunks:
+    """Asynchronous iterator over the chunks of bytes of chunks, either an asynchronous or a
+    synchronous iterable, preceded by those of head."""
+    
+    
+    def __init__(self, chunks, head=()):
+        self._async = hasattr(chunks, "__aiter__")
+        self._chunks = chunks.__aiter__() if self._async else iter(chunks)
+        self._head = list(head)
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        if self._head:
+            return self._head.pop(0)
+        if self._async:
+            return await self._chunks.__anext__()
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+
+async def read_async(chunks):
+    """Return the whole content of chunks, an asynchronous or synchronous iterable of bytes."""
+    content = b''
+    async for chunk in _AsyncChunks(chunks):
+        content += chunk
+    return content
+
+
+
+async def peek_async(chunks, max_size=ADMRAW_MAX_SIZE):
+    """Same as peek(), but chunks can also be an asynchronous iterable, the iterator returned
+    in the second case being asynchronous."""
+    chunks = _AsyncChunks(chunks)
+    head = b''
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= 5:
+            break
+    
+    if not head.lstrip().startswith(ADMRAW_PREFIXES):
+        return None, _AsyncChunks(chunks, [head])
+    
+    body = [head]
+    size = len(head)
+    async for chunk in chunks:
+        body.append(chunk)
+        size += len(chunk)
+        if size > max_size:
+            return None, _AsyncChunks(chunks, body)
+    return b''.join(body), None
+
+
+
+class FileStream:
+    """Iterable over the chunks of a file sent by WIMS.
+    
+    The content can only be iterated once, either directly or through save(). The underlying
+    connection is released once the content has been fully read, or when close() is called.
+    
+    Parameters:
+        chunks - (iterable) chunks of bytes of the file.
+        progress - (callable) called as progress(size, total) after each chunk, where size is the
+                   number of bytes read so far and total the size of the file given by WIMS
+                   (None if unknown).
+        checksum - (str) name of a hashlib algorithm (e.g. 'sha256') used to compute the
+                   checksum of the file while it is read.
+        total - (int) size of the file, if known."""
+    
+    
+    def __init__(self, chunks, progress=None, checksum=None, total=None):
+        self._chunks = iter(chunks)
+        self._hash = hashlib.new(checksum) if checksum else None
+        self._close_callbacks = []
+        self.progress = progress
+        self.total = total
+        self.size = 0
+        self.closed = False
+    
+    
+    def __iter__(self):
+        try:
+            for chunk in self._chunks:
+                if chunk:
+                    yield self._read(chunk)
+        finally:
+            self.close()
+    
+    
+    def _read(self, chunk):
+        """Account for chunk, which has just been read, and return it."""
+        self.size += len(chunk)
+        if self._hash is not None:
+            self._hash.update(chunk)
+        if self.progress is not None:
+            self.progress(self.size, self.total)
+        return chunk
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    
+    def on_close(self, callback):
+        """Register callback to be called (without argument) when this stream is closed."""
+        self._close_callbacks.append(callback)
+    
+    
+    def close(self):
+        """Release the underlying connection."""
+        if self.closed:
+            return
+        self.closed = True
+        for callback in self._close_callbacks:
+            callback()
+    
+    
+    def hexdigest(self):
+        """Returns the checksum of the bytes read so far, as an hexadecimal string."""
+        if self._hash is None:
+            raise ValueError("No checksum algorithm was given to this stream")
+        return self._hash.hexdigest()
+    
+    
+    def save(self, dest):
+        """Write the content of the stream into dest and return this stream.
+        
+        dest can either be a path or a binary file object."""
+        if hasattr(dest, "write"):
+            for chunk in self:
+                dest.write(chunk)
+        else:
+            with open(dest, "wb") as f:
+                for chunk in self:
+                    f.write(chunk)
+        return self
+
+
+
+class AsyncFileStream(FileStream):
+    """Asynchronous counterpart of FileStream, returned by the streaming jobs of AsyncWimsAPI.
+    
+    The chunks must be iterated with 'async for', and save() must be awaited. Unlike
+    FileStream, the connection is not released when leaving an 'async for' loop early: the
+    stream must then be closed, or used as an (asynchronous) context manager.
+    
+    Parameters:
+        chunks - (iterable) chunks of bytes of the file, either an asynchronous or a synchronous
+                 iterable.
+    
+    See FileStream for the other parameters."""
+    
+    
+    def __init__(self, chunks, progress=None, checksum=None, total=None):
+        super().__init__((), progress, checksum, total)
+        self._chunks = _AsyncChunks(chunks)
+    
+    
+    def __iter__(self):
+        raise TypeError("Use 'async for' with an instance of AsyncFileStream")
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        try:
+            chunk = await self._chunks.__anext__()
+            while not chunk:
+                chunk = await self._chunks.__anext__()
+        except BaseException:
+            self.close()
+            raise
+        return self._read(chunk)
+    
+    
+    async def __aenter__(self):
+        return self
+    
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    
+    async def save(self, dest):
+        """Write the content of the stream into dest and return this stream.
+        
+        dest can either be a path or a binary file object."""
+        if hasattr(dest, "write"):
+            async for chunk in self:
+                dest.write(chunk)
+        else:
+            with open(dest, "wb") as f:
+                async for chunk in self:
+                    f.write(chunk)
+        return self
+
+
+
+def _lines(chunks, encoding):
+    """Decode chunks and yield the lines (with their line break) they contain."""
+    pending = ''
+    for text in codecs.iterdecode(chunks, encoding, errors='replace'):
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+
+class _AsyncLines:
+    """Asynchronous counterpart of _lines()."""
+    
+    
+    def __init__(self, chunks, encoding):
+        self._chunks = _AsyncChunks(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._lines = deque()
+        self._pending = ''
+        self._done = False
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        while not self._lines:
+            if self._done:
+                raise StopAsyncIteration
+            try:
+                chunk, final = await self._chunks.__anext__(), False
+            except StopAsyncIteration:
+                chunk, final = b'', True
+                self._done = True
+            lines = (self._pending + self._decoder.decode(chunk, final)).split('\n')
+            self._pending = lines.pop()
+            self._lines.extend(line + '\n' for line in lines)
+            if final and self._pending:
+                self._lines.append(self._pending)
+        return self._lines.popleft()
+
+
+
+def score_value(value):
+    """Convert a score sent by WIMS to a float, returns None if there is no score."""
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+
+class CsvRows:
+    """Iterator over the rows of a spreadsheet sent by getcsv, parsed one at a time.
+    
+    Only one row is kept in memory at a time. The description row and the blank row following
+    the header are skipped, and score columns (average0, exam1, sheet1, manual1, ...) are
+    converted to float (None if the user has no score). Each row is a dictionary (or a
+    namedtuple) mapping the names of the columns to their values.
+    
+    Closing the iterator (or leaving its 'with' block) closes chunks if it has a close() method.
+    
+    Parameters:
+        chunks - (bytes / iterable) content of the spreadsheet, either as a whole or as chunks
+                 of bytes (e.g. a FileStream).
+        frmt - (str) format of the spreadsheet ('csv' or 'tsv', defaults to csv).
+        encoding - (str) encoding of the spreadsheet (defaults to utf-8).
+        namedtuples - (bool) yield namedtuples instead of dictionaries (defaults to False)."""
+    
+    
+    def __init__(self, chunks, frmt='csv', encoding='utf-8', namedtuples=False):
+        if frmt not in CSV_DELIMITERS:
+            raise ValueError("frmt must be one of %s" % ", ".join(CSV_DELIMITERS))
+        self._chunks = [chunks] if isinstance(chunks, bytes) else chunks
+        self._reader = csv.reader(_lines(self._chunks, encoding), delimiter=CSV_DELIMITERS[frmt])
+        self._namedtuples = namedtuples
+        self._rows = None
+        self.header = None
+    
+    
+    def __iter__(self):
+        return self
+    
+    
+    def __next__(self):
+        if self._rows is None:
+            self._rows = self._parse()
+        try:
+            return next(self._rows)
+        except StopIteration:
+            self.close()
+            raise
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    
+    def _start(self, header):
+        """Prepare the conversion of the rows following header."""
+        self.header = [name.strip() for name in header]
+        self._scores = [i for i, name in enumerate(self.header) if SCORE_COLUMN.match(name)]
+        self._row_type = (namedtuple("CsvRow", self.header, rename=True) if self._namedtuples
+                          else None)
+    
+    
+    def _convert(self, row):
+        """Return row as a dictionary (or a namedtuple), None if row is blank."""
+        if not any(field.strip() for field in row):
+            return None
+        width = len(self.header)
+        row = (row + [''] * (width - len(row)))[:width]
+        for i in self._scores:
+            row[i] = score_value(row[i])
+        return self._row_type(*row) if self._row_type else dict(zip(self.header, row))
+    
+    
+    def _parse(self):
+        header = next(self._reader, None)
+        if header is None:
+            return
+        next(self._reader, None)  # Descriptions of the fields
+        
+        self._start(header)
+        for row in self._reader:
+            row = self._convert(row)
+            if row is not None:
+                yield row
+    
+    
+    def close(self):
+        """Stop the iteration and close the underlying chunks."""
+        self._rows = iter(())
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+
+
+
+class AsyncCsvRows(CsvRows):
+    """Asynchronous counterpart of CsvRows, returned by AsyncWimsAPI.getcsv_rows().
+    
+    The rows must be iterated with 'async for'. Only the lines of one row are kept in memory at
+    a time. Unlike CsvRows, the underlying chunks are not closed when leaving an 'async for'
+    loop early: the iterator must then be closed, or used as an (asynchronous) context manager.
+    
+    Parameters:
+        chunks - (bytes / iterable) content of the spreadsheet, either as a whole or as chunks
+                 of bytes, the chunks being an asynchronous (e.g. an AsyncFileStream) or a
+                 synchronous iterable.
+    
+    See CsvRows for the other parameters."""
+    
+    
+    def __init__(self, chunks, frmt='csv', encoding='utf-8', namedtuples=False):
+        if frmt not in CSV_DELIMITERS:
+            raise ValueError("frmt must be one of %s" % ", ".join(CSV_DELIMITERS))
+        self._chunks = [chunks] if isinstance(chunks, bytes) else chunks
+        self._lines = _AsyncLines(self._chunks, encoding)
+        self._delimiter = CSV_DELIMITERS[frmt]
+        self._buffer = []
+        self._exhausted = False
+        self._namedtuples = namedtuples
+        self._started = False
+        self.header = None
+    
+    
+    def __next__(self):
+        raise TypeError("Use 'async for' with an instance of AsyncCsvRows")
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    async def __anext__(self):
+        try:
+            if not self._started:
+                self._started = True
+                self._start(await self._record())
+                await self._record()  # Descriptions of the fields
+            while True:
+                row = self._convert(await self._record())
+                if row is not None:
+                    return row
+        except StopAsyncIteration:
+            self.close()
+            raise
+    
+    
+    async def __aenter__(self):
+        return self
+    
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    
+    async def _record(self):
+        """Return the next row of the spreadsheet as a list of fields.
+        
+        A row is parsed from the buffered lines only once csv.reader stopped before the last of
+        them, or once every line has been read, so that quoted fields spanning several lines
+        are parsed as by CsvRows."""
+        while True:
+            reader = csv.reader(self._buffer, delimiter=self._delimiter)
+            record = next(reader, None)
+            if self._exhausted or reader.line_num < len(self._buffer):
+                del self._buffer[:reader.line_num]
+                if record is None:
+                    raise StopAsyncIteration
+                return record
+            try:
+                self._buffer.append(await self._lines.__anext__())
+            except StopAsyncIteration:
+                self._exhausted = True
+    
+    
+    def close(self):
+        """Stop the iteration and close the underlying chunks."""
+        self._exhausted = True
+        self._buffer = []
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+
+
+
+def csv_chunks(data, file=False, encoding='utf-8', chunk_size=65536):
+    """Yield the content of a csv as chunks of str.
+    
+    Parameters:
+        data - (str / file object / iterable) path to a csv if 'file' is True, content of a csv
+               otherwise, or a text or binary file object, or an iterable of rows (each row
+               being a sequence of fields).
+        file - (bool) whether a str data is a path (defaults to False). Paths are read with
+               universal newlines, line endings are thus sent as '\\n'.
+        encoding - (str) encoding of binary files and paths (defaults to utf-8).
+        chunk_size - (int) size of the chunks read from files (defaults to 65536)."""
+    if isinstance(data, str) and not file:
+        yield data
+    elif isinstance(data, str):
+        with open(data, encoding=encoding) as f:
+            yield from csv_chunks(f, chunk_size=chunk_size)
+    elif hasattr(data, "read"):
+        chunks = iter(lambda: data.read(chunk_size), data.read(0))
+        if isinstance(data.read(0), bytes):
+            chunks = codecs.iterdecode(chunks, encoding)
+        yield from chunks
+    else:
+        line = io.StringIO()
+        writer = csv.writer(line, lineterminator='\n')
+        for row in data:
+            writer.writerow(row)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+
+
+class FormBody(dict):
+    """'application/x-www-form-urlencoded' body encoded in 'ISO-8859-1', with a field too big
+    to be kept in memory.
+    
+    The dictionary contains every parameters but field, which is url-encoded chunk by chunk into
+    a temporary file. This file stays in memory until it exceeds max_size bytes, and is written
+    on disk afterward. The temporary file is removed by close(), when leaving a 'with' block
+    using the body, or once the body is garbage collected.
+    
+    Parameters:
+        params - (dict) parameters of the request, but field. Like requests, parameters whose
+                 value is None are not sent.
+        field - (str) name of the streamed field.
+        chunks - (iterable) chunks of str forming the value of field.
+        max_size - (int) maximum size in bytes kept in memory (defaults to 1 MiB)."""
+    
+    
+    def __init__(self, params, field, chunks, max_size=SPOOL_MAX_SIZE):
+        super().__init__(params)
+        self.field = field
+        self.max_size = max_size
+        self.file = tempfile.SpooledTemporaryFile(max_size)
+        try:
+            self.file.write(urlencode([
+                (k, v.encode("ISO-8859-1") if isinstance(v, str) else v)
+                for k, v in list(params.items()) + [(field, "")] if v is not None
+            ]).encode("ascii"))
+            for chunk in chunks:
+                self.file.write(quote_plus(chunk.encode("ISO-8859-1")).encode("ascii"))
+        except BaseException:
+            self.file.close()
+            raise
+        self.size = self.file.tell()
+    
+    
+    def payload(self):
+        """Return the body as bytes if it has been kept in memory, as a file object positioned
+        at its beginning otherwise."""
+        self.file.seek(0)
+        return self.file.read() if self.size <= self.max_size else self.file
+    
+    
+    def fields(self):
+        """Return every field of the body, including field, as a dictionary of str."""
+        self.file.seek(0)
+        return {
+            k: v[0] for k, v in
+            parse_qs(self.file.read().decode("ascii"), keep_blank_values=True,
+                     encoding="ISO-8859-1").items()
+        }
+    
+    
+    def close(self):
+        """Discard the temporary file."""
+        self.file.close()
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,320 @@
+"""Optional tracing of the operations of wimsapi.
+
+High-level operations (e.g. Class.get(), Sheet.scores() or User.list()) open a span, in which
+every adm/raw job sent by WimsAPI opens a child span. Spans carry the identifiers involved as
+attributes ('wims.qclass', 'wims.quser', 'wims.job', ...), and are given to the exporter once
+they end.
+
+The default exporter, NoopExporter, discards the spans without even creating them: tracing is
+disabled until another exporter is set with set_exporter():
+
+    from wimsapi import tracing
+    
+    exporter = tracing.InMemoryExporter()
+    tracing.set_exporter(exporter)
+    Class.get(url, ident, passwd, 9001, "myclass")
+    for span in exporter.spans:
+        print(span.name, span.parent_id, span.duration, span.attributes)
+
+Any other backend can be plugged in by subclassing SpanExporter."""
+
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+
+ID_ATTRIBUTES = ('qclass', 'rclass', 'quser', 'qsheet', 'qexam')
+
+ID_ALIASES = {'user': 'quser', 'sheet': 'qsheet', 'exam': 'qexam'}
+
+
+
+class Span:
+    """A timed operation, possibly nested in another one.
+    
+    Attributes:
+        name - (str) name of the operation (e.g. 'Class.get' or 'getuser').
+        attributes - (dict) attributes of the operation.
+        parent - (Span) span in which this span was opened, None for a root span.
+        trace_id - (str) identifier shared by a root span and all its descendants.
+        span_id - (str) identifier of this span.
+        parent_id - (str) span_id of parent, None for a root span.
+        start - (float) time at which the span was opened, in seconds since the epoch.
+        duration - (float) duration of the span in seconds, None until it ends.
+        error - (Exception) exception which ended the span, if any."""
+    
+    
+    def __init__(self, name, attributes=None, parent=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.trace_id = (parent.trace_id if parent is not None
+                         else "%032x" % random.getrandbits(128))
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._started = time.perf_counter()
+    
+    
+    def __repr__(self):
+        return "<Span %s %s>" % (self.name, self.attributes)
+    
+    
+    @property
+    def end(self):
+        """Returns the time at which the span ended, in seconds since the epoch, None if it has
+        not ended yet."""
+        return self.start + self.duration if self.duration is not None else None
+    
+    
+    def set_attribute(self, key, value):
+        """Set the attribute key of this span to value."""
+        self.attributes[key] = value
+    
+    
+    def finish(self, error=None):
+        """End this span, error being the exception which ended it, if any."""
+        self.duration = time.perf_counter() - self._started
+        self.error = error
+
+
+
+class SpanExporter:
+    """Base class of the exporters.
+    
+    on_start() is called when a span is opened, export() once it has ended. Both do nothing by
+    default."""
+    
+    
+    def on_start(self, span):
+        """Called when span is opened."""
+    
+    
+    def export(self, span):
+        """Called once span has ended."""
+
+
+
+class NoopExporter(SpanExporter):
+    """Default exporter, disabling tracing: no span is created while it is used."""
+
+
+
+class InMemoryExporter(SpanExporter):
+    """Keep the ended spans in the attribute 'spans', in the order they ended."""
+    
+    
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+    
+    
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+    
+    
+    def clear(self):
+        """Discard every kept span."""
+        with self._lock:
+            self.spans = []
+
+
+
+class LoggingExporter(SpanExporter):
+    """Log every ended span, indented according to its depth.
+    
+    Parameters:
+        logger - (str / logging.Logger) logger used (defaults to 'wimsapi.tracing').
+        level - (int) level of the messages (defaults to logging.DEBUG)."""
+    
+    
+    def __init__(self, logger="wimsapi.tracing", level=logging.DEBUG):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+    
+    
+    def export(self, span):
+        depth, parent = 0, span.parent
+        while parent is not None:
+            depth, parent = depth + 1, parent.parent
+        self.logger.log(self.level, "%s%s %.1fms %s%s", "  " * depth, span.name,
+                        span.duration * 1000, span.attributes,
+                        " (%r)" % span.error if span.error is not None else "")
+
+
+
+_exporter = NoopExporter()
+
+if contextvars is not None:
+    _current = contextvars.ContextVar("wimsapi_span", default=None)
+else:  # pragma: no cover
+    _current = threading.local()
+
+
+
+class _NullSpan:
+    """Context manager yielding None, used instead of a span when tracing is disabled."""
+    
+    
+    def __enter__(self):
+        return None
+    
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+
+_NULL_SPAN = _NullSpan()
+
+
+
+def set_exporter(exporter):
+    """Set the exporter receiving the spans, None to disable tracing."""
+    global _exporter
+    _exporter = exporter if exporter is not None else NoopExporter()
+
+
+
+def get_exporter():
+    """Returns the exporter receiving the spans."""
+    return _exporter
+
+
+
+def enabled():
+    """Returns True if spans are currently exported, False otherwise."""
+    return not isinstance(_exporter, NoopExporter)
+
+
+
+def current_span():
+    """Returns the innermost open span of the current context, None if there is none."""
+    if contextvars is not None:
+        return _current.get()
+    return getattr(_current, "span", None)  # pragma: no cover
+
+
+
+def _set_current(span):
+    if contextvars is not None:
+        return _current.set(span)
+    previous, _current.span = current_span(), span  # pragma: no cover
+    return previous  # pragma: no cover
+
+
+
+def _reset_current(token):
+    if contextvars is not None:
+        _current.reset(token)
+    else:  # pragma: no cover
+        _current.span = token
+
+
+
+@contextmanager
+def span(name, attributes=None):
+    """Context manager opening a span named name, child of the current span.
+    
+    The span is given to the exporter when leaving the with block. Yield the span, or None if
+    tracing is disabled."""
+    if not enabled():
+        yield None
+        return
+    
+    exporter = _exporter
+    opened = Span(name, attributes, current_span())
+    exporter.on_start(opened)
+    token = _set_current(opened)
+    try:
+        yield opened
+    except BaseException as e:
+        opened.finish(e)
+        raise
+    else:
+        opened.finish()
+    finally:
+        _reset_current(token)
+        exporter.export(opened)
+
+
+
+def id_attributes(arguments):
+    """Return the attributes identifying the WIMS objects in arguments, a dictionary mapping
+    the names of the arguments of a function to their values.
+    
+    Arguments named qclass, rclass, quser, qsheet or qexam (or user, sheet and exam) are used
+    as is, the identifiers of the others are read from their attributes (and from the attributes
+    of their class, if any)."""
+    attributes = dict()
+    for name, value in arguments.items():
+        if value is None or isinstance(value, (bool, type)):
+            continue
+        if isinstance(value, (str, int)):
+            name = ID_ALIASES.get(name, name)
+            if name in ID_ATTRIBUTES:
+                attributes["wims." + name] = str(value)
+            continue
+        
+        # Read from __dict__, so that lazy items are not loaded
+        for obj in (value, getattr(value, "_class", None)):
+            fields = getattr(obj, "__dict__", {})
+            for attr in ID_ATTRIBUTES:
+                identifier = fields.get(attr)
+                if isinstance(identifier, (str, int)) and not isinstance(identifier, bool):
+                    attributes.setdefault("wims." + attr, str(identifier))
+    return attributes
+
+
+
+def job_span(job, fields, attempt=0):
+    """Context manager opening the span of an attempt of the adm/raw job, sent with fields.
+    
+    Yield the span, or None if tracing is disabled."""
+    if not enabled():
+        return _NULL_SPAN
+    attributes = id_attributes({k: fields.get(k) for k in ID_ATTRIBUTES})
+    attributes['wims.job'] = job
+    attributes['wims.attempt'] = attempt
+    return span(job, attributes)
+
+
+
+def traced(function):
+    """Decorator opening a span, named after the qualified name of function, each time it is
+    called. The identifiers found in its arguments are set as attributes of the span."""
+    signature = inspect.signature(function)
+    
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return function(*args, **kwargs)
+        
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+        with span(function.__qualname__, id_attributes(arguments)):
+            return function(*args, **kwargs)
+    
+    return wrapper
+
+
+
+def propagate(function):
+    """Return a function calling function in the current context, so that spans opened in
+    another thread (e.g. by a concurrent.futures.ThreadPoolExecutor) are children of the
+    current span."""
+    if contextvars is None or not enabled():  # pragma: no cover
+        return function
+    return functools.partial(contextvars.copy_context().run, function)
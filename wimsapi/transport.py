@@ -0,0 +1,342 @@
+"""Transports sending the requests of WimsAPI to a WIMS server.
+
+A transport is a callable taking the url of the WIMS server and the form fields of an adm/raw
+request, and returning a tuple (status, headers, body):
+
+    status, headers, body = transport(url, fields, chunk_size=None, **kwargs)
+
+status is the HTTP status code, headers a dictionary and body the content of the response as
+bytes. If chunk_size is given, body must instead be an iterable over chunks of at most
+chunk_size bytes, closed (if it has a close() method) once it is no longer needed. fields is
+either a dictionary or a wimsapi.stream.FormBody, form_fields() converts both to a dictionary of
+str. Any other keyword argument (e.g. timeout) is specific to the transport.
+
+The transport used by WimsAPI is given through its 'transport' argument, and defaults to a
+SessionTransport:
+
+    api = WimsAPI(url, ident, passwd, transport=ReplayTransport("traffic.jsonl"))"""
+
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .stream import FormBody
+
+
+SENSITIVE_FIELDS = ('ident', 'passwd')
+
+IGNORED_FIELDS = ('code', 'ident', 'passwd')
+
+
+
+def post(url, session=None, **kwargs):
+    """Convert strings to 'ISO-8859-1' before sending the post request.
+    
+    The request is sent through session if provided, allowing connections to be reused between
+    requests.
+    
+    data can also be a wimsapi.stream.FormBody, which is then sent without being loaded in
+    memory if it is too big."""
+    
+    if isinstance(kwargs["data"], FormBody):
+        kwargs["data"] = kwargs["data"].payload()
+    else:
+        for k, v in kwargs["data"].items():
+            kwargs["data"][k] = v if not isinstance(v, str) else v.encode("ISO-8859-1")
+    kwargs["headers"] = {"Content-Type": "application/x-www-form-urlencoded; charset=ISO-8859-1"}
+    return (session or requests).post(url, **kwargs)
+
+
+
+def create_session(pool_connections=10, pool_maxsize=10, max_retries=0):
+    """Return a requests.Session keeping alive at most pool_maxsize connections per host.
+    
+    max_retries is given to the underlying requests.adapters.HTTPAdapter, it can either be an int
+    or an instance of urllib3.util.Retry."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+
+def form_fields(fields):
+    """Return fields (a dictionary or a wimsapi.stream.FormBody) as a dictionary of str, as
+    received by WIMS."""
+    if isinstance(fields, FormBody):
+        return fields.fields()
+    return {
+        k: v.decode("ISO-8859-1") if isinstance(v, bytes) else str(v)
+        for k, v in fields.items() if v is not None
+    }
+
+
+
+def payload_size(fields):
+    """Return the size in bytes of fields (a dictionary or a wimsapi.stream.FormBody) once
+    url-encoded, as sent to WIMS."""
+    if isinstance(fields, FormBody):
+        return fields.size
+    return len(urlencode([
+        (k, v.encode("ISO-8859-1") if isinstance(v, str) else v)
+        for k, v in fields.items() if v is not None
+    ]))
+
+
+
+def split_chunks(body, chunk_size):
+    """Return body as a list of chunks of at most chunk_size bytes."""
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+
+class Transport:
+    """Base class of the transports, see this module's documentation."""
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        raise NotImplementedError
+    
+    
+    def close(self):
+        """Release the resources (e.g. connections) held by this transport."""
+
+
+
+class _ResponseChunks:
+    """Chunks of a streamed requests.Response, closing the response when closed."""
+    
+    
+    def __init__(self, response, chunk_size):
+        self.response = response
+        self.chunk_size = chunk_size
+    
+    
+    def __iter__(self):
+        return self.response.iter_content(self.chunk_size)
+    
+    
+    def close(self):
+        self.response.close()
+
+
+
+class SessionTransport(Transport):
+    """Send the requests through a pooled keep-alive requests.Session.
+    
+    Parameters:
+        pool_connections - (int) Number of connection pools to cache (defaults to 10).
+        pool_maxsize - (int) Maximum number of connections kept alive in each pool (defaults
+                       to 10).
+        max_retries - (int | urllib3.util.Retry) Retry policy of the HTTP adapter (defaults to 0).
+        session_lifetime - (float) Number of seconds after which the pooled session is closed
+                           and replaced by a new one, None (default) to keep it forever.
+    
+    Keyword arguments are given to requests.Session.post()."""
+    
+    
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=0,
+                 session_lifetime=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.session_lifetime = session_lifetime
+        self._session = None
+        self._session_created = None
+        self._session_lock = threading.Lock()
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        data = fields if isinstance(fields, FormBody) else dict(fields)
+        response = post(url, session=self.session, data=data, stream=chunk_size is not None,
+                        **kwargs)
+        if chunk_size is None:
+            return response.status_code, response.headers, response.content
+        return response.status_code, response.headers, _ResponseChunks(response, chunk_size)
+    
+    
+    @property
+    def session(self):
+        """Returns the pooled session used by this transport.
+        
+        The session is created on first access, and replaced by a new one once older than
+        session_lifetime."""
+        with self._session_lock:
+            expired = (
+                self._session is not None and self.session_lifetime is not None
+                and time.monotonic() - self._session_created >= self.session_lifetime
+            )
+            if expired:
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = create_session(self.pool_connections, self.pool_maxsize,
+                                               self.max_retries)
+                self._session_created = time.monotonic()
+            return self._session
+    
+    
+    def close(self):
+        """Close every connection kept alive by this transport.
+        
+        The transport can still be used afterward, a new session will be created."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+
+class FakeTransport(Transport):
+    """Answer the requests in memory, without any network access.
+    
+    The response to a request is taken from responses if its job is in it, otherwise handler is
+    called. A response can either be a dictionary (sent as JSON), bytes or a str (sent as is),
+    a tuple (status, headers, body), or a callable taking the fields of the request (as a
+    dictionary of str) and returning one of these. Jobs without response are answered with an
+    adm/raw error.
+    
+    Every request received is appended to the attribute 'requests', as a dictionary of str.
+    
+    Parameters:
+        responses - (dict) responses to send back, by job.
+        handler - (callable) called with the fields of the requests whose job is not in
+                  responses."""
+    
+    
+    def __init__(self, responses=None, handler=None):
+        self.responses = responses or {}
+        self.handler = handler
+        self.requests = []
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        fields = form_fields(fields)
+        self.requests.append(fields)
+        
+        job = fields.get('job')
+        if job in self.responses:
+            response = self.responses[job]
+        elif self.handler is not None:
+            response = self.handler
+        else:
+            response = {'status': 'ERROR', 'code': fields.get('code'), 'job': job,
+                        'message': "No response defined for job '%s'" % job}
+        if callable(response):
+            response = response(fields)
+        
+        if isinstance(response, dict):
+            response = json.dumps(response)
+        if isinstance(response, str):
+            response = response.encode("ISO-8859-1")
+        if isinstance(response, bytes):
+            response = (200, {'Content-Type': 'text/plain'}, response)
+        
+        status, headers, body = response
+        return status, headers, split_chunks(body, chunk_size) if chunk_size else body
+
+
+
+class RecordingTransport(Transport):
+    """Send the requests through another transport, recording every exchange so that it can be
+    replayed later by a ReplayTransport.
+    
+    Recorded exchanges are available in the attribute 'records', and are also appended to the
+    file at path if given (one JSON object per line). The 'ident' and 'passwd' fields are never
+    recorded. Streamed responses are fully read before being returned.
+    
+    Parameters:
+        transport - (Transport) transport actually sending the requests (defaults to a new
+                    SessionTransport).
+        path - (str) path of the file the exchanges are appended to."""
+    
+    
+    def __init__(self, transport=None, path=None):
+        self.transport = transport if transport is not None else SessionTransport()
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        recorded = {
+            k: '*' if k in SENSITIVE_FIELDS else v for k, v in form_fields(fields).items()
+        }
+        status, headers, body = self.transport(url, fields, chunk_size, **kwargs)
+        if chunk_size is not None:
+            chunks = body
+            try:
+                body = b''.join(chunks)
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+        
+        record = {
+            'fields':  recorded,
+            'status':  status,
+            'headers': dict(headers),
+            'body':    body.decode("ISO-8859-1"),
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        
+        return status, headers, split_chunks(body, chunk_size) if chunk_size else body
+    
+    
+    def close(self):
+        self.transport.close()
+
+
+
+class ReplayTransport(Transport):
+    """Answer the requests with the exchanges recorded by a RecordingTransport.
+    
+    A request is answered with a recorded exchange having the same fields, 'code', 'ident' and
+    'passwd' excepted. When several exchanges match, they are replayed in the order they were
+    recorded, the last one being replayed indefinitely once the others were used.
+    
+    LookupError is raised if no recorded exchange matches a request.
+    
+    Parameters:
+        records - (str / list) path to a file written by a RecordingTransport, or a list of
+                  records (e.g. RecordingTransport.records)."""
+    
+    
+    def __init__(self, records):
+        if isinstance(records, str):
+            with open(records, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        
+        self._exchanges = dict()
+        for record in records:
+            key = self._key(record['fields'])
+            self._exchanges.setdefault(key, deque()).append(
+                (record['status'], record['headers'], record['body'].encode("ISO-8859-1"))
+            )
+        self._lock = threading.Lock()
+    
+    
+    @staticmethod
+    def _key(fields):
+        return tuple(sorted((k, v) for k, v in fields.items() if k not in IGNORED_FIELDS))
+    
+    
+    def __call__(self, url, fields, chunk_size=None, **kwargs):
+        fields = form_fields(fields)
+        with self._lock:
+            exchanges = self._exchanges.get(self._key(fields))
+            if not exchanges:
+                raise LookupError("No recorded exchange matches the request %s"
+                                  % {k: v for k, v in fields.items() if k not in IGNORED_FIELDS})
+            status, headers, body = exchanges[0] if len(exchanges) == 1 else exchanges.popleft()
+        return status, dict(headers), split_chunks(body, chunk_size) if chunk_size else body
@@ -0,0 +1,176 @@
+"""Stage operations on the items of a WIMS class, and send them all at once.
+
+A UnitOfWork is bound to a Class. Its methods additem(), save() and delitem() only record the
+operation, flush() then sends every staged operation:
+
+    work = UnitOfWork(wclass)
+    for user in users:
+        work.additem(user)
+    work.additem(sheet)
+    work.delitem("old", User)
+    items = work.staged
+    for item, result in zip(items, work.flush()):
+        if isinstance(result, Exception):
+            print("Could not update", item, result)
+
+Operations are sent in stages, the operations of a same stage being sent concurrently:
+deletions first, exams before sheets and sheets before users, then additions and
+modifications, users and sheets before exams, so that an exam is never created before the sheets
+it may be linked to, nor a sheet deleted before the exams linked to it."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .exam import Exam
+from .exceptions import InvalidItemTypeError, NotSavedError
+from .item import ClassItemABC
+from .sheet import Sheet
+from .tracing import traced
+from .user import User
+
+
+ORDER = (User, Sheet, Exam)
+
+
+
+class UnitOfWork:
+    """Operations on the items of wclass, staged until flush() is called.
+    
+    Staging an operation on an item (or identifier) which is already staged replaces the previous
+    operation, so that each item is sent at most once.
+    
+    Parameters:
+        wclass - (wimsapi.Class) class containing the items, must be saved.
+        max_workers - (int) maximum number of operations sent concurrently (defaults to the
+                      pool_maxsize of the WimsAPI of wclass)."""
+    
+    
+    def __init__(self, wclass, max_workers=None):
+        if not wclass._saved:
+            raise NotSavedError("Class must be saved before being able to stage operations on "
+                                "its items")
+        self._class = wclass
+        self.max_workers = max_workers
+        self._operations = []
+        self._index = dict()
+    
+    
+    def __len__(self):
+        return len(self._operations)
+    
+    
+    def __repr__(self):
+        return "<wimsapi.UnitOfWork object at %s - qclass : %s - %d staged>" % (
+            hex(id(self)), str(self._class.qclass), len(self))
+    
+    
+    @property
+    def staged(self):
+        """Returns the items (or identifiers) of the staged operations, in the order they were
+        staged."""
+        return [item for _, item, _ in self._operations]
+    
+    
+    @staticmethod
+    def _key(item, cls):
+        """Return the key of item in the index of staged operations, identifiers are keyed by
+        their class and instances by their identity."""
+        return (cls, item) if isinstance(item, str) else id(item)
+    
+    
+    def _stage(self, action, item, cls):
+        key = self._key(item, cls)
+        if key in self._index:
+            self._operations[self._index[key]] = (action, item, cls)
+        else:
+            self._index[key] = len(self._operations)
+            self._operations.append((action, item, cls))
+    
+    
+    def additem(self, item):
+        """Stage the addition of item to the class, see Class.additem().
+        
+        Item must be a subclass of wimsapi.item.ClassItemABC."""
+        if not issubclass(type(item), ClassItemABC):
+            raise InvalidItemTypeError(
+                "Item of type %s cannot be added to the WIMS class." % str(type(item)))
+        self._stage("add", item, type(item))
+    
+    
+    def save(self, item, check_exists=True):
+        """Stage the save of item in the class, see the save() method of item.
+        
+        Item must be a subclass of wimsapi.item.ClassItemABC."""
+        if not issubclass(type(item), ClassItemABC):
+            raise InvalidItemTypeError(
+                "Item of type %s cannot be saved in the WIMS class." % str(type(item)))
+        self._stage("save" if check_exists else "add", item, type(item))
+    
+    
+    def delitem(self, item, cls=None):
+        """Stage the removal of item from the class, see Class.delitem().
+        
+        Item must be either a subclass of wimsapi.item.ClassItemABC or a
+        string. If item is a string, cls must be provided and be a
+        subclass of ClassItemABC which correspond to the item."""
+        test = ((not isinstance(item, str) and not issubclass(type(item), ClassItemABC))
+                or (cls is not None and not issubclass(cls, ClassItemABC))
+                or (isinstance(item, str) and cls is None))
+        if test:
+            raise InvalidItemTypeError(
+                "Item of type %s cannot be deleted from the WIMS class"
+                % str(type(item) if not isinstance(item, str) else cls))
+        self._stage("delete", item, cls or type(item))
+    
+    
+    def clear(self):
+        """Discard every staged operation."""
+        self._operations = []
+        self._index = dict()
+    
+    
+    @staticmethod
+    def _order(action, cls):
+        """Return the key of the stage in which the operation is sent, stages being sent in
+        ascending order."""
+        rank = ORDER.index(cls) if cls in ORDER else len(ORDER)
+        return (0, -rank) if action == "delete" else (1, rank)
+    
+    
+    def _send(self, action, item, cls):
+        wclass = self._class
+        if action == "delete":
+            cls.remove(wclass, item)
+        else:
+            item.save(wclass, check_exists=(action == "save"))
+        return item
+    
+    
+    @traced
+    def flush(self):
+        """Send every staged operation and return their results, in the order they were staged.
+        
+        Each element of the returned list is either the item (or identifier) of the
+        corresponding operation, or the exception it raised. An operation raising an exception
+        does not prevent the others from being sent. The staged operations are discarded."""
+        operations, self._operations = self._operations, []
+        self._index = dict()
+        if not operations:
+            return []
+        
+        stages = dict()
+        for i, (action, item, cls) in enumerate(operations):
+            stages.setdefault(self._order(action, cls), []).append(i)
+        
+        results = [None] * len(operations)
+        max_workers = self.max_workers or self._class._api.pool_maxsize
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key in sorted(stages):
+                futures = [
+                    (i, executor.submit(tracing.propagate(self._send), *operations[i]))
+                    for i in stages[key]
+                ]
+                for i, future in futures:
+                    results[i] = future.exception() or future.result()
+        
+        return results
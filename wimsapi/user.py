@@ -1,5 +1,39 @@
-from .exceptions import AdmRawError, InvalidIdentifier, NotSavedError
+import re
+from contextlib import closing
+
+from .exceptions import AdmRawError, InvalidIdentifier, InvalidResponseError, NotSavedError
 from .item import ClassItemABC
+from .tracing import traced
+
+
+PROPERTIES = (
+    'firstname', 'lastname', 'email', 'comments', 'regnum', 'photourl', 'participate', 'password',
+    'courses', 'classes', 'supervise', 'supervisable', 'external_auth', 'agreecgu', 'regprop1',
+    'regprop2', 'regprop3', 'regprop4', 'regprop5',
+)
+
+ROSTER_COLUMNS = ('login', 'password', 'lastname', 'firstname', 'email', 'regnum')
+
+VALID_QUSER = re.compile(r"[A-Za-z0-9_.\-]+")
+
+CSV_COLUMNS = {
+    'login':     "Login",
+    'password':  "Password",
+    'name':      "Name",
+    'lastname':  "Last name",
+    'firstname': "First name",
+    'email':     "Email",
+    'regnum':    "Registration number",
+}
+
+
+
+def check_csv_columns(columns):
+    """Raise ValueError if columns contains a column which cannot be built from an User."""
+    for column in columns:
+        if column not in CSV_COLUMNS:
+            raise ValueError("Unknown column '%s', must be one of %s"
+                             % (column, ", ".join(CSV_COLUMNS)))
 
 
 
@@ -25,6 +59,8 @@ class User(ClassItemABC):
             for the first time to agree the cgu (default to "yes").
         regprop[1..5] - (str) custom variables."""
     
+    _id_attribute = 'quser'
+    
     
     def __init__(self, quser, lastname, firstname, password, email="", comments="", regnum="",
                  photourl="", participate="", courses="", classes="", supervise="",
@@ -101,22 +137,40 @@ class User(ClassItemABC):
         return hash((self._class.qclass, self.quser))
     
     
+    def _load_call(self):
+        missing = [p for p in PROPERTIES if p not in self.__dict__]
+        return ("getuser", {'qclass': self._class.qclass, 'rclass': self._class.rclass,
+                            'quser': self.quser, 'options': missing, 'verbose': True})
+    
+    
+    def _load(self, response):
+        defaults = User(self.quser, "", "", "").__dict__
+        persisted = self.__dict__.setdefault('_persisted', dict())
+        del self.__dict__['_lazy']
+        for p in PROPERTIES:
+            if p not in self.__dict__:
+                self.__dict__[p] = persisted[p] = response.get(p, defaults[p])
+    
+    
+    @traced
     def refresh(self):
         """Refresh this instance of a WIMS User from the server itself."""
         if not self.wclass:
             raise NotSavedError("Can't refresh unsaved user")
         
-        new = User.get(self._class, self.quser)
+        new = User._fetch(self._class, self.quser)
         self.__class__ = new.__class__
         self.__dict__ = new.__dict__
         
         return self
     
     
-    def _to_payload(self):
-        return {k: v for k, v in self.__dict__.items() if k not in ['quser', '_class', '_saved']}
+    def _payload(self):
+        return {k: v for k, v in self.__dict__.items()
+                if not k.startswith('_') and k not in ['quser', 'wclass']}
     
     
+    @traced
     def save(self, wclass=None, check_exists=True, adapt=True):
         """Save the User in the given class.
         
@@ -127,7 +181,12 @@ class User(ClassItemABC):
         
         If check_exists is True, the api will check if an user with the same ID
         exists on the WIMS' server. If it exists, save will instead modify this
-        user instead of trying to create new one."""
+        user instead of trying to create new one. No request is sent for this check if the user
+        is already known to exist in wclass (it was loaded from or saved in wclass), or if the
+        existence cache of wclass has been primed (see Class.primeitems()).
+        
+        If the user was loaded from or saved in wclass, only the fields modified since then are
+        sent, and no request is sent at all if none was."""
         if not wclass and not self._class:
             raise NotSavedError("wclass must be provided if this user has neither been imported "
                                 "from a WIMS class nor saved once yet")
@@ -137,12 +196,16 @@ class User(ClassItemABC):
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to save an user")
         
-        if wclass is not None and check_exists:
-            self._saved = wclass.checkitem(self)
+        changes = self._changes(wclass)
+        if not changes:
+            return
+        
+        if not self._known(wclass):
+            self._saved = check_exists and wclass.checkitem(self)
         
         if self._saved:
             status, response = wclass._api.moduser(
-                wclass.qclass, wclass.rclass, self.quser, self._to_payload(), verbose=True)
+                wclass.qclass, wclass.rclass, self.quser, changes, verbose=True)
         else:
             status, response = wclass._api.adduser(
                 wclass.qclass, wclass.rclass, self.quser, self._to_payload(), verbose=True)
@@ -157,10 +220,32 @@ class User(ClassItemABC):
         if not status:
             raise AdmRawError(response['message'])
         
+        self._saved_in(wclass)
+    
+    
+    def _saved_in(self, wclass):
+        """Record that this user has just been saved in wclass."""
+        wclass._record(type(self), self.quser, True)
+        self._persist()
+        self._saved = True
         self._class = wclass
         self.wclass = True
     
     
+    def _csv_compatible(self):
+        """Return True if this user can be added to a class with putcsv: its quser only contains
+        characters accepted by WIMS, its mandatory properties are set (putcsv ignores the users
+        missing one), and its properties which cannot be sent through putcsv have their default
+        value."""
+        if not VALID_QUSER.fullmatch(str(self.quser)):
+            return False
+        payload = self._to_payload()
+        defaults = User(self.quser, "", "", "").__dict__
+        return (all(payload[p] for p in ('lastname', 'firstname', 'password'))
+                and all(payload[p] == defaults[p] for p in PROPERTIES if p not in ROSTER_COLUMNS))
+    
+    
+    @traced
     def delete(self):
         """Delete the user from its associated WIMS class on the server."""
         if not self.wclass:
@@ -171,11 +256,14 @@ class User(ClassItemABC):
         if not status:
             raise AdmRawError(response['message'])
         
+        self._class._forget(type(self), self.quser)
+        self._saved = False
         self.wclass = False
         self._class = None
     
     
     @classmethod
+    @traced
     def check(cls, wclass, user):
         """Returns True if item is in wclass, False otherwise.
 
@@ -197,6 +285,7 @@ class User(ClassItemABC):
     
     
     @classmethod
+    @traced
     def remove(cls, wclass, user):
         """Remove the user from wclass.
 
@@ -211,30 +300,166 @@ class User(ClassItemABC):
         status, response = wclass._api.deluser(wclass.qclass, wclass.rclass, quser, verbose=True)
         if not status:
             raise AdmRawError(response['message'])
+        
+        wclass._forget(cls, quser)
+        if isinstance(user, cls):
+            user._saved = False
     
     
     @classmethod
+    @traced
     def get(cls, wclass, quser):
-        """Returns an instance of User corresponding to quser in wclass."""
+        """Returns an instance of User corresponding to quser in wclass.
+        
+        The user is kept in the identity map of wclass: getting it again returns the same
+        instance without sending any request (see Class.invalidate())."""
         if not wclass._saved:
             raise NotSavedError("Class must be saved before being able to get an user")
         
-        status, user_info = wclass._api.getuser(wclass.qclass, wclass.rclass, quser, verbose=True)
+        user = wclass._cached(cls, quser)
+        if user is None:
+            user = wclass._remember(cls, quser, cls._fetch(wclass, quser))
+        return user
+    
+    
+    @classmethod
+    def _fetch(cls, wclass, quser):
+        """Return a new instance of User corresponding to quser in wclass, fetched from the
+        server."""
+        status, user_info = wclass._api.getuser(wclass.qclass, wclass.rclass, quser, PROPERTIES,
+                                                verbose=True)
         if not status:
             raise AdmRawError(user_info['message'])
-        status, user_password = wclass._api.getuser(wclass.qclass, wclass.rclass, quser,
-                                                    ["password"], verbose=True)
-        if not status:
-            raise AdmRawError(user_password['message'])
         
-        user_info['password'] = user_password['password']
-        user = User(quser, **user_info)
+        return cls._build(wclass, quser, user_info)
+    
+    
+    @classmethod
+    def _build(cls, wclass, quser, user_info):
+        """Return an instance of User of wclass from its properties."""
+        user = cls(quser, **user_info)
         user._class = wclass
+        user._saved = True
         user.wclass = True
+        user._persist()
         return user
     
     
     @classmethod
-    def list(cls, wclass):
-        """Returns a list of every User of wclass."""
-        return [cls.get(wclass, quser) for quser in wclass.infos["userlist"] if quser != '']
+    def _partial(cls, wclass, quser, **properties):
+        """Return an instance of User of wclass from some of its properties, without sending any
+        request. The other properties are loaded on first access to any of them."""
+        user = cls.__new__(cls)
+        user._lazy = True
+        user._class = wclass
+        user._saved = True
+        user.wclass = True
+        user.quser = quser
+        user.__dict__.update(properties)
+        user._persisted = dict(properties)
+        return user
+    
+    
+    def csv_row(self, columns=('login', 'password', 'lastname', 'firstname', 'email', 'regnum')):
+        """Returns the fields of this user corresponding to columns, as a list.
+        
+        columns may contain any column accepted by putcsv: login, password, name, lastname,
+        firstname, email and regnum."""
+        check_csv_columns(columns)
+        row = []
+        for column in columns:
+            if column == 'login':
+                row.append(self.quser)
+            elif column == 'name':
+                row.append(self.lastname + " " + self.firstname)
+            else:
+                row.append(getattr(self, column))
+        return row
+    
+    
+    @classmethod
+    def csv_rows(cls, users, columns=('login', 'password', 'lastname', 'firstname', 'email',
+                                      'regnum')):
+        """Yield the rows of a csv containing users, usable by WimsAPI.putcsv().
+        
+        The first row contains the names of the columns, the second their descriptions, the
+        following one row per user. Users are consumed one at a time, users can thus be a
+        generator.
+        
+        E.G. api.putcsv(qclass, rclass, User.csv_rows(users))"""
+        columns = list(columns)
+        check_csv_columns(columns)
+        yield columns
+        yield [CSV_COLUMNS[column] for column in columns]
+        for user in users:
+            yield user.csv_row(columns)
+    
+    
+    @classmethod
+    def _identifiers(cls, wclass):
+        return [quser for quser in wclass.infos["userlist"] if quser != '']
+    
+    
+    @staticmethod
+    def _roster(wclass):
+        """Return the rows of the roster of wclass sent by getcsv, or None if WIMS did not send
+        a valid roster (e.g. an error or an HTML error page)."""
+        try:
+            status, rows = wclass._api.getcsv_rows(wclass.qclass, wclass.rclass, ROSTER_COLUMNS)
+        except InvalidResponseError:
+            return None
+        if not status:
+            return None
+        with closing(rows):
+            roster = list(rows)
+        if rows.header is None or not set(ROSTER_COLUMNS) <= set(rows.header):
+            return None
+        return roster
+    
+    
+    @classmethod
+    @traced
+    def list(cls, wclass, lazy=False):
+        """Returns a list of every User of wclass.
+        
+        Every user is built from the roster sent by a single getcsv request (login, password,
+        names, email and registration number). Their other properties are loaded on first
+        access to any of them. If no valid roster can be obtained, every user missing from the
+        identity map of wclass is fetched with getuser, concurrently.
+        
+        Users already in the identity map of wclass are returned as is, the others are added to
+        it. The existence cache of wclass is primed with the listed users (see
+        Class.primeitems()).
+        
+        lazy is accepted for consistency with Sheet.list() and Exam.list(), users built from the
+        roster are always loaded lazily."""
+        if not wclass._saved:
+            raise NotSavedError("Class must be saved before being able to list users")
+        
+        roster = cls._roster(wclass)
+        if roster is not None:
+            users = [
+                wclass._remember(cls, row['login'], cls._partial(
+                    wclass, row['login'], **{c: row[c] for c in ROSTER_COLUMNS[1:]}
+                ))
+                for row in roster if row['login']
+            ]
+            wclass._prime(cls, [user.quser for user in users])
+            return users
+        
+        qusers = cls._identifiers(wclass)
+        wclass._prime(cls, qusers)
+        missing = [quser for quser in qusers if wclass._cached(cls, quser) is None]
+        responses = wclass._api.map("getuser", [
+            {'qclass': wclass.qclass, 'rclass': wclass.rclass, 'quser': quser,
+             'options': PROPERTIES, 'verbose': True}
+            for quser in missing
+        ])
+        for quser, response in zip(missing, responses):
+            if isinstance(response, Exception):
+                raise response
+            status, user_info = response
+            if not status:
+                raise AdmRawError(user_info['message'])
+            wclass._remember(cls, quser, cls._build(wclass, quser, user_info))
+        return [wclass._cached(cls, quser) for quser in qusers]
@@ -15,3 +15,10 @@ def default(d, k, i, default=None):
         return d[k][i]
     except (KeyError, IndexError):
         return default
+
+
+
+def modified(payload, persisted):
+    """Returns the items of payload whose key is missing from persisted, or whose value differs
+    from the one in persisted."""
+    return {k: v for k, v in payload.items() if k not in persisted or persisted[k] != v}
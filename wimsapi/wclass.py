@@ -3,8 +3,9 @@ import datetime
 from .api import WimsAPI
 from .exceptions import AdmRawError, InvalidItemTypeError, NotSavedError
 from .item import ClassItemABC
-from .user import User
-from .utils import one_year_later
+from .tracing import traced
+from .user import PROPERTIES as USER_PROPERTIES, ROSTER_COLUMNS, VALID_QUSER, User
+from .utils import modified, one_year_later
 
 
 LANG = [
@@ -27,6 +28,11 @@ LANG = [
     've', 'vi', 'vo', 'cy', 'wa', 'wo', 'xh', 'yi', 'yo', 'za', 'zh', 'zu',
 ]
 
+PROPERTIES = (
+    'description', 'institution', 'email', 'password', 'lang', 'expiration', 'limit', 'level',
+    'secure', 'bgcolor', 'refcolor', 'css',
+)
+
 LEVEL = [
     "K1", "K2", "K3",  # Kindergarten
     "E1", "E2", "E3", "E4", "E5", "E6",  # Elementary school
@@ -74,6 +80,8 @@ class Class:
         
         self._api = None
         self._saved = False
+        self._items = dict()
+        self._exists = dict()
         self.qclass = qclass
         self.rclass = rclass
         self.name = name
@@ -126,10 +134,35 @@ class Class:
         return hash((self.qclass, self.url))
     
     
+    def __getattr__(self, name):
+        """Hydrate a class returned by list(lazy=True) on first access to an attribute which
+        has not been loaded yet."""
+        if name.startswith('_') or not self.__dict__.get('_lazy'):
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (type(self).__name__, name))
+        self._hydrate()
+        return getattr(self, name)
+    
+    
+    def _hydrate(self):
+        """Load every field of a class returned by list(lazy=True), does nothing if the class
+        is already loaded."""
+        if not self.__dict__.get('_lazy'):
+            return
+        class_info, supervisor_info = self._fetch(self._api, self.qclass, self.rclass)
+        new = self._build(self._api, self.qclass, self.rclass, class_info, supervisor_info)
+        del self.__dict__['_lazy']
+        for k, v in new.__dict__.items():
+            self.__dict__.setdefault(k, v)
+        self._persisted = new._persisted
+        self.supervisor._class = self
+    
+    
     def _to_payload(self):
         """Return a dictionnary representing this class as defined in adm/raw."""
+        self._hydrate()
         d = {k: v for k, v in self.__dict__.items()
-             if k not in ['qclass', 'rclass', 'supervisor', '_api', 'wclass']}
+             if not k.startswith('_') and k not in ['qclass', 'rclass', 'supervisor', 'wclass']}
         d['description'] = d['name']
         d['supervisor'] = self.supervisor.fullname
         del d['name']
@@ -178,11 +211,12 @@ class Class:
     
     
     @classmethod
+    @traced
     def check(cls, url, ident, passwd, qclass, rclass, **kwargs):
         """Returns True if the class <qclass> exists and allows connection with ident and
         rclass, False otherwise."""
-        w = WimsAPI(url, ident, passwd, **kwargs)
-        status, response = w.checkclass(qclass, rclass, verbose=True)
+        with WimsAPI(url, ident, passwd, **kwargs) as w:
+            status, response = w.checkclass(qclass, rclass, verbose=True)
         
         msg1 = 'class %s not existing' % str(qclass)
         msg2 = 'connection refused by requested class (%s)' % str(qclass)
@@ -192,6 +226,7 @@ class Class:
         return status
     
     
+    @traced
     def save(self, url=None, ident=None, passwd=None, **kwargs):
         """Save this the modification done on this class on the WIMS server.
         
@@ -199,7 +234,10 @@ class Class:
         saved yet, arguments url, ident and passwd must be provided.
         
         Use the method refresh() on any other instance representing this class
-        to reflect the change saved."""
+        to reflect the change saved.
+        
+        If the class was obtained through get() or list(), or has already been saved, only the
+        fields modified since then are sent, and no request is sent at all if none was."""
         if url and ident and passwd:
             self._api = WimsAPI(url, ident, passwd, **kwargs)
         
@@ -210,22 +248,29 @@ class Class:
         payload = self._to_payload()
         
         if self._saved:
-            status, response = self._api.modclass(self.qclass, self.rclass, payload, verbose=True)
-            if not status:
-                raise AdmRawError(response['message'])
+            changes = modified(payload, self.__dict__.get('_persisted', {}))
+            if changes:
+                status, response = self._api.modclass(self.qclass, self.rclass, changes,
+                                                      verbose=True)
+                if not status:
+                    raise AdmRawError(response['message'])
         else:
             status, response = self._api.addclass(
                 self.rclass, payload, self.supervisor._to_payload(), self.qclass, verbose=True
             )
             if not status:
                 raise AdmRawError(response['message'])
+            self.invalidate()
             self._saved = True
             self.qclass = response['class_id']
             self.supervisor.quser = "supervisor"
             self.supervisor._saved = True
             self.supervisor._class = self
+        
+        self._persisted = payload
     
     
+    @traced
     def delete(self):
         """Delete the class from the WIMS server."""
         if not self._saved:
@@ -235,75 +280,232 @@ class Class:
         if not status:
             raise AdmRawError(response['message'])
         
+        self.invalidate()
         self._saved = False
         self._api = None
     
     
+    @traced
     def refresh(self):
-        """Refresh this instance of a WIMS class from the server itself."""
+        """Refresh this instance of a WIMS class from the server itself.
+        
+        The identity map of the class is cleared, items obtained afterward will be fetched
+        again. The class is fetched through its own WimsAPI, keeping its transport, hooks,
+        retry policy and rate limits."""
         if not self._saved:
             raise NotSavedError("Can't refresh unsaved class")
-        new = Class.get(self.url, self.ident, self.passwd, self.qclass, self.rclass)
+        api = self._api
+        new = Class._build(api, self.qclass, self.rclass,
+                           *Class._fetch(api, self.qclass, self.rclass))
         self.__class__ = new.__class__
         self.__dict__ = new.__dict__
+        self.supervisor._class = self
         
         return self
     
     
     @classmethod
+    @traced
     def get(cls, url, ident, passwd, qclass, rclass, **kwargs):
         """Return an instance of a WIMS class corresponding to the class 'qclass' on
-        the WIMS server pointed by 'url'."""
-        api = WimsAPI(url, ident, passwd, **kwargs)
-        
-        status, class_info = api.getclass(qclass, rclass, verbose=True)
-        if not status:
-            raise AdmRawError(class_info['message'])
-        
-        status, class_password = api.getclass(qclass, rclass, verbose=True)
-        if not status:
-            raise AdmRawError(class_password['message'])
+        the WIMS server pointed by 'url'.
         
-        status, supervisor_info = api.getuser(qclass, rclass, "supervisor", verbose=True)
-        if not status:
-            raise AdmRawError(supervisor_info['message'])
-        
-        status, password_info = api.getuser(qclass, rclass, "supervisor", ["password"],
-                                            verbose=True)
-        if not status:
-            raise AdmRawError(password_info['message'])
-        
-        supervisor_info['password'] = password_info['password']
-        supervisor = User("supervisor", **supervisor_info)
-        
-        class_info['supervisor'] = supervisor
+        The class (including its password) and its supervisor are fetched with two requests
+        sent concurrently."""
+        api = WimsAPI(url, ident, passwd, **kwargs)
+        return cls._build(api, qclass, rclass, *cls._fetch(api, qclass, rclass))
+    
+    
+    @staticmethod
+    def _results(responses):
+        """Return the dictionaries of responses, a list of results of WimsAPI.batch(), raising
+        the first exception or AdmRawError found."""
+        results = []
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+            status, result = response
+            if not status:
+                raise AdmRawError(result['message'])
+            results.append(result)
+        return results
+    
+    
+    @staticmethod
+    def _supervisor_call(qclass, rclass):
+        """Return the call given to WimsAPI.batch() to fetch the supervisor of a class."""
+        return ("getuser", {'qclass': qclass, 'rclass': rclass, 'quser': "supervisor",
+                            'options': USER_PROPERTIES, 'verbose': True})
+    
+    
+    @classmethod
+    def _fetch(cls, api, qclass, rclass):
+        """Return the properties of the class qclass and of its supervisor, fetched with two
+        requests sent concurrently."""
+        return cls._results(api.batch([
+            ("getclass", {'qclass': qclass, 'rclass': rclass, 'verbose': True}),
+            cls._supervisor_call(qclass, rclass),
+        ], max_workers=2))
+    
+    
+    @classmethod
+    def _build(cls, api, qclass, rclass, class_info, supervisor_info):
+        """Return an instance of a saved class from the properties of the class and of its
+        supervisor."""
+        class_info = dict(class_info)
+        class_info['supervisor'] = User("supervisor", **supervisor_info)
         class_info['name'] = class_info['description']
-        class_info['password'] = class_password['password']
         class_info['qclass'] = qclass
+        class_info['rclass'] = rclass
         c = cls(**class_info)
         c._api = api
         c._saved = True
         c.supervisor._saved = True
         c.supervisor._class = c
+        c._persisted = c._to_payload()
         return c
     
     
     @classmethod
-    def list(cls, url, ident, passwd, rclass, **kwargs):
+    def _stub(cls, api, qclass, rclass):
+        """Return a saved class only knowing its identifiers, loaded on first access to any
+        other attribute."""
+        c = cls.__new__(cls)
+        c._lazy = True
+        c._api = api
+        c._saved = True
+        c._items = dict()
+        c._exists = dict()
+        c.qclass = qclass
+        c.rclass = rclass
+        return c
+    
+    
+    @classmethod
+    @traced
+    def list(cls, url, ident, passwd, rclass, lazy=False, **kwargs):
         """Return all the instances of Class of the given WIMS server (url)
-        using ident and rclass."""
+        using ident and rclass.
+        
+        The properties of every class are sent back by listclasses, the supervisors are then
+        fetched concurrently. Classes whose properties were not sent by listclasses (older
+        servers) are fetched concurrently as well.
+        
+        If lazy is True, only the identifiers of the classes are fetched: each class is loaded
+        on first access to any other of its attributes."""
         api = WimsAPI(url, ident, passwd, **kwargs)
-        status, response = api.listclasses(rclass, verbose=True)
+        status, response = api.listclasses(rclass, PROPERTIES, verbose=True)
         if not status:
             if "there is no class allowed for this server" in response['message']:
                 return []
             raise AdmRawError(response['message'])  # pragma: no cover
         
-        qclasses = [c['qclass'] for c in response["classes_list"]]
+        entries = response["classes_list"]
+        if lazy:
+            return [cls._stub(api, entry['qclass'], rclass) for entry in entries]
+        
+        complete = [set(PROPERTIES) <= set(entry) for entry in entries]
+        results = cls._results(api.batch(
+            [cls._supervisor_call(entry['qclass'], rclass) for entry in entries]
+            + [("getclass", {'qclass': entry['qclass'], 'rclass': rclass, 'verbose': True})
+               for entry, c in zip(entries, complete) if not c]
+        ))
+        supervisors, fetched = results[:len(entries)], iter(results[len(entries):])
+        
+        return [
+            cls._build(api, entry['qclass'], rclass, entry if c else next(fetched), supervisor)
+            for entry, c, supervisor in zip(entries, complete, supervisors)
+        ]
+    
+    
+    def _cached(self, cls, identifier):
+        """Return the instance of cls identified by identifier in the identity map of this
+        class, None if there is none."""
+        return self._items.get((cls, str(identifier)))
+    
+    
+    def _remember(self, cls, identifier, item):
+        """Add item, the instance of cls identified by identifier, to the identity map of this
+        class, and return it. If the map already contains such an instance, it is returned
+        instead and item is discarded."""
+        return self._items.setdefault((cls, str(identifier)), item)
+    
+    
+    def invalidate(self, cls=None, identifier=None):
+        """Remove items from the identity map of this class, so that they are fetched again
+        the next time they are obtained.
+        
+        Remove every item if cls is None, every instance of cls if identifier is None, and
+        only the instance of cls identified by identifier otherwise. The existence cache (see
+        primeitems()) is cleared as well for every class of item in the first case, for cls in
+        the second."""
+        if cls is None:
+            self._items.clear()
+            self._exists.clear()
+        elif identifier is None:
+            for key in [k for k in self._items if k[0] is cls]:
+                del self._items[key]
+            self._exists.pop(cls, None)
+        else:
+            self._items.pop((cls, str(identifier)), None)
+    
+    
+    def _forget(self, cls, identifier):
+        """Record that the instance of cls identified by identifier has been deleted from this
+        class."""
+        item = self._items.pop((cls, str(identifier)), None)
+        if item is not None:
+            item._saved = False
+        self._record(cls, identifier, False)
+    
+    
+    def _prime(self, cls, identifiers):
+        """Record identifiers as the identifiers of every instance of cls in this class."""
+        self._exists[cls] = {str(identifier) for identifier in identifiers}
+    
+    
+    def _record(self, cls, identifier, exists):
+        """Record whether the instance of cls identified by identifier exists in this class,
+        if the existence cache of cls has been primed."""
+        known = self._exists.get(cls)
+        if known is None:
+            return
+        if exists:
+            known.add(str(identifier))
+        else:
+            known.discard(str(identifier))
+    
+    
+    @traced
+    def primeitems(self, cls):
+        """Fetch the identifiers of every instance of cls in this class with a single request
+        (e.g. listsheets for Sheet), so that checkitem(), and the save() of items not known to
+        exist yet, no longer send any request to check whether an instance of cls exists.
+        
+        Listing the items of cls (see listitem()) primes this cache as well. It is kept up to
+        date by the additions and deletions made through wimsapi, see invalidate() to clear
+        it."""
+        if not self._saved:
+            raise NotSavedError("Class must be saved before being able to prime its items")
+        self._prime(cls, cls._identifiers(self))
+    
+    
+    @traced
+    def loaditems(self, items):
+        """Load every lazy item of items (e.g. returned by listitem(cls, lazy=True) or part of
+        the scores of a sheet) with concurrent requests, and return items as a list.
         
-        return [cls.get(url, ident, passwd, qclass, rclass) for qclass in qclasses]
+        Items which are already loaded are left untouched, no request is sent if there is
+        none to load."""
+        items = list(items)
+        lazy = [item for item in items if item.__dict__.get('_lazy')]
+        responses = self._results(self._api.batch([item._load_call() for item in lazy]))
+        for item, response in zip(lazy, responses):
+            item._load(response)
+        return items
     
     
+    @traced
     def additem(self, item):
         """Add an item to the WIMS class.
         
@@ -317,6 +519,173 @@ class Class:
         item.save(self, check_exists=False)
     
     
+    @traced
+    def addusers(self, users, max_workers=None):
+        """Add every User of users to the WIMS class.
+        
+        The users are sent with a single putcsv request (login, password, names, email and
+        registration number). The users which putcsv cannot add as is, those having any other
+        property set (e.g. comments or regprop1), lacking a mandatory one, or whose quser
+        contains characters not accepted by WIMS, are added with concurrent adduser requests
+        instead, at most max_workers at a time (defaults to the pool_maxsize of the WimsAPI of
+        this class), their quser being adapted as by User.save().
+        
+        Since putcsv modifies the users which already exist in the class instead of failing,
+        the existence of the users is checked first, with a single request if the existence
+        cache of User has not been primed (see primeitems()). Users which already exist, or
+        whose quser appears earlier in users, are sent with adduser and fail as with
+        additem().
+        
+        Returns a list containing, for each user of users, either the user or the exception
+        raised while adding it."""
+        if not self._saved:
+            raise NotSavedError("Class must be saved before being able to add an item")
+        users = list(users)
+        for user in users:
+            if not isinstance(user, User):
+                raise InvalidItemTypeError(
+                    "Item of type %s cannot be added as an user." % str(type(user)))
+        
+        if User not in self._exists:
+            self.primeitems(User)
+        seen = set(self._exists[User])
+        results = list(users)
+        csv, single = [], []
+        for i, user in enumerate(users):
+            if user._csv_compatible() and str(user.quser) not in seen:
+                csv.append(i)
+            else:
+                single.append(i)
+            seen.add(str(user.quser))
+        
+        if csv:
+            rows = User.csv_rows([users[i] for i in csv], ROSTER_COLUMNS)
+            try:
+                self._results([self._api.putcsv(self.qclass, self.rclass, rows, verbose=True)])
+            except Exception as e:
+                for i in csv:
+                    results[i] = e
+            else:
+                for i in csv:
+                    users[i]._saved_in(self)
+        
+        responses = self._api.map("adduser", [
+            {'qclass': self.qclass, 'rclass': self.rclass, 'quser': users[i].quser,
+             'user_info': users[i]._to_payload(), 'verbose': True}
+            for i in single
+        ], max_workers)
+        for i, response in zip(single, responses):
+            try:
+                result, = self._results([response])
+            except Exception as e:
+                results[i] = e
+                continue
+            users[i].quser = result['user_id']
+            users[i]._saved_in(self)
+        
+        return results
+    
+    
+    @traced
+    def modusers(self, users, max_workers=None):
+        """Save the modifications of every User of users in the WIMS class.
+        
+        Only the fields modified since each user was obtained from, or last saved in, the class
+        are sent, and nothing is sent for unmodified users. Users whose modified fields can all
+        be sent through putcsv (password, names, email and registration number) are modified
+        with a single putcsv request for each distinct set of modified fields, the others with
+        concurrent moduser requests, at most max_workers at a time (defaults to the pool_maxsize
+        of the WimsAPI of this class).
+        
+        Returns a list containing, for each user of users, either the user or the exception
+        raised while modifying it."""
+        if not self._saved:
+            raise NotSavedError("Class must be saved before being able to modify an user")
+        users = list(users)
+        for user in users:
+            if not isinstance(user, User):
+                raise InvalidItemTypeError(
+                    "Item of type %s cannot be modified as an user." % str(type(user)))
+        
+        results = list(users)
+        csv, single = dict(), []
+        for i, user in enumerate(users):
+            changes = user._changes(self)
+            if not changes:
+                continue
+            columns = tuple(c for c in ROSTER_COLUMNS[1:] if c in changes)
+            if (user._known(self) and VALID_QUSER.fullmatch(str(user.quser))
+                    and len(columns) == len(changes) and all(changes.values())):
+                csv.setdefault(columns, []).append(i)
+            else:
+                single.append((i, changes))
+        
+        for columns, indexes in csv.items():
+            rows = User.csv_rows([users[i] for i in indexes], ('login',) + columns)
+            try:
+                self._results([self._api.putcsv(self.qclass, self.rclass, rows, verbose=True)])
+            except Exception as e:
+                for i in indexes:
+                    results[i] = e
+                continue
+            for i in indexes:
+                users[i]._saved_in(self)
+        
+        responses = self._api.map("moduser", [
+            {'qclass': self.qclass, 'rclass': self.rclass, 'quser': users[i].quser,
+             'user_info': changes, 'verbose': True}
+            for i, changes in single
+        ], max_workers)
+        for (i, _), response in zip(single, responses):
+            try:
+                self._results([response])
+            except Exception as e:
+                results[i] = e
+                continue
+            users[i]._saved_in(self)
+        
+        return results
+    
+    
+    @traced
+    def delusers(self, users, max_workers=None):
+        """Remove every user of users from the WIMS class.
+        
+        users can contain instances of User or identifiers (quser). Since putcsv cannot remove
+        users, they are removed with concurrent deluser requests, at most max_workers at a time
+        (defaults to the pool_maxsize of the WimsAPI of this class).
+        
+        Returns a list containing, for each user of users, either the user (or its quser) or
+        the exception raised while removing it."""
+        if not self._saved:
+            raise NotSavedError("Class must be saved before being able to remove an user")
+        users = list(users)
+        for user in users:
+            if not isinstance(user, (User, str)):
+                raise InvalidItemTypeError(
+                    "Item of type %s cannot be removed as an user." % str(type(user)))
+        
+        qusers = [user.quser if isinstance(user, User) else user for user in users]
+        responses = self._api.map("deluser", [
+            {'qclass': self.qclass, 'rclass': self.rclass, 'quser': quser, 'verbose': True}
+            for quser in qusers
+        ], max_workers)
+        
+        results = []
+        for user, quser, response in zip(users, qusers, responses):
+            try:
+                self._results([response])
+            except Exception as e:
+                results.append(e)
+                continue
+            self._forget(User, quser)
+            if isinstance(user, User):
+                user._saved = False
+            results.append(user)
+        return results
+    
+    
+    @traced
     def delitem(self, item, cls=None):
         """Remove an item from the WIMS class.
         
@@ -338,6 +707,7 @@ class Class:
         cls.remove(self, item)
     
     
+    @traced
     def checkitem(self, item, cls=None):
         """check if an item is in the WIMS class.
         
@@ -345,7 +715,9 @@ class Class:
         string. If item is a string, cls must be provided and be a
         subclass of ClassItemABC which correspond to the item.
         
-        E.G. for an user : checkitem(User(...)) or checkitem("quser", User)."""
+        E.G. for an user : checkitem(User(...)) or checkitem("quser", User).
+        
+        No request is sent if the existence cache of cls has been primed (see primeitems())."""
         test = ((not isinstance(item, str) and not issubclass(type(item), ClassItemABC))
                 or (cls is not None and not issubclass(cls, ClassItemABC)))
         if test:
@@ -357,9 +729,14 @@ class Class:
                                 "exists")
         
         cls = cls or type(item)
+        known = self._exists.get(cls)
+        if known is not None:
+            identifier = getattr(item, cls._id_attribute) if isinstance(item, cls) else item
+            return str(identifier) in known
         return cls.check(self, item)
     
     
+    @traced
     def getitem(self, identifier, cls):
         """Return the instance of cls corresponding to identifier in the WIMS
         class.
@@ -374,14 +751,16 @@ class Class:
         return cls.get(self, identifier)
     
     
-    def listitem(self, cls):
+    @traced
+    def listitem(self, cls, **kwargs):
         """Return all the instances of cls in, this WIMS class.
         
-        cls must be a subclass of ClassItemABC"""
+        cls must be a subclass of ClassItemABC. kwargs are given to cls.list() (e.g. lazy=True
+        for Sheet and Exam)."""
         if not issubclass(cls, ClassItemABC):
             raise InvalidItemTypeError(
                 "Cannot list element of type %s from a WIMS class" % str(cls))
         if not self._saved:
             raise NotSavedError("Class must be saved  before being able to list items")
         
-        return cls.list(self)
+        return cls.list(self, **kwargs)